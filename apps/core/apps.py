@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from apps.core.metrics import install_query_instrumentation
+
+        # Cuenta consultas y tiempo SQL por petición en todas las conexiones
+        connection_created.connect(install_query_instrumentation, dispatch_uid='core_query_metrics')
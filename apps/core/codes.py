@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+
+# Alfabeto sin caracteres ambiguos (0/O, 1/I/L) ni U
+ALPHABET = '23456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_LENGTH = 8
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+# Red de Feistel balanceada sobre 40 bits (2**40 > CODE_SPACE)
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+# Los códigos antiguos eran hexadecimal en minúsculas
+LEGACY_DIGITS = frozenset('0123456789abcdef')
+
+
+def _round_keys():
+    seed = hashlib.sha256(f'access-code:{settings.SECRET_KEY}'.encode()).digest()
+    return [int.from_bytes(seed[index * 4:index * 4 + 4], 'big') for index in range(ROUNDS)]
+
+
+def _feistel(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in keys:
+        digest = hashlib.blake2b(right.to_bytes(4, 'big'), digest_size=4,
+                                 key=key.to_bytes(4, 'big')).digest()
+        left, right = right, left ^ (int.from_bytes(digest, 'big') & HALF_MASK)
+    return (left << HALF_BITS) | right
+
+
+def permute(value, keys):
+    """
+    Biyección de [0, CODE_SPACE) en sí mismo: Feistel con cycle-walking.
+    Dos contadores distintos producen siempre códigos distintos, pero
+    consecutivos no se parecen entre sí.
+    """
+    value = _feistel(value, keys)
+    while value >= CODE_SPACE:
+        value = _feistel(value, keys)
+    return value
+
+
+def encode(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def normalize_code(code):
+    """Normaliza lo que teclea un invitado (mayúsculas, sin espacios ni guiones)"""
+    return (code or '').strip().replace('-', '').replace(' ', '').upper()
+
+
+class AccessCodeAllocator:
+    """
+    Asigna códigos de acceso únicos sin reintentos.
+    Cada proceso reserva un bloque de contadores de la secuencia en la base
+    de datos (una sola consulta por bloque) y los convierte en códigos con
+    una permutación, así que la unicidad no depende de la suerte.
+    """
+    sequence_name = 'access_code'
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = None
+        self._keys = None
+
+    def _reserve_block(self):
+        from apps.core.models import Sequence
+
+        size = self.block_size or getattr(settings, 'ACCESS_CODE_BLOCK_SIZE', 100)
+        end = Sequence.reserve(self.sequence_name, size)
+        if end > CODE_SPACE:
+            raise RuntimeError("Se ha agotado el espacio de códigos de acceso")
+        self._next, self._end = end - size, end
+
+    def allocate(self):
+        with self._lock:
+            # Un proceso hijo no puede reutilizar el bloque heredado del padre
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            if self._keys is None:
+                self._keys = _round_keys()
+            while True:
+                if self._next >= self._end:
+                    self._reserve_block()
+                value = self._next
+                self._next += 1
+                code = encode(permute(value, self._keys))
+                if not self._legacy_exists(code):
+                    return code
+
+    @staticmethod
+    def _legacy_exists(code):
+        # El resolvedor acepta también la forma en minúsculas de lo que se
+        # teclea, así que un código cuya forma en minúsculas es hexadecimal
+        # válido (sólo dígitos y A-F) podría chocar con uno antiguo. Es poco
+        # frecuente y sólo entonces se consulta
+        from apps.custom_sessions.models import PhotoSession
+
+        legacy = code.lower()
+        if not LEGACY_DIGITS.issuperset(legacy):
+            return False
+        return PhotoSession.objects.filter(access_code=legacy).exists()
+
+
+access_codes = AccessCodeAllocator()
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, *version):
+    """
+    ETag a partir de una versión barata de consultar (fechas, contadores...)
+    y de la representación pedida (ruta con query string y Accept), para que
+    ?fields= o ?size= distintos no compartan validador.
+    """
+    key = repr((version, request.get_full_path(), request.META.get('HTTP_ACCEPT', '')))
+    return quote_etag(hashlib.blake2b(key.encode(), digest_size=12).hexdigest())
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """Respuesta 304 si el cliente ya tiene esta versión; None en otro caso"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Añade ETag y Last-Modified a una respuesta completa"""
+    if etag:
+        response.headers.setdefault('ETag', etag)
+    if last_modified:
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+    return response
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+def session_channel(session_id):
+    return f'session:{session_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class InProcessBroker:
+    """
+    Broker de eventos en memoria para un único proceso ASGI.
+    publish() se puede llamar desde código síncrono (vistas, señales) en
+    cualquier hilo; cada suscriptor recibe los eventos en una cola acotada
+    de su propio event loop. Si un cliente no consume, se descartan eventos.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                pass  # el loop del suscriptor ya se cerró
+
+    @staticmethod
+    def _deliver(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        """Context manager asíncrono que devuelve una cola con los eventos de los canales"""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                for channel in channels:
+                    subscribers = self._subscribers.get(channel)
+                    if subscribers:
+                        subscribers.discard(entry)
+                        if not subscribers:
+                            del self._subscribers[channel]
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Broker para varios workers: los eventos se publican en Redis (o en un
+    servidor local compatible) y cada proceso los reparte a sus suscriptores
+    en memoria. Requiere el paquete opcional 'redis'.
+    """
+
+    def __init__(self, url=None, queue_size=100):
+        super().__init__(queue_size)
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroker necesita el paquete 'redis'")
+        self.url = url or getattr(settings, 'EVENT_BROKER_URL', 'redis://localhost:6379/0')
+        self._client = redis.Redis.from_url(self.url)
+        self._async_redis = redis.asyncio
+
+    def publish(self, channel, event):
+        self._client.publish(channel, json.dumps(event, cls=DjangoJSONEncoder))
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        client = self._async_redis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(*channels)
+        queue = asyncio.Queue(self.queue_size)
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    self._deliver(queue, json.loads(message['data']))
+
+        task = asyncio.create_task(pump())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe(*channels)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Devuelve el broker configurado en EVENT_BROKER (en memoria por defecto)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'EVENT_BROKER', 'apps.core.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_event(event_type, data, session_id=None, user_id=None):
+    """
+    Publica un evento en los canales de la sesión y del usuario una vez
+    confirmada la transacción, para no anunciar cambios que se deshacen.
+    """
+    event = {'type': event_type, 'data': data}
+    channels = []
+    if session_id:
+        channels.append(session_channel(session_id))
+    if user_id:
+        channels.append(user_channel(user_id))
+
+    def send():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, event)
+
+    if channels:
+        transaction.on_commit(send, robust=True)
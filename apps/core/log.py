@@ -0,0 +1,155 @@
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import traceback
+from logging.handlers import QueueListener, RotatingFileHandler
+
+# Atributos propios de LogRecord: el resto son campos de `extra`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+# Sólo se escriben los `extra` con tipos nativos de JSON: un objeto convertido
+# con str() puede arrastrar datos sensibles (la URL completa de una petición)
+JSON_TYPES = (str, int, float, bool, type(None))
+
+# Directorio apps/ del proyecto, para localizar el origen de una consulta
+APPS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+INSTRUMENTATION_FILES = tuple(
+    os.path.join(APPS_DIR, 'core', name) for name in ('log.py', 'metrics.py', 'middleware.py')
+)
+
+slow_request_logger = logging.getLogger('apps.core.slow_requests')
+slow_query_logger = logging.getLogger('apps.core.slow_queries')
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con los campos habituales y los de `extra`"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.thread,
+        }
+        for key, value in vars(record).items():
+            if key in RECORD_ATTRIBUTES or key.startswith('_'):
+                continue
+            if key == 'request':
+                # django.request adjunta la petición: método y ruta, sin la
+                # query string, que puede llevar credenciales (?token=)
+                if hasattr(value, 'method') and hasattr(value, 'path'):
+                    entry.setdefault('method', value.method)
+                    entry.setdefault('path', value.path)
+            elif isinstance(value, JSON_TYPES):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class QueueFileHandler(logging.Handler):
+    """
+    Escribe en un fichero rotado por tamaño desde un hilo propio: el hilo
+    de la petición sólo formatea el registro y lo encola. Si la cola está
+    llena (disco atascado) el registro se descarta y se cuenta en `dropped`
+    en vez de bloquear la respuesta.
+    Es un Handler normal con su propia cola y no una subclase de
+    QueueHandler: desde Python 3.12 dictConfig configura esas subclases
+    como handlers de cola y exige la clave 'handlers'.
+    """
+
+    def __init__(self, filename, maxBytes=10 * 1024 * 1024, backupCount=5, queue_size=10000):
+        super().__init__()
+        self.queue = queue.Queue(queue_size)
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self.target = RotatingFileHandler(filename, maxBytes=maxBytes, backupCount=backupCount,
+                                          encoding='utf-8', delay=True)
+        # El registro llega ya formateado por prepare()
+        self.target.setFormatter(logging.Formatter('%(message)s'))
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        # Un hilo por proceso: tras un fork (gunicorn --preload) se arranca otro
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._listener = QueueListener(self.queue, self.target)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Como QueueHandler.prepare: el mensaje se formatea aquí y el registro
+        # viaja sin argumentos ni traceback, que podrían no ser serializables
+        message = self.format(record)
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = record.exc_info = record.exc_text = record.stack_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() cierra los handlers al salir: vacía la cola antes
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = self._pid = None
+        self.target.close()
+        super().close()
+
+
+def call_site():
+    """
+    Primer marco de la pila que pertenece al proyecto (fuera de Django y
+    librerías). En vistas asíncronas el ORM corre en otro hilo y la pila no
+    llega a la corrutina: queda None y el campo `path` identifica la petición.
+    """
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename.startswith(APPS_DIR) and not frame.filename.startswith(INSTRUMENTATION_FILES):
+            return f'apps/{frame.filename[len(APPS_DIR):]}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def log_slow_query(sql, duration, path=None):
+    slow_query_logger.warning('slow query', extra={
+        'duration_ms': round(duration * 1000, 2),
+        'sql': sql,
+        'call_site': call_site(),
+        'path': path,
+    })
+
+
+def log_slow_request(request, view, status, duration, stats):
+    slow_request_logger.warning('slow request', extra={
+        'view': view,
+        'method': request.method,
+        # Sin query string: puede llevar credenciales (?token= de los streams)
+        'path': request.path,
+        'status': status,
+        'duration_ms': round(duration * 1000, 2),
+        'queries': stats.queries,
+        'db_ms': round(stats.db_time * 1000, 2),
+        'cache_hits': stats.cache_hits,
+        'cache_misses': stats.cache_misses,
+    })
@@ -0,0 +1,141 @@
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from apps.core.perf import ENDPOINTS, generate_fixture, measure, query_growth
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide consultas y latencia de cada endpoint frente a su presupuesto con "
+        "datos generados de varios tamaños, y compara con un informe anterior"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, action='append',
+                            help="Sesiones del usuario de prueba (repetible; por defecto 10 y 200)")
+        parser.add_argument('--repeat', type=int, default=20, help="Peticiones medidas por endpoint")
+        parser.add_argument('--endpoint', action='append', help="Medir sólo estos endpoints")
+        parser.add_argument('--output', help="Guarda el informe en JSON")
+        parser.add_argument('--baseline', help="Informe JSON de otro commit con el que comparar")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Aumento de p50 respecto al baseline que se considera regresión")
+        parser.add_argument('--no-latency', action='store_true',
+                            help="No aplicar los presupuestos de latencia (máquinas lentas o compartidas)")
+
+    def handle(self, *args, **options):
+        scales = sorted(set(options['scale'] or [10, 200]))
+        endpoints = [endpoint for endpoint in ENDPOINTS
+                     if not options['endpoint'] or endpoint.name in options['endpoint']]
+        if not endpoints:
+            raise CommandError("Ningún endpoint coincide con --endpoint")
+
+        runs = self.run(scales, endpoints, options['repeat'])
+
+        problems = []
+        for endpoint in endpoints:
+            for scale in scales:
+                problems += runs[scale][endpoint.name].violations(
+                    endpoint.status, latency=not options['no_latency']
+                )
+        problems += [f'{problem} (crece con los datos)' for problem in query_growth(runs)]
+
+        report = {
+            'revision': git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'repeat': options['repeat'],
+            'scales': {
+                str(scale): {name: measurement.as_dict() for name, measurement in runs[scale].items()}
+                for scale in scales
+            },
+        }
+        self.print_report(report, scales, endpoints)
+        if options['baseline']:
+            problems += self.compare(report, options['baseline'], options['tolerance'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, indent=2)
+
+        if problems:
+            for problem in problems:
+                self.stderr.write(self.style.ERROR(problem))
+            raise CommandError(f"{len(problems)} presupuestos superados")
+        self.stdout.write(self.style.SUCCESS("Todos los endpoints dentro de presupuesto"))
+
+    @staticmethod
+    def run(scales, endpoints, repeat):
+        """
+        Cada escala se mide dentro de una transacción que se deshace al final:
+        no deja datos, y las tareas en on_commit (derivados, eventos) no
+        se ejecutan ni se cuelan en el recuento de consultas.
+        """
+        media = tempfile.mkdtemp(prefix='perf-media-')
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                              'LOCATION': 'perf-report'}}
+        runs = {}
+        try:
+            with override_settings(MEDIA_ROOT=media, CACHES=caches, ALLOWED_HOSTS=['testserver']):
+                for scale in scales:
+                    with transaction.atomic():
+                        fixture = generate_fixture(scale)
+                        runs[scale] = {endpoint.name: measure(endpoint, fixture, repeat)
+                                       for endpoint in endpoints}
+                        transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media, ignore_errors=True)
+        return runs
+
+    def print_report(self, report, scales, endpoints):
+        self.stdout.write(f"Revisión {report['revision'] or '-'}, {report['repeat']} peticiones por endpoint")
+        self.stdout.write(f"{'endpoint':<24}{'escala':>8}{'HTTP':>6}{'consultas':>11}{'p50 ms':>10}{'p95 ms':>10}")
+        for endpoint in endpoints:
+            for scale in scales:
+                result = report['scales'][str(scale)][endpoint.name]
+                self.stdout.write(
+                    f"{endpoint.name:<24}{scale:>8}{result['status']:>6}"
+                    f"{result['queries']:>5}/{result['budget_queries']:<5}"
+                    f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                )
+
+    def compare(self, report, path, tolerance):
+        """Compara con otro informe: más consultas o p50 por encima de la tolerancia es regresión"""
+        try:
+            with open(path, encoding='utf-8') as stream:
+                baseline = json.load(stream)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer el baseline: {e}")
+
+        self.stdout.write(f"Comparación con {baseline.get('revision') or path}:")
+        problems = []
+        for scale, results in report['scales'].items():
+            for name, result in results.items():
+                previous = baseline.get('scales', {}).get(scale, {}).get(name)
+                if previous is None:
+                    continue
+                change = result['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0
+                self.stdout.write(
+                    f"  {name:<24}{scale:>8}  consultas {previous['queries']} -> {result['queries']}, "
+                    f"p50 {previous['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms ({change:+.0%})"
+                )
+                if result['queries'] > previous['queries']:
+                    problems.append(f"{name} (escala {scale}): {previous['queries']} -> "
+                                    f"{result['queries']} consultas respecto al baseline")
+                if change > tolerance:
+                    problems.append(f"{name} (escala {scale}): p50 {change:+.0%} respecto al baseline")
+        return problems
@@ -0,0 +1,195 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from apps.core.log import log_slow_query
+
+# Límites por defecto de los histogramas (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+@dataclass
+class RequestStats:
+    """Contadores de la petición en curso, compartidos con los hilos de sync_to_async"""
+    queries: int = 0
+    db_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    path: str = None
+
+
+def current_stats():
+    return _request_stats.get()
+
+
+def start_request(path=None):
+    """Abre los contadores de una petición; devuelve el token para end_request"""
+    stats = RequestStats(path=path)
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def instrument_queries(execute, sql, params, many, context):
+    """
+    execute_wrapper permanente de cada conexión: cuenta la consulta en la
+    petición en curso y registra en el log de SQL lento las que superan
+    SLOW_QUERY_THRESHOLD (segundos), también fuera de peticiones.
+    """
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+        threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+        if threshold is not None and elapsed >= threshold:
+            log_slow_query(sql, elapsed, stats.path if stats else None)
+
+
+def install_query_instrumentation(sender, connection, **kwargs):
+    """Receptor de connection_created: añade el wrapper una sola vez por conexión"""
+    if instrument_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_queries)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help_text, self.labels = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(counts), count, total)) for labels, (counts, count, total) in self._values.items()]
+        for label_values, (counts, count, total) in items:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket
+                yield f'{self.name}_bucket', {**labels, 'le': bound}, cumulative
+            yield f'{self.name}_count', labels, count
+            yield f'{self.name}_sum', labels, total
+
+
+class Registry:
+    """
+    Métricas del proceso en formato de texto de Prometheus. Cada worker
+    tiene las suyas: en despliegues con varios procesos se raspa cada uno.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            kind = 'histogram' if isinstance(metric, Histogram) else 'counter'
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {kind}')
+            for name, labels, value in metric.samples():
+                label_text = ','.join(f'{key}="{_escape(value_)}"' for key, value_ in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'lovesnap_http_requests_total', 'Peticiones HTTP atendidas', ('view', 'method', 'status'))
+http_latency = registry.histogram(
+    'lovesnap_http_request_duration_seconds', 'Latencia de las peticiones HTTP', ('view', 'method'))
+http_db_queries = registry.histogram(
+    'lovesnap_http_db_queries', 'Consultas SQL por petición', ('view',), QUERY_BUCKETS)
+http_db_time = registry.histogram(
+    'lovesnap_http_db_duration_seconds', 'Tiempo en la base de datos por petición', ('view',))
+http_response_bytes = registry.counter(
+    'lovesnap_http_response_bytes_total', 'Bytes enviados en las respuestas', ('view',))
+cache_requests = registry.counter(
+    'lovesnap_cache_requests_total', 'Consultas a las cachés de la aplicación', ('cache', 'result'))
+
+
+def record_cache(cache_name, hit):
+    """Cuenta un acierto o fallo de caché, global y en la petición en curso"""
+    cache_requests.inc(cache_name, 'hit' if hit else 'miss')
+    stats = _request_stats.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def record_request(view, method, status, duration, stats, response_bytes):
+    http_requests.inc(view, method, str(status))
+    http_latency.observe(duration, view, method)
+    http_db_queries.observe(stats.queries, view)
+    http_db_time.observe(stats.db_time, view)
+    if response_bytes:
+        http_response_bytes.inc(view, amount=response_bytes)
+
+
+def server_timing(duration, stats):
+    """Valor de la cabecera Server-Timing de una petición"""
+    return (
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+        f'cache;desc="{stats.cache_hits} hits {stats.cache_misses} misses", '
+        f'total;dur={duration * 1000:.1f}'
+    )
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from apps.core import metrics
+from apps.core.log import log_slow_request
+
+
+class MetricsMiddleware:
+    """
+    Instrumenta cada petición: vista, latencia, consultas SQL y su tiempo,
+    aciertos y fallos de caché y bytes enviados. Añade Server-Timing a la
+    respuesta, agrega los valores en apps.core.metrics para /metrics y
+    registra las peticiones que superan SLOW_REQUEST_THRESHOLD.
+    Funciona igual con vistas síncronas y asíncronas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not metrics.metrics_enabled():
+            return self.get_response(request)
+        stats, token = metrics.start_request(request.path)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics.metrics_enabled():
+            return await self.get_response(request)
+        stats, token = metrics.start_request(request.path)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        self.finish(request, response, stats, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def finish(request, response, stats, duration):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        if response.streaming:
+            # Descargas y SSE: sólo se conoce el tamaño si viene en la cabecera
+            response_bytes = int(response.headers.get('Content-Length') or 0)
+        else:
+            response_bytes = len(response.content)
+        metrics.record_request(view, request.method, response.status_code, duration, stats, response_bytes)
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', None)
+        if threshold is not None and duration >= threshold:
+            log_slow_request(request, view, response.status_code, duration, stats)
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response.headers['Server-Timing'] = metrics.server_timing(duration, stats)
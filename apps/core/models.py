@@ -1,3 +1,27 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+
+class Sequence(models.Model):
+    """Secuencia con nombre de la que los procesos reservan bloques de valores"""
+    name = models.CharField(_('nombre'), max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField(_('siguiente valor'), default=0)
+
+    class Meta:
+        verbose_name = _('secuencia')
+        verbose_name_plural = _('secuencias')
+
+    def __str__(self):
+        return f"{self.name} ({self.next_value})"
+
+    @classmethod
+    def reserve(cls, name, size=1):
+        """
+        Reserva `size` valores consecutivos de la secuencia con un UPDATE
+        atómico y devuelve el final del bloque (exclusivo).
+        """
+        with transaction.atomic():
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(next_value=F('next_value') + size)
+            return cls.objects.values_list('next_value', flat=True).get(name=name)
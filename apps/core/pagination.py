@@ -0,0 +1,81 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def max_page_size():
+    return getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+
+class DateCursorPagination(CursorPagination):
+    """
+    Paginación por cursor (keyset) sobre una fecha indexada: cada página es
+    un WHERE fecha < cursor ORDER BY fecha LIMIT n, sin COUNT(*) ni OFFSET,
+    así que la página mil cuesta lo mismo que la primera.
+    """
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return max_page_size()
+
+
+class UserCursorPagination(DateCursorPagination):
+    ordering = '-date_joined'
+
+
+class SmallPageNumberPagination(PageNumberPagination):
+    """
+    Paginación por número de página sólo para conjuntos pequeños: el
+    desplazamiento máximo está acotado por OFFSET_PAGINATION_MAX_ROWS.
+    Para recorrer listados grandes se usan las paginaciones por cursor.
+    """
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return max_page_size()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        try:
+            page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            page_number = 1
+        if page_size and (page_number - 1) * page_size >= getattr(settings, 'OFFSET_PAGINATION_MAX_ROWS', 1000):
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='use cursor pagination for large result sets'
+            ))
+        return super().paginate_queryset(queryset, request, view)
+
+
+def encode_keyset(value, pk):
+    """Cursor opaco (fecha ISO y pk) para paginar por keyset fuera de DRF"""
+    return base64.urlsafe_b64encode(f'{value.isoformat()}|{pk}'.encode()).decode()
+
+
+def filter_keyset(queryset, cursor, field='created_at'):
+    """
+    Aplica un cursor de encode_keyset a un queryset ordenado por -field, -pk.
+    Un cursor inválido se ignora y devuelve la primera página.
+    """
+    if not cursor:
+        return queryset
+    try:
+        value, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return queryset
+    try:
+        value = parse_datetime(value)
+        pk = queryset.model._meta.pk.to_python(pk)
+    except (ValueError, ValidationError):
+        return queryset
+    if value is None:
+        return queryset
+    return queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
@@ -0,0 +1,245 @@
+import io
+import json
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from apps.core.utils import generate_access_code
+from apps.custom_sessions.models import PhotoSession, SessionSettings
+from apps.photo.models import CompositePhoto, IndividualPhoto
+from apps.security.models import User
+
+PERF_PREFIX = 'perf-'
+PERF_PASSWORD = 'perf-Password-2024'
+PHOTOS_PER_SESSION = 4
+
+
+@dataclass
+class PerfFixture:
+    """Datos generados para medir: un usuario principal con `scale` sesiones"""
+    user: User
+    token: str
+    session: PhotoSession
+    photo: IndividualPhoto
+    scale: int
+    counter: int = 0
+    clients: dict = field(default_factory=dict)
+
+    def unique(self, label):
+        self.counter += 1
+        return f'{PERF_PREFIX}{label}-{uuid.uuid4().hex[:8]}-{self.counter}'
+
+    @property
+    def token_client(self):
+        if 'token' not in self.clients:
+            self.clients['token'] = Client(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return self.clients['token']
+
+    @property
+    def session_client(self):
+        """Cliente con sesión de navegador (el login no entra en la medida)"""
+        if 'session' not in self.clients:
+            self.clients['session'] = Client()
+            self.clients['session'].force_login(self.user)
+        return self.clients['session']
+
+
+def generate_fixture(scale):
+    """
+    Crea un usuario con `scale` sesiones (cada una con sus fotos y su
+    compuesta) y `scale` usuarios más, con bulk_create. Las medidas con
+    escalas distintas deben dar el mismo número de consultas.
+    """
+    user = User.objects.create_user(f'{PERF_PREFIX}user-{uuid.uuid4().hex[:8]}',
+                                    f'{PERF_PREFIX}{uuid.uuid4().hex[:8]}@example.com', PERF_PASSWORD)
+    token = Token.objects.create(user=user)
+    guests = [f'{PERF_PREFIX}guest-{uuid.uuid4().hex[:12]}' for _ in range(scale)]
+    User.objects.bulk_create([
+        User(username=name, email=f'{name}@example.com', password='!') for name in guests
+    ])
+    sessions = PhotoSession.objects.bulk_create([
+        PhotoSession(user=user, title=f'Perf {index}', access_code=generate_access_code(),
+                     status=PhotoSession.STATUS_COMPLETED)
+        for index in range(scale)
+    ])
+    photos = IndividualPhoto.objects.bulk_create([
+        IndividualPhoto(session=session, order=order, file_size=1000, width=8, height=8,
+                        image=f'sessions/{session.pk}/photos/{order}.jpg')
+        for session in sessions
+        for order in range(PHOTOS_PER_SESSION)
+    ])
+    CompositePhoto.objects.bulk_create([
+        CompositePhoto(session=session, file_size=4000, image=f'sessions/{session.pk}/composite.jpg')
+        for session in sessions
+    ])
+    User.objects.filter(pk=user.pk).update(sessions_created=scale, completed_sessions=scale,
+                                           storage_used=scale * 8000)
+    user.refresh_from_db()
+    return PerfFixture(user=user, token=token.key, session=sessions[0], photo=photos[0], scale=scale)
+
+
+def jpeg(name='photo.jpg', size=64):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), (200, 120, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """
+    Escenario medido con su presupuesto de consultas y de latencia (p50).
+    `prepare` corre fuera de la medida y devuelve los argumentos de `call`.
+    """
+    name: str
+    call: object
+    queries: int
+    latency_ms: float
+    status: int = 200
+    prepare: object = None
+
+
+def _new_login(fixture):
+    name = fixture.unique('logout')
+    user = User.objects.create_user(name, f'{name}@example.com', PERF_PASSWORD)
+    return {'token': Token.objects.create(user=user).key}
+
+
+def _new_capture_session(fixture):
+    session = PhotoSession.objects.create(user=fixture.user, title=fixture.unique('capture'))
+    SessionSettings.objects.create(session=session, num_photos=2)
+    return {'session': session, 'photos': [jpeg('1.jpg'), jpeg('2.jpg')]}
+
+
+def _json(client, method, path, data):
+    return getattr(client, method)(path, json.dumps(data), content_type='application/json')
+
+
+ENDPOINTS = [
+    Endpoint(
+        'auth.register', queries=9, latency_ms=500, status=201,
+        call=lambda fixture, **kw: _json(Client(), 'post', '/security/users/register/', {
+            'username': (name := fixture.unique('register')), 'email': f'{name}@example.com',
+            'password': PERF_PASSWORD, 'confirm_password': PERF_PASSWORD,
+        }),
+    ),
+    Endpoint(
+        'auth.login', queries=2, latency_ms=500,
+        call=lambda fixture, **kw: _json(Client(), 'post', '/security/users/login/', {
+            'login': fixture.user.username, 'password': PERF_PASSWORD,
+        }),
+    ),
+    Endpoint(
+        'auth.logout', queries=3, latency_ms=50, prepare=_new_login,
+        call=lambda fixture, token: Client(HTTP_AUTHORIZATION=f'Token {token}').post('/security/users/logout/'),
+    ),
+    Endpoint(
+        'profile.me', queries=2, latency_ms=50,
+        call=lambda fixture, **kw: fixture.token_client.get('/security/profile/me/'),
+    ),
+    # Mismos datos que home_view, servidos en JSON (la plantilla HTML no forma parte del API)
+    Endpoint(
+        'home.dashboard', queries=4, latency_ms=100,
+        call=lambda fixture, **kw: fixture.session_client.get('/photo/async/dashboard/'),
+    ),
+    Endpoint(
+        'sessions.list', queries=3, latency_ms=50,
+        call=lambda fixture, **kw: fixture.session_client.get('/sessions/async/'),
+    ),
+    Endpoint(
+        'sessions.detail', queries=6, latency_ms=50,
+        call=lambda fixture, **kw: fixture.session_client.get(f'/sessions/async/{fixture.session.pk}/'),
+    ),
+    Endpoint(
+        'sessions.access_code', queries=1, latency_ms=20,
+        call=lambda fixture, **kw: Client().get(f'/sessions/code/{fixture.session.access_code}/'),
+    ),
+    # Incluye el bloqueo de la sesión, el recuento repetido y las tres consultas
+    # por conjuntos de los blobs (alta, bloqueo e incremento) dentro de la
+    # transacción; no crecen con el número de fotos
+    Endpoint(
+        'photo.capture', queries=15, latency_ms=200, status=201, prepare=_new_capture_session,
+        call=lambda fixture, session, photos: fixture.token_client.post(
+            f'/photo/sessions/{session.pk}/capture/', {'photos': photos}
+        ),
+    ),
+]
+
+
+@dataclass
+class Measurement:
+    name: str
+    status: int
+    queries: int
+    samples: list = field(default_factory=list)
+    budget_queries: int = 0
+    budget_ms: float = 0
+
+    @property
+    def p50_ms(self):
+        return statistics.median(self.samples) * 1000
+
+    @property
+    def p95_ms(self):
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000
+
+    def violations(self, expected_status, latency=True):
+        problems = []
+        if self.status != expected_status:
+            problems.append(f'{self.name}: HTTP {self.status} (esperado {expected_status})')
+        if self.queries > self.budget_queries:
+            problems.append(f'{self.name}: {self.queries} consultas (presupuesto {self.budget_queries})')
+        if latency and self.p50_ms > self.budget_ms:
+            problems.append(f'{self.name}: p50 {self.p50_ms:.1f} ms (presupuesto {self.budget_ms:.0f} ms)')
+        return problems
+
+    def as_dict(self):
+        return {
+            'status': self.status, 'queries': self.queries,
+            'p50_ms': round(self.p50_ms, 2), 'p95_ms': round(self.p95_ms, 2),
+            'budget_queries': self.budget_queries, 'budget_ms': self.budget_ms,
+        }
+
+
+def measure(endpoint, fixture, repeat=5):
+    """
+    Ejecuta el escenario una vez para calentar cachés y luego `repeat` veces
+    midiendo latencia; las consultas se cuentan en la última ejecución.
+    """
+    endpoint.call(fixture, **(endpoint.prepare(fixture) if endpoint.prepare else {}))
+    measurement = Measurement(endpoint.name, 0, 0, budget_queries=endpoint.queries,
+                              budget_ms=endpoint.latency_ms)
+    for _ in range(max(repeat, 1)):
+        kwargs = endpoint.prepare(fixture) if endpoint.prepare else {}
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = endpoint.call(fixture, **kwargs)
+            measurement.samples.append(time.perf_counter() - started)
+        measurement.status = response.status_code
+        measurement.queries = len(queries)
+    return measurement
+
+
+def query_growth(runs):
+    """
+    Escenarios cuyo número de consultas cambia con el volumen de datos.
+    `runs` es {escala: {nombre: Measurement}}.
+    """
+    scales = sorted(runs)
+    grown = []
+    for name in runs[scales[0]]:
+        counts = [runs[scale][name].queries for scale in scales]
+        if len(set(counts)) > 1:
+            grown.append(f'{name}: ' + ', '.join(
+                f'{count} consultas con escala {scale}' for scale, count in zip(scales, counts)
+            ))
+    return grown
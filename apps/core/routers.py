@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def read_replica():
+    """
+    Las lecturas dentro del bloque van a la réplica si hay una configurada.
+    Sólo para consultas que toleran unos segundos de retraso y cuyo
+    resultado no se guarda en la caché compartida, que lo serviría viejo a
+    todos los workers; funciona igual en vistas síncronas y asíncronas.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_alias():
+    """Alias de la réplica, o None si no está configurada"""
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+class ReplicaRouter:
+    """
+    Envía a la réplica las lecturas marcadas con read_replica(). Todo lo
+    demás (escrituras, lecturas normales y cualquier lectura dentro de una
+    transacción, que debe ver sus propios cambios) va a 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return None
+        alias = replica_alias()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica y primaria contienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Permite migrar una réplica local (SQLite) para pruebas
+        return None
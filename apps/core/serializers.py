@@ -0,0 +1,33 @@
+from rest_framework import serializers
+
+
+class SparseFieldsMixin:
+    """
+    Permite pedir sólo algunos campos con ?fields=id,username en peticiones
+    de lectura. Los campos no pedidos se eliminan antes de serializar, así
+    que sus SerializerMethodField no llegan a calcularse. Sólo se aplica al
+    serializer raíz (o al hijo de una lista raíz), no a los anidados.
+    """
+    fields_query_param = 'fields'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.requested_fields(fields)
+        if requested:
+            for name in set(fields) - requested:
+                del fields[name]
+        return fields
+
+    def requested_fields(self, fields):
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        parent = self.parent
+        if parent is not None and not (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return None
+        value = request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        # Los nombres desconocidos se ignoran; si no queda ninguno, se devuelven todos
+        requested = {name.strip() for name in value.split(',')} & set(fields)
+        return requested or None
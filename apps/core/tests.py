@@ -1,3 +1,298 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import logging.config
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from apps.core.cache import TwoLevelCache
+from apps.core.events import InProcessBroker, publish_event, session_channel, user_channel
+from apps.core.codes import ALPHABET, CODE_LENGTH, CODE_SPACE, AccessCodeAllocator, _round_keys, encode, permute
+from apps.core.log import JsonFormatter, QueueFileHandler
+from apps.core.perf import ENDPOINTS, generate_fixture, measure, query_growth
+from apps.core.routers import ReplicaRouter, read_replica
+from apps.custom_sessions.models import PhotoSession
+from apps.security.models import User
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """Sólo las lecturas marcadas, y fuera de transacciones, van a la réplica"""
+
+    router = ReplicaRouter()
+
+    def replica_settings(self):
+        # Cualquier alias configurado sirve de réplica para el enrutado
+        return override_settings(DATABASE_REPLICA_ALIAS='default')
+
+    @override_settings(DATABASE_REPLICA_ALIAS='replica')
+    def test_without_replica_everything_uses_default(self):
+        with read_replica():
+            self.assertIsNone(self.router.db_for_read(User))
+            self.assertEqual(self.router.db_for_write(User), 'default')
+
+    def test_marked_reads_use_replica(self):
+        with self.replica_settings():
+            self.assertIsNone(self.router.db_for_read(User))
+            with read_replica():
+                self.assertEqual(self.router.db_for_read(User), 'default')
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_reads_inside_transaction_stay_on_default(self):
+        connection = connections['default']
+        with self.replica_settings(), read_replica():
+            connection.in_atomic_block = True
+            try:
+                self.assertIsNone(self.router.db_for_read(User))
+            finally:
+                connection.in_atomic_block = False
+
+
+class TwoLevelCacheTests(SimpleTestCase):
+    """La copia local delante de la caché compartida: lecturas, escrituras y borrados"""
+
+    def setUp(self):
+        self.cache = TwoLevelCache('shared', {'OPTIONS': {'LOCAL_TIMEOUT': 60}})
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def test_writes_reach_both_levels(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(caches['shared'].get('key'), 'value')
+        self.assertEqual(self.cache.local.get('key'), 'value')
+
+    def test_shared_hits_fill_local_copy(self):
+        caches['shared'].set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        caches['shared'].delete('key')
+        # Otro proceso lo borró: la copia local dura como mucho LOCAL_TIMEOUT
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_tests_use_an_in_memory_shared_tier(self):
+        # apps.core.runner.TestRunner sustituye la caché en fichero o Redis
+        self.assertIsInstance(caches['shared'], LocMemCache)
+
+    def test_get_many_and_counters(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.cache.local.delete('b')
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(self.cache.incr('a'), 2)
+        self.assertIsNone(self.cache.local.get('a'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(TestCase):
+    """Cada endpoint respeta su presupuesto de consultas, que no crece con los datos"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_endpoints_within_query_budget(self):
+        runs = {}
+        for scale in (2, 15):
+            fixture = generate_fixture(scale)
+            runs[scale] = {endpoint.name: measure(endpoint, fixture, repeat=1) for endpoint in ENDPOINTS}
+
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint=endpoint.name):
+                self.assertEqual(runs[2][endpoint.name].violations(endpoint.status, latency=False), [])
+        self.assertEqual(query_growth(runs), [])
+
+
+class MetricsMiddlewareTests(TestCase):
+    """Server-Timing en cada respuesta y agregados en /metrics"""
+
+    def test_server_timing_and_metrics_endpoint(self):
+        user = User.objects.create_user('metrics', 'metrics@example.com', 'secret-pass')
+        token = Token.objects.create(user=user)
+        response = self.client.get('/security/profile/me/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries", cache;desc="\d+ hits \d+ misses"')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('lovesnap_http_requests_total{view="security:profile-me",method="GET",status="200"}',
+                      response.content.decode())
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.9').status_code, 403)
+
+
+class StructuredLoggingTests(TestCase):
+    """Logs JSON en cola y registro de peticiones y consultas lentas"""
+
+    def test_queue_handler_writes_json_lines(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        handler = QueueFileHandler(os.path.join(directory, 'test.log'), maxBytes=1024, backupCount=1)
+        handler.setFormatter(JsonFormatter())
+        logger = logging.getLogger('apps.core.tests.queue')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        for index in range(50):
+            logger.warning('evento %s', index, extra={'session': index})
+        handler.close()
+
+        with open(os.path.join(directory, 'test.log'), encoding='utf-8') as stream:
+            entry = json.loads(stream.readlines()[-1])
+        self.assertEqual((entry['message'], entry['session'], entry['level']), ('evento 49', 49, 'WARNING'))
+        # Rotado por tamaño
+        self.assertTrue(os.path.exists(os.path.join(directory, 'test.log.1')))
+
+    def test_handler_loads_through_dict_config(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'config.log')
+        logging.config.dictConfig({
+            'version': 1,
+            'disable_existing_loggers': False,
+            'formatters': {'json': {'()': 'apps.core.log.JsonFormatter'}},
+            'handlers': {'queued': {
+                'class': 'apps.core.log.QueueFileHandler', 'filename': path, 'formatter': 'json',
+            }},
+            'loggers': {'apps.core.tests.config': {
+                'handlers': ['queued'], 'level': 'INFO', 'propagate': False,
+            }},
+        })
+        logger = logging.getLogger('apps.core.tests.config')
+        handler = logger.handlers[0]
+        self.addCleanup(logger.removeHandler, handler)
+        try:
+            raise ValueError('roto')
+        except ValueError:
+            logger.exception('fallo')
+        handler.close()
+
+        with open(path, encoding='utf-8') as stream:
+            entry = json.loads(stream.read())
+        self.assertEqual(entry['message'], 'fallo')
+        self.assertIn('ValueError: roto', entry['exception'])
+
+    def test_formatter_keeps_only_json_extras(self):
+        request = RequestFactory().get('/sessions/events/', {'token': 'secreto'})
+        record = logging.LogRecord('django.request', logging.ERROR, __file__, 1,
+                                   'Not Implemented: %s', (request.path,), None)
+        record.status_code = 501
+        record.request = request
+        record.user = object()
+
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual((entry['method'], entry['path'], entry['status_code']), ('GET', '/sessions/events/', 501))
+        self.assertNotIn('user', entry)
+        self.assertNotIn('secreto', json.dumps(entry))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0, SLOW_QUERY_THRESHOLD=0)
+    def test_slow_request_and_query_logs(self):
+        user = User.objects.create_user('slow', 'slow@example.com', 'secret-pass')
+        token = Token.objects.create(user=user)
+        with self.assertLogs('apps.core.slow_queries', 'WARNING') as queries, \
+                self.assertLogs('apps.core.slow_requests', 'WARNING') as requests:
+            self.client.get('/security/profile/me/', {'token': token.key},
+                            HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        sites = [record.call_site for record in queries.records]
+        self.assertIn('apps/security/viewsets/auth_view.py', ' '.join(filter(None, sites)))
+        self.assertIn('SELECT', queries.records[0].sql)
+        self.assertEqual(queries.records[0].path, '/security/profile/me/')
+        self.assertEqual(requests.records[0].view, 'security:profile-me')
+        # La query string (con ?token=) no llega a los logs
+        self.assertEqual(requests.records[0].path, '/security/profile/me/')
+        self.assertGreater(requests.records[0].queries, 0)
+
+
+def decode(code):
+    value = 0
+    for char in code:
+        value = value * len(ALPHABET) + ALPHABET.index(char)
+    return value
+
+
+class AccessCodeAllocatorTests(TestCase):
+    """Los códigos son una permutación del contador y no chocan con los antiguos"""
+
+    def test_permutation_is_unique_and_in_range(self):
+        keys = _round_keys()
+        values = [permute(value, keys) for value in range(20000)]
+        self.assertEqual(len(set(values)), len(values))
+        self.assertTrue(all(0 <= value < CODE_SPACE for value in values))
+        codes = {encode(value) for value in values}
+        self.assertEqual(len(codes), len(values))
+        self.assertTrue(all(len(code) == CODE_LENGTH and set(code) <= set(ALPHABET) for code in codes))
+
+    def test_allocations_are_unique_across_blocks(self):
+        allocator = AccessCodeAllocator(block_size=7)
+        codes = [allocator.allocate() for _ in range(50)]
+        self.assertEqual(len(set(codes)), 50)
+
+    def test_skips_codes_whose_lowercase_form_is_a_legacy_code(self):
+        PhotoSession.objects.create(access_code='abcdef23')
+        PhotoSession.objects.create(access_code='22334455')
+        candidates = ['ABCDEF23', '22334455', 'ABCDEF24']
+        allocator = AccessCodeAllocator(block_size=10)
+        with mock.patch('apps.core.codes.permute', side_effect=[decode(code) for code in candidates]):
+            self.assertEqual(allocator.allocate(), 'ABCDEF24')
+
+    def test_non_hex_codes_skip_the_legacy_lookup(self):
+        allocator = AccessCodeAllocator(block_size=10)
+        allocator.allocate()
+        with mock.patch('apps.core.codes.permute', return_value=decode('XYZ23456')):
+            with self.assertNumQueries(0):
+                self.assertEqual(allocator.allocate(), 'XYZ23456')
+
+
+class InProcessBrokerTests(SimpleTestCase):
+    """Reparto de eventos a suscriptores de uno o varios canales"""
+
+    async def test_fan_out_to_every_subscriber_of_a_channel(self):
+        broker = InProcessBroker()
+        async with broker.subscribe(['session:1']) as first, \
+                broker.subscribe(['session:1']) as second, \
+                broker.subscribe(['session:1', 'user:1']) as both:
+            # publish() llega desde hilos de vistas síncronas
+            thread = threading.Thread(target=broker.publish, args=('session:1', {'type': 'a'}))
+            thread.start()
+            thread.join()
+            broker.publish('user:1', {'type': 'b'})
+            self.assertEqual(await asyncio.wait_for(first.get(), 1), {'type': 'a'})
+            self.assertEqual(await asyncio.wait_for(second.get(), 1), {'type': 'a'})
+            self.assertEqual(await asyncio.wait_for(both.get(), 1), {'type': 'a'})
+            self.assertEqual(await asyncio.wait_for(both.get(), 1), {'type': 'b'})
+            self.assertTrue(first.empty())
+        self.assertEqual(broker._subscribers, {})
+
+    async def test_slow_subscriber_drops_events(self):
+        broker = InProcessBroker(queue_size=2)
+        async with broker.subscribe(['user:1']) as queue:
+            for index in range(4):
+                broker.publish('user:1', {'type': index})
+            await asyncio.sleep(0)
+            self.assertEqual([queue.get_nowait(), queue.get_nowait()], [{'type': 0}, {'type': 1}])
+            self.assertTrue(queue.empty())
+
+
+class PublishEventTests(TestCase):
+    """Los eventos se publican al confirmar la transacción"""
+
+    def test_published_on_commit_to_session_and_user_channels(self):
+        broker = mock.Mock()
+        with mock.patch('apps.core.events.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                publish_event('photo.added', {'order': 0}, session_id='s1', user_id=7)
+                broker.publish.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        event = {'type': 'photo.added', 'data': {'order': 0}}
+        broker.publish.assert_has_calls([
+            mock.call(session_channel('s1'), event), mock.call(user_channel(7), event),
+        ])
@@ -1,6 +1,7 @@
 # core/utils.py
 import os
 import uuid
+from apps.core.codes import access_codes
 
 def generate_uuid():
     """Genera un UUID único"""
@@ -8,7 +9,7 @@ def generate_uuid():
 
 def generate_access_code():
     """Genera un código de acceso único de 8 caracteres"""
-    return str(uuid.uuid4())[:8]
+    return access_codes.allocate()
 
 def safe_delete_file(file_path):
     """Elimina un archivo físico de manera segura"""
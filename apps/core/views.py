@@ -1,3 +1,17 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from apps.core.metrics import registry
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Métricas del proceso en formato de texto de Prometheus.
+    Sólo para las IPs de METRICS_ALLOWED_IPS o usuarios staff.
+    """
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', settings.INTERNAL_IPS)
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
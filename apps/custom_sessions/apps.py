@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CustomSessionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.custom_sessions'
+
+    def ready(self):
+        from apps.custom_sessions import signals  # noqa: F401
@@ -5,6 +5,8 @@ import uuid
 from apps.security.models import User
 from apps.custom_templates.models import PhotoTemplate
 from apps.core.utils import generate_access_code
+from apps.security.counters import session_counters
+from apps.custom_sessions.services.access import invalidate_access_code
 
 class PhotoSession(models.Model):
     """Modelo para las sesiones de fotos"""
@@ -53,6 +55,12 @@ class PhotoSession(models.Model):
         verbose_name = _('sesión de fotos')
         verbose_name_plural = _('sesiones de fotos')
         ordering = ['-created_at']
+        indexes = [
+            # Búsqueda de sesiones caducadas por el reaper
+            models.Index(fields=['status', 'expires_at'], name='session_status_expiry_idx'),
+            # Listados por usuario paginados por cursor sobre created_at
+            models.Index(fields=['user', '-created_at'], name='session_user_created_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         """Sobrescribe el método save para gestionar la generación de código y fechas"""
@@ -63,13 +71,15 @@ class PhotoSession(models.Model):
             self.expires_at = timezone.now() + timezone.timedelta(hours=24)
             
         # Si es una sesión nueva, incrementa el contador del usuario
-        is_new = self.pk is None
+        # (el pk UUID tiene valor por defecto, por eso se usa _state.adding)
+        is_new = self._state.adding
         
         super().save(*args, **kwargs)
+        invalidate_access_code(self.access_code)
         
-        # Actualiza estadísticas del usuario si existe
-        if is_new and self.user:
-            self.user.increment_session_count()
+        # Actualiza estadísticas del usuario si existe (UPDATE atómico, sin cargar el usuario)
+        if is_new and self.user_id:
+            session_counters.add(self.user_id, sessions_created=1)
     
     def __str__(self):
         """Representación en string de la sesión"""
@@ -80,24 +90,32 @@ class PhotoSession(models.Model):
         """Verifica si la sesión ha expirado"""
         return self.expires_at < timezone.now()
     
+    def delete(self, *args, **kwargs):
+        """Sobrescribe delete para invalidar la caché del código de acceso"""
+        result = super().delete(*args, **kwargs)
+        invalidate_access_code(self.access_code)
+        return result
+    
     def mark_completed(self):
         """Marca la sesión como completada y actualiza estadísticas del usuario"""
         self.status = self.STATUS_COMPLETED
         self.completed_at = timezone.now()
-        self.save()
+        self.save(update_fields=['status', 'completed_at'])
         
-        if self.user:
-            self.user.complete_session()
+        if self.user_id:
+            session_counters.add(
+                self.user_id, last_session_date=self.completed_at, completed_sessions=1
+            )
     
     def mark_in_progress(self):
         """Marca la sesión como en progreso"""
         self.status = self.STATUS_IN_PROGRESS
-        self.save()
+        self.save(update_fields=['status'])
     
     def extend_expiration(self, hours=24):
         """Extiende el tiempo de expiración de la sesión"""
         self.expires_at = timezone.now() + timezone.timedelta(hours=hours)
-        self.save()
+        self.save(update_fields=['expires_at'])
 
 class SessionSettings(models.Model):
     """Configuración para la sesión de fotos"""
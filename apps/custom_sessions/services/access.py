@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from apps.core.codes import normalize_code
+from apps.core.metrics import record_cache
+
+CACHE_PREFIX = 'access_code:'
+MISSING = 'missing'
+
+
+def _cache_key(code):
+    return f'{CACHE_PREFIX}{code}'
+
+
+def resolve_access_code(code):
+    """
+    Resuelve un código de acceso a los datos públicos de su sesión.
+    Las respuestas (también las negativas, con un TTL más corto) se sirven
+    desde la caché, así que un código repetido no vuelve a la base de datos.
+    Devuelve None si el código no existe o la sesión ha caducado.
+    """
+    from apps.custom_sessions.models import PhotoSession
+
+    code = normalize_code(code)
+    if not code:
+        return None
+
+    key = _cache_key(code)
+    data = cache.get(key)
+    record_cache('access_code', hit=data is not None)
+    if data is None:
+        # Los códigos antiguos se guardaron en minúsculas: si ambas formas
+        # existen gana la coincidencia exacta, en la misma consulta
+        row = (
+            PhotoSession.objects.filter(access_code__in={code, code.lower()})
+            .order_by(Case(When(access_code=code, then=Value(0)), default=Value(1),
+                           output_field=IntegerField()))
+            .values('id', 'title', 'status', 'expires_at', 'template_id')
+            .first()
+        )
+        if row is None:
+            cache.set(key, MISSING, getattr(settings, 'ACCESS_CODE_NEGATIVE_CACHE_TTL', 30))
+            return None
+        data = row
+        cache.set(key, data, getattr(settings, 'ACCESS_CODE_CACHE_TTL', 300))
+    elif data == MISSING:
+        return None
+
+    # El reaper caduca sesiones con UPDATE en bloque: se comprueba aquí también
+    if data['status'] == PhotoSession.STATUS_EXPIRED or (
+        data['expires_at'] and data['expires_at'] < timezone.now()
+    ):
+        return None
+    return data
+
+
+def invalidate_access_code(code):
+    """Elimina de la caché la resolución de un código"""
+    if code:
+        code = normalize_code(code)
+        cache.delete(_cache_key(code))
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.core.events import publish_event
+from apps.custom_sessions.models import PhotoSession
+
+
+@receiver(post_save, sender=PhotoSession)
+def publish_session_status(sender, instance, created, **kwargs):
+    """Notifica a los paneles suscritos cualquier cambio de estado de la sesión"""
+    if kwargs.get('raw'):
+        return
+    publish_event(
+        'session.created' if created else 'session.status',
+        {
+            'session': instance.pk,
+            'status': instance.status,
+            'completed_at': instance.completed_at,
+            'expires_at': instance.expires_at,
+        },
+        session_id=instance.pk,
+        user_id=instance.user_id,
+    )
@@ -1,3 +1,186 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from apps.core.events import InProcessBroker, session_channel, user_channel
+from apps.custom_sessions.models import PhotoSession
+from apps.custom_sessions.services.access import resolve_access_code
+from apps.custom_sessions.views import events
+from apps.photo.models import IndividualPhoto, MediaBlob
+from apps.photo.services.derivatives import reuse_derivatives
+from apps.security.models import User
+
+
+class AccessCodeResolverTests(TestCase):
+    """Resolución cacheada de códigos, con los antiguos en minúsculas"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_resolves_normalized_code_and_caches_it(self):
+        session = PhotoSession.objects.create(title='Boda')
+        typed = f' {session.access_code[:4].lower()}-{session.access_code[4:]} '
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_access_code(typed)['id'], session.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_access_code(session.access_code)['title'], 'Boda')
+
+    def test_exact_match_wins_over_legacy_lowercase(self):
+        legacy = PhotoSession.objects.create(access_code='abcdef23', title='Antigua')
+        self.assertEqual(resolve_access_code('abcdef23')['id'], legacy.pk)
+        current = PhotoSession.objects.create(access_code='ABCDEF23', title='Nueva')
+        self.assertEqual(resolve_access_code('abcdef23')['id'], current.pk)
+        self.assertEqual(resolve_access_code('ABCDEF23')['id'], current.pk)
+
+    def test_missing_and_expired_codes(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(resolve_access_code('ZZZZ2222'))
+            self.assertIsNone(resolve_access_code('ZZZZ2222'))
+        self.assertIsNone(resolve_access_code(''))
+        session = PhotoSession.objects.create(expires_at=timezone.now() - timezone.timedelta(minutes=1))
+        self.assertIsNone(resolve_access_code(session.access_code))
+
+    def test_save_invalidates_cached_resolution(self):
+        session = PhotoSession.objects.create(title='Antes')
+        resolve_access_code(session.access_code)
+        session.title = 'Después'
+        session.save()
+        self.assertEqual(resolve_access_code(session.access_code)['title'], 'Después')
+
+
+class SessionDetailTests(TestCase):
+    """El ETag del detalle cambia con el contenido de las fotos, no sólo con los recuentos"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('detail', 'detail@example.com', 'secret-pass')
+        self.session = PhotoSession.objects.create(user=self.user)
+        self.photo = IndividualPhoto.objects.create(session=self.session, image='sessions/a.jpg')
+        self.client.force_login(self.user)
+        self.path = f'/sessions/async/{self.session.pk}/'
+
+    def etag(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_session_is_not_modified(self):
+        etag = self.etag()
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_replaced_photo_changes_the_etag(self):
+        etag = self.etag()
+        self.photo.delete()
+        IndividualPhoto.objects.create(session=self.session, image='sessions/b.jpg')
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_regenerated_derivatives_change_the_etag(self):
+        IndividualPhoto.objects.filter(pk=self.photo.pk).update(
+            derivatives={'thumb': {'jpeg': 'derivatives/a_thumb.jpg'}}
+        )
+        etag = self.etag()
+        with mock.patch('apps.photo.services.derivatives._refresh_cover'):
+            self.photo.derivatives = {}
+            MediaBlob.objects.create(digest='a' * 64, name='blobs/a.jpg', derivatives={
+                'thumb': {'jpeg': 'derivatives/b_thumb.jpg'},
+            })
+            with mock.patch('apps.photo.services.derivatives._digest', return_value='a' * 64):
+                self.assertTrue(reuse_derivatives(self.photo))
+        self.assertNotEqual(self.etag(), etag)
+
+
+def parse_event(chunk):
+    lines = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+    return lines['event'], json.loads(lines['data'])
+
+
+class EventStreamTests(TestCase):
+    """Streams SSE: suscripción antes del estado inicial y autorización"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('events', 'events@example.com', 'secret-pass')
+        self.token = Token.objects.create(user=self.user)
+        self.session = PhotoSession.objects.create(user=self.user)
+        # Un broker por prueba: los streams sin cerrar no pasan a la siguiente
+        self.broker = InProcessBroker()
+        patcher = mock.patch.object(events, 'get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # El wrapper de streaming_content no cierra el generador de la vista:
+        # se guarda para cerrarlo en la prueba, dentro de su event loop
+        self.streams = []
+        stream = events._stream
+
+        def tracked(*args):
+            self.streams.append(stream(*args))
+            return self.streams[-1]
+
+        patcher = mock.patch.object(events, '_stream', tracked)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def open(self, path, token=None):
+        response = await self.async_client.get(path, {'token': token or self.token.key})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        return stream
+
+    async def next_event(self, stream):
+        return parse_event(await asyncio.wait_for(anext(stream), 1))
+
+    async def close(self, stream):
+        await stream.aclose()
+        for generator in self.streams:
+            await generator.aclose()
+
+    async def test_session_stream_subscribes_before_snapshot(self):
+        channel = session_channel(self.session.pk)
+        snapshot = events._session_snapshot
+
+        async def racing_snapshot(session_id):
+            # Un cambio publicado mientras se lee el estado ya debe llegar
+            self.assertIn(channel, self.broker._subscribers)
+            self.broker.publish(channel, {'type': 'photo.added', 'data': {'order': 0}})
+            return await snapshot(session_id)
+
+        with mock.patch.object(events, '_session_snapshot', racing_snapshot):
+            stream = await self.open(f'/sessions/{self.session.pk}/events/')
+            try:
+                name, data = await self.next_event(stream)
+                self.assertEqual((name, data['status']), ('session.status', PhotoSession.STATUS_CREATED))
+                self.assertEqual(await self.next_event(stream), ('photo.added', {'order': 0}))
+            finally:
+                await self.close(stream)
+
+    async def test_user_stream_receives_published_events(self):
+        stream = await self.open('/sessions/events/')
+        try:
+            self.broker.publish(user_channel(self.user.pk), {'type': 'session.completed', 'data': {'id': 1}})
+            self.assertEqual(await self.next_event(stream), ('session.completed', {'id': 1}))
+        finally:
+            await self.close(stream)
+
+    async def test_session_stream_is_only_for_the_owner(self):
+        other = await User.objects.acreate(username='other', email='other@example.com')
+        token = await Token.objects.acreate(user=other)
+        response = await self.async_client.get(f'/sessions/{self.session.pk}/events/', {'token': token.key})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(f'/sessions/{self.session.pk}/events/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_query_token_is_only_for_streams(self):
+        response = await self.async_client.get('/sessions/async/', {'token': self.token.key})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/sessions/async/', AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200)
 
-# Create your tests here.
+    def test_wsgi_requests_are_rejected(self):
+        response = self.client.get('/sessions/events/', {'token': self.token.key})
+        self.assertEqual(response.status_code, 501)
@@ -0,0 +1,15 @@
+from django.urls import path
+from apps.custom_sessions.views.access import access_code_view
+from apps.custom_sessions.views.api import session_list_view, session_detail_view
+from apps.custom_sessions.views.events import session_events_view, user_events_view
+
+app_name = "custom_sessions"
+
+# Definir patrones de URL
+urlpatterns = [
+    path("code/<str:code>/", access_code_view, name="access-code"),
+    path("async/", session_list_view, name="async-session-list"),
+    path("async/<uuid:session_id>/", session_detail_view, name="async-session-detail"),
+    path("events/", user_events_view, name="user-events"),
+    path("<uuid:session_id>/events/", session_events_view, name="session-events"),
+]
@@ -0,0 +1,27 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status, permissions
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.response import Response
+
+from apps.custom_sessions.services.access import resolve_access_code
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+def access_code_view(request, code):
+    """
+    Endpoint público para que un invitado introduzca su código de acceso.
+    No autentica (evita la consulta de usuario) y resuelve desde la caché.
+    """
+    session = resolve_access_code(code)
+    if session is None:
+        return Response({"detail": _("Código de acceso no válido o caducado.")},
+                        status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'id': session['id'],
+        'title': session['title'],
+        'status': session['status'],
+        'expires_at': session['expires_at'],
+        'template': session['template_id'],
+    })
@@ -0,0 +1,77 @@
+from django.db.models import Count, Max, Q
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from apps.core.conditional import make_etag, not_modified, set_validators
+from apps.core.pagination import encode_keyset, filter_keyset
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto
+from apps.photo.views.media import photo_payload
+from apps.security.authentication import async_auth_required
+
+SESSION_FIELDS = ('id', 'title', 'access_code', 'status', 'template_id',
+                  'created_at', 'completed_at', 'expires_at')
+MAX_SESSIONS = 50
+
+
+@require_GET
+@async_auth_required
+async def session_list_view(request):
+    """
+    Sesiones del usuario (las más recientes primero, ?limit= hasta 50) con
+    el número de fotos de cada una, en una consulta del ORM asíncrono.
+    Se pagina por keyset con ?cursor= (el valor 'next' de la respuesta).
+    """
+    try:
+        limit = max(min(int(request.GET.get('limit', 20)), MAX_SESSIONS), 1)
+    except ValueError:
+        limit = 20
+    sessions = filter_keyset(PhotoSession.objects.filter(user=request.user), request.GET.get('cursor'))
+    sessions = sessions.order_by('-created_at', '-pk') \
+        .annotate(photo_count=Count('photos')) \
+        .values(*SESSION_FIELDS, 'photo_count')[:limit + 1]
+    results = [session async for session in sessions]
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_keyset(results[-1]['created_at'], results[-1]['id'])
+    return JsonResponse({'next': next_cursor, 'results': results})
+
+
+@require_GET
+@async_auth_required
+async def session_detail_view(request, session_id):
+    """
+    Detalle de una sesión del usuario con sus fotos y el composite final.
+    Admite GET condicional: la versión (estado, número de fotos y de
+    derivados listos, y la última modificación de fotos y composites) sale
+    de una consulta agregada; si coincide con el ETag del cliente se
+    responde 304 sin cargar las fotos. La fecha de modificación cubre lo que
+    no cambia los recuentos: una foto sustituida o derivados regenerados.
+    """
+    version = await PhotoSession.objects.filter(pk=session_id, user=request.user).annotate(
+        photo_count=Count('photos', distinct=True),
+        photos_ready=Count('photos', filter=~Q(photos__derivatives={}), distinct=True),
+        photos_updated=Max('photos__updated_at'),
+        composite_count=Count('composites', distinct=True),
+        composites_ready=Count('composites', filter=~Q(composites__derivatives={}), distinct=True),
+        composites_updated=Max('composites__updated_at'),
+    ).values_list('status', 'title', 'template_id', 'completed_at', 'expires_at',
+                  'photo_count', 'photos_ready', 'photos_updated',
+                  'composite_count', 'composites_ready', 'composites_updated').afirst()
+    if version is None:
+        raise Http404
+    etag = make_etag(request, *version)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    session = await PhotoSession.objects.filter(pk=session_id).values(*SESSION_FIELDS).aget()
+
+    photos = IndividualPhoto.objects.filter(session_id=session_id).order_by('order') \
+        .only('id', 'session', 'order', 'image', 'derivatives', 'created_at')
+    session['photos'] = [photo_payload(request, photo) async for photo in photos]
+    composite = await CompositePhoto.objects.filter(session_id=session_id) \
+        .order_by('-created_at').only('id', 'session', 'image', 'derivatives', 'created_at').afirst()
+    session['composite'] = photo_payload(request, composite, 'medium') if composite else None
+    return set_validators(JsonResponse(session), etag)
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
+
+from apps.core.events import get_broker, session_channel, user_channel
+from apps.custom_sessions.models import PhotoSession
+from apps.security.authentication import async_auth_required, token_in_query
+
+
+def _format(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], cls=DjangoJSONEncoder)}\n\n"
+
+
+async def _stream(channels, snapshot):
+    """
+    Envía el estado inicial y después los eventos, con keep-alive periódico.
+    El estado se lee ya suscrito: un cambio publicado entre la lectura y la
+    suscripción llegaría tarde o nunca; así, como mucho, se recibe dos veces.
+    """
+    heartbeat = getattr(settings, 'EVENT_STREAM_HEARTBEAT', 15)
+    async with get_broker().subscribe(channels) as queue:
+        yield 'retry: 3000\n\n'
+        if snapshot is not None:
+            event = await snapshot()
+            if event is not None:
+                yield _format(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield _format(event)
+
+
+def _event_response(channels, snapshot=None):
+    response = StreamingHttpResponse(_stream(channels, snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # sin buffer en nginx
+    return response
+
+
+def _check_request(request):
+    """Errores comunes: sólo ASGI (bajo WSGI cada conexión bloquearía un hilo) y GET"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': _("Los eventos en tiempo real requieren el servidor ASGI.")},
+                            status=501)
+    if request.method != 'GET':
+        return JsonResponse({'detail': _("Método no permitido.")}, status=405)
+    return None
+
+
+async def _session_snapshot(session_id):
+    session = await PhotoSession.objects.filter(pk=session_id) \
+        .values('id', 'status', 'completed_at', 'expires_at').afirst()
+    if session is None:
+        return None
+    return {
+        'type': 'session.status',
+        'data': {
+            'session': session['id'],
+            'status': session['status'],
+            'completed_at': session['completed_at'],
+            'expires_at': session['expires_at'],
+        },
+    }
+
+
+@async_auth_required
+@token_in_query
+async def session_events_view(request, session_id):
+    """
+    Stream SSE con el progreso de una sesión: fotos recibidas, cambios de
+    estado y composite listo. Sólo para el dueño de la sesión.
+    """
+    error = _check_request(request)
+    if error:
+        return error
+    if not await PhotoSession.objects.filter(pk=session_id, user=request.user).aexists():
+        return JsonResponse({'detail': _("Sesión no encontrada.")}, status=404)
+    return _event_response([session_channel(session_id)], lambda: _session_snapshot(session_id))
+
+
+@async_auth_required
+@token_in_query
+async def user_events_view(request):
+    """Stream SSE con los eventos de todas las sesiones del usuario (panel)"""
+    error = _check_request(request)
+    if error:
+        return error
+    return _event_response([user_channel(request.user.pk)])
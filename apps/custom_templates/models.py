@@ -1,6 +1,16 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from apps.security.models import User
+from apps.custom_templates.services.assets import asset_cache, compile_template, remove_assets
+from apps.custom_templates.services.catalogue import (
+    catalogue,
+    discard_previews,
+    next_catalogue_version,
+    preview_prefix,
+    publish_previews,
+    remove_previews,
+    render_previews,
+)
 
 class PhotoTemplate(models.Model):
     """Modelo para las plantillas de diseño para las fotos finales"""
@@ -17,6 +27,10 @@ class PhotoTemplate(models.Model):
         null=True, 
         blank=True
     )
+    previews = models.JSONField(_('vistas previas'), default=dict, blank=True, editable=False)
+    catalogue_version = models.PositiveBigIntegerField(
+        _('versión del catálogo'), default=0, editable=False, db_index=True
+    )
     created_at = models.DateTimeField(_('fecha de creación'), auto_now_add=True)
     updated_at = models.DateTimeField(_('fecha de actualización'), auto_now=True)
 
@@ -26,4 +40,61 @@ class PhotoTemplate(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+    def save(self, *args, **kwargs):
+        """
+        Sobrescribe save para generar las vistas previas de la plantilla,
+        publicar una nueva versión del catálogo y precompilar su asset.
+        Las vistas previas se generan antes de la transacción: dentro sólo se
+        reserva la versión, se guarda la fila y se renombran, para no tener
+        bloqueada la secuencia (y en SQLite toda la base de datos) mientras
+        se procesan imágenes. La versión se confirma junto con la fila y sus
+        vistas previas, y en orden. El asset se compila después del commit.
+        """
+        staged = None
+        if self.image:
+            if not self.image._committed:
+                # pre_save lo haría dentro de la transacción: las vistas previas lo necesitan antes
+                self.image.save(self.image.name, self.image.file, save=False)
+            staged = render_previews(self)
+        try:
+            with transaction.atomic():
+                self.catalogue_version = next_catalogue_version()
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'catalogue_version', 'updated_at'}
+                super().save(*args, **kwargs)
+                if staged:
+                    self.previews = publish_previews(self, staged)
+                    PhotoTemplate.objects.filter(pk=self.pk).update(previews=self.previews)
+                catalogue.invalidate()
+        except Exception:
+            if staged:
+                discard_previews(self, staged)
+            raise
+        if self.image:
+            remove_previews(self.pk, keep=preview_prefix(self))
+            compile_template(self)
+
+    def delete(self, *args, **kwargs):
+        """Sobrescribe delete para eliminar también los assets compilados y dejar constancia en el catálogo"""
+        template_id = self.pk
+        with transaction.atomic():
+            TemplateTombstone.objects.create(template_id=template_id, catalogue_version=next_catalogue_version())
+            result = super().delete(*args, **kwargs)
+            catalogue.invalidate()
+        remove_assets(template_id)
+        remove_previews(template_id)
+        asset_cache.invalidate(template_id)
+        return result
+
+
+class TemplateTombstone(models.Model):
+    """Plantilla borrada: permite a los kioscos retirarla al pedir un delta del catálogo"""
+    template_id = models.PositiveBigIntegerField(_('plantilla'))
+    catalogue_version = models.PositiveBigIntegerField(_('versión del catálogo'), db_index=True)
+    deleted_at = models.DateTimeField(_('fecha de borrado'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('plantilla borrada')
+        verbose_name_plural = _('plantillas borradas')
\ No newline at end of file
@@ -0,0 +1,202 @@
+import glob
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from PIL import Image
+
+# Formato del asset compilado:
+#   cabecera  <4s H I I H>  magic, versión de formato, ancho, alto, nº de huecos
+#   huecos    <I I I I>     left, top, right, bottom por cada hueco
+#   píxeles   RGBA crudo    ancho * alto * 4 bytes (el canal A es la máscara)
+ASSET_MAGIC = b'LSTA'
+ASSET_FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHIIH')
+SLOT = struct.Struct('<IIII')
+
+# Píxeles con alfa menor a este valor se consideran hueco para foto
+SLOT_ALPHA_THRESHOLD = 16
+SLOT_MIN_SIZE = 32
+
+TemplateAsset = namedtuple('TemplateAsset', ['overlay', 'slots', 'size'])
+AssetRef = namedtuple('AssetRef', ['template_id', 'version', 'compiled_path', 'source_path'])
+
+
+def _runs(values, min_length):
+    """Devuelve los tramos consecutivos (inicio, fin) con valor distinto de cero"""
+    runs = []
+    start = None
+    for index, value in enumerate(values):
+        if value and start is None:
+            start = index
+        elif not value and start is not None:
+            if index - start >= min_length:
+                runs.append((start, index))
+            start = None
+    if start is not None and len(values) - start >= min_length:
+        runs.append((start, len(values)))
+    return runs
+
+
+def find_slots(overlay, alpha_threshold=SLOT_ALPHA_THRESHOLD, min_size=SLOT_MIN_SIZE):
+    """
+    Localiza los huecos transparentes de una plantilla RGBA.
+    Proyecta la máscara de transparencia por filas y luego por columnas dentro
+    de cada banda, por lo que detecta tiras verticales, horizontales y rejillas.
+    Devuelve una lista de rectángulos (left, top, right, bottom) ordenados.
+    """
+    mask = overlay.getchannel('A').point(lambda a: 255 if a < alpha_threshold else 0)
+    if mask.getbbox() is None:
+        return []
+
+    width, height = mask.size
+    slots = []
+    row_profile = list(mask.resize((1, height), Image.BOX).getdata())
+    for top, bottom in _runs(row_profile, min_size):
+        band = mask.crop((0, top, width, bottom))
+        column_profile = list(band.resize((width, 1), Image.BOX).getdata())
+        for left, right in _runs(column_profile, min_size):
+            box = mask.crop((left, top, right, bottom)).getbbox()
+            if box:
+                slots.append((left + box[0], top + box[1], left + box[2], top + box[3]))
+    return sorted(slots, key=lambda slot: (slot[1], slot[0]))
+
+
+def asset_directory():
+    """Directorio donde se guardan las plantillas precompiladas"""
+    return getattr(settings, 'TEMPLATE_ASSET_DIR', None) or os.path.join(
+        settings.MEDIA_ROOT, 'templates', 'compiled'
+    )
+
+
+def template_version(template):
+    """Versión del asset: marca de tiempo de updated_at en microsegundos"""
+    return int(template.updated_at.timestamp() * 1_000_000)
+
+
+def asset_path(template_id, version):
+    return os.path.join(asset_directory(), f'{template_id}-{version}.lsa')
+
+
+def asset_ref(template):
+    """Referencia serializable (apta para el pool de procesos) al asset de una plantilla"""
+    version = template_version(template)
+    return AssetRef(template.pk, version, asset_path(template.pk, version), template.image.path)
+
+
+def compile_asset(source_path, target_path):
+    """
+    Decodifica la imagen de la plantilla, localiza sus huecos y escribe el
+    asset binario de forma atómica. Devuelve la lista de huecos.
+    """
+    overlay = Image.open(source_path).convert('RGBA')
+    slots = find_slots(overlay)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temp_path = f'{target_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(HEADER.pack(ASSET_MAGIC, ASSET_FORMAT_VERSION, *overlay.size, len(slots)))
+        for slot in slots:
+            handle.write(SLOT.pack(*slot))
+        handle.write(overlay.tobytes())
+    os.replace(temp_path, target_path)
+    return slots
+
+
+def read_asset(path):
+    """
+    Carga un asset compilado mapeando el fichero en memoria; los píxeles de la
+    plantilla no se copian ni se decodifican.
+    """
+    with open(path, 'rb') as handle:
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, format_version, width, height, slot_count = HEADER.unpack_from(buffer, 0)
+    if magic != ASSET_MAGIC or format_version != ASSET_FORMAT_VERSION:
+        buffer.close()
+        raise ValueError(f"Asset de plantilla no válido: {path}")
+    offset = HEADER.size
+    slots = []
+    for _ in range(slot_count):
+        slots.append(SLOT.unpack_from(buffer, offset))
+        offset += SLOT.size
+    pixels = memoryview(buffer)[offset:offset + width * height * 4]
+    overlay = Image.frombuffer('RGBA', (width, height), pixels, 'raw', 'RGBA', 0, 1)
+    return TemplateAsset(overlay, slots, (width, height))
+
+
+def remove_assets(template_id, keep=None):
+    """Elimina los assets compilados de una plantilla salvo la ruta indicada"""
+    for path in glob.glob(os.path.join(asset_directory(), f'{template_id}-*.lsa')):
+        if path != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class TemplateAssetCache:
+    """
+    LRU en proceso de assets de plantilla acotado por bytes de píxeles.
+    Las claves son (id de plantilla, versión), por lo que un cambio en la
+    plantilla nunca reutiliza una entrada antigua; ésta sale por antigüedad.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ref):
+        key = (ref.template_id, ref.version)
+        with self._lock:
+            asset = self._entries.get(key)
+            if asset is not None:
+                self._entries.move_to_end(key)
+                return asset
+
+        if not os.path.exists(ref.compiled_path):
+            compile_asset(ref.source_path, ref.compiled_path)
+        asset = read_asset(ref.compiled_path)
+
+        with self._lock:
+            self._drop_template(ref.template_id)
+            self._entries[key] = asset
+            self.current_bytes += self._weight(asset)
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self._weight(evicted)
+        return asset
+
+    def invalidate(self, template_id):
+        with self._lock:
+            self._drop_template(template_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _drop_template(self, template_id):
+        for key in [key for key in self._entries if key[0] == template_id]:
+            self.current_bytes -= self._weight(self._entries.pop(key))
+
+    @staticmethod
+    def _weight(asset):
+        return asset.size[0] * asset.size[1] * 4
+
+
+asset_cache = TemplateAssetCache(
+    getattr(settings, 'TEMPLATE_ASSET_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+)
+
+
+def compile_template(template):
+    """Precompila el asset de una plantilla guardada y retira las versiones anteriores"""
+    ref = asset_ref(template)
+    compile_asset(ref.source_path, ref.compiled_path)
+    remove_assets(template.pk, keep=ref.compiled_path)
+    asset_cache.invalidate(template.pk)
+    return ref
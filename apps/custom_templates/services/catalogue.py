@@ -0,0 +1,214 @@
+import glob
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.core.metrics import record_cache
+from apps.photo.services.derivatives import FORMATS, render_derivatives
+
+CATALOGUE_SEQUENCE = 'template_catalogue'
+CACHE_KEY = 'template-catalogue'
+PREVIEW_DIRECTORY = 'templates/previews'
+DEFAULT_PREVIEW_SIZES = {'thumb': 320, 'medium': 800}
+
+# Vistas previas generadas con un nombre provisional, antes de reservar la versión
+StagedPreviews = namedtuple('StagedPreviews', ['basename', 'rendered'])
+
+
+def next_catalogue_version():
+    """
+    Nuevo número de versión del catálogo (monótono, compartido por todos los
+    procesos). Se reserva dentro de la transacción del cambio: la fila de la
+    secuencia queda bloqueada hasta el commit, así que las versiones se
+    confirman en el mismo orden en que se reservan.
+    """
+    from apps.core.models import Sequence
+
+    return Sequence.reserve(CATALOGUE_SEQUENCE)
+
+
+def committed_version():
+    """
+    Marca de agua del catálogo: última versión confirmada. Como las versiones
+    se confirman en orden, todo cambio con una versión menor o igual ya es
+    visible y un delta desde ella no puede saltarse ninguno.
+    """
+    from apps.core.models import Sequence
+
+    return Sequence.objects.filter(name=CATALOGUE_SEQUENCE) \
+        .values_list('next_value', flat=True).first() or 0
+
+
+def render_previews(template):
+    """
+    Genera las vistas previas JPEG/WebP de una plantilla con un nombre
+    provisional. Es el trabajo pesado y se hace fuera de la transacción del
+    cambio, sin la versión del catálogo reservada: publish_previews les da
+    después el nombre definitivo.
+    """
+    storage = template.image.storage
+    basename = f'staging-{uuid.uuid4().hex}'
+    rendered = render_derivatives(
+        template.image.path,
+        storage.path(PREVIEW_DIRECTORY),
+        basename,
+        getattr(settings, 'TEMPLATE_PREVIEW_SIZES', DEFAULT_PREVIEW_SIZES),
+        getattr(settings, 'PHOTO_DERIVATIVE_QUALITY', 82),
+    )
+    return StagedPreviews(basename, rendered)
+
+
+def preview_prefix(template):
+    return f'{template.pk}-{template.catalogue_version}_'
+
+
+def publish_previews(template, staged):
+    """
+    Renombra las vistas previas provisionales con el id y la versión del
+    catálogo, así que una URL nunca sirve una imagen antigua. Son renames
+    dentro del mismo directorio: caben en la transacción que reserva la versión.
+    """
+    directory = template.image.storage.path(PREVIEW_DIRECTORY)
+    basename = preview_prefix(template)[:-1]
+    previews = {}
+    for size, entry in staged.rendered.items():
+        previews[size] = dict(entry)
+        for fmt in FORMATS:
+            name = basename + entry[fmt][len(staged.basename):]
+            os.replace(os.path.join(directory, entry[fmt]), os.path.join(directory, name))
+            previews[size][fmt] = f'{PREVIEW_DIRECTORY}/{name}'
+    return previews
+
+
+def discard_previews(template, staged):
+    """Elimina las vistas previas provisionales que no se llegaron a publicar"""
+    directory = template.image.storage.path(PREVIEW_DIRECTORY)
+    for path in glob.glob(os.path.join(directory, f'{staged.basename}_*')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_previews(template_id, keep=None):
+    """Elimina las vistas previas de una plantilla salvo las de la versión indicada"""
+    from apps.custom_templates.models import PhotoTemplate
+
+    directory = PhotoTemplate._meta.get_field('image').storage.path(PREVIEW_DIRECTORY)
+    for path in glob.glob(os.path.join(directory, f'{template_id}-*')):
+        if keep is None or not os.path.basename(path).startswith(keep):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def build_snapshot():
+    """
+    Instantánea completa del catálogo: plantillas activas con sus vistas
+    previas, y las retiradas (desactivadas o borradas) con la versión en que
+    se retiraron, para poder calcular deltas sin consultar la base de datos.
+    """
+    from apps.custom_templates.models import PhotoTemplate, TemplateTombstone
+
+    storage = PhotoTemplate._meta.get_field('image').storage
+    templates, removed = [], []
+    version = 0
+    rows = PhotoTemplate.objects.order_by('name', 'pk').values(
+        'id', 'name', 'description', 'image', 'max_photos', 'is_active', 'previews',
+        'catalogue_version', 'updated_at',
+    )
+    for row in rows:
+        version = max(version, row['catalogue_version'])
+        if not row['is_active']:
+            removed.append({'id': row['id'], 'version': row['catalogue_version']})
+            continue
+        templates.append({
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'max_photos': row['max_photos'],
+            'image': storage.url(row['image']) if row['image'] else None,
+            'previews': {
+                size: {key: storage.url(value) if key in FORMATS else value for key, value in entry.items()}
+                for size, entry in (row['previews'] or {}).items()
+            },
+            'version': row['catalogue_version'],
+            'updated_at': row['updated_at'],
+        })
+    for template_id, tombstone_version in TemplateTombstone.objects.values_list('template_id', 'catalogue_version'):
+        version = max(version, tombstone_version)
+        removed.append({'id': template_id, 'version': tombstone_version})
+    return {'version': version, 'templates': templates, 'removed': removed}
+
+
+def catalogue_delta(snapshot, since=None):
+    """
+    Cambios desde la versión `since`: plantillas nuevas o modificadas y los
+    ids retirados. Sin `since` (o con una versión desconocida) se devuelve
+    el catálogo completo y 'full' a True.
+    """
+    if since is None or since > snapshot['version']:
+        return {'version': snapshot['version'], 'full': True,
+                'templates': snapshot['templates'], 'removed': []}
+    return {
+        'version': snapshot['version'],
+        'full': False,
+        'templates': [entry for entry in snapshot['templates'] if entry['version'] > since],
+        'removed': [entry['id'] for entry in snapshot['removed'] if entry['version'] > since],
+    }
+
+
+class CatalogueCache:
+    """
+    Instantánea del catálogo en la caché compartida, más una copia en memoria
+    del proceso con TTL corto para no deserializarla en cada petición.
+    La clave lleva la versión confirmada: una reconstrucción que leyó datos
+    anteriores a un commit queda guardada bajo la versión antigua y nunca se
+    sirve como actual. Sólo se reconstruye cuando cambia la versión (o al
+    caducar el TTL); en una apertura con todos los kioscos a la vez, cada
+    proceso la construye una sola vez.
+    """
+
+    def __init__(self):
+        self._local = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._local
+        if snapshot is not None and self._expires > time.monotonic():
+            record_cache('template_catalogue', hit=True)
+            return snapshot
+        with self._lock:
+            if self._local is not None and self._expires > time.monotonic():
+                record_cache('template_catalogue', hit=True)
+                return self._local
+            key = f'{CACHE_KEY}:{committed_version()}'
+            snapshot = cache.get(key)
+            record_cache('template_catalogue', hit=snapshot is not None)
+            if snapshot is None:
+                snapshot = build_snapshot()
+                cache.set(key, snapshot, getattr(settings, 'TEMPLATE_CATALOGUE_TTL', 300))
+            self._local = snapshot
+            self._expires = time.monotonic() + getattr(settings, 'TEMPLATE_CATALOGUE_LOCAL_TTL', 5)
+            return snapshot
+
+    def invalidate(self):
+        """
+        Descarta la copia local cuando se confirme la transacción en curso;
+        la compartida ya no se usa porque la versión confirmada ha cambiado
+        """
+        def clear():
+            with self._lock:
+                self._local = None
+        transaction.on_commit(clear, robust=True)
+
+
+catalogue = CatalogueCache()
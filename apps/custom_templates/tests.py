@@ -1,3 +1,210 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from apps.custom_templates.models import PhotoTemplate
+from apps.custom_templates.services.assets import (
+    AssetRef, TemplateAssetCache, asset_cache, asset_ref, compile_asset, read_asset,
+)
+from apps.custom_templates.services.catalogue import (
+    build_snapshot, catalogue, committed_version, render_previews,
+)
+from apps.security.models import User
+
+
+def template_image(name='template.png'):
+    buffer = io.BytesIO()
+    Image.new('RGBA', (400, 300), (255, 0, 0, 128)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class TemplateCatalogueTests(TestCase):
+    """El catálogo se sirve versionado, con deltas y validación condicional"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, TEMPLATE_PREVIEW_SIZES={'thumb': 64})
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        catalogue._local = None
+        self.client.force_login(User.objects.create_user('kiosk', 'kiosk@example.com', 'secret-pass'))
+
+    def create_template(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PhotoTemplate.objects.create(name=name, image=template_image(), max_photos=3)
+
+    def get(self, **params):
+        return self.client.get('/templates/catalogue/', params)
+
+    def test_full_catalogue_delta_and_not_modified(self):
+        first = self.create_template('Boda')
+        second = self.create_template('Cumple')
+
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['full'])
+        self.assertEqual([entry['id'] for entry in data['templates']], [first.id, second.id])
+        self.assertTrue(data['templates'][0]['previews']['thumb']['webp'].startswith('http://testserver/'))
+        version = data['version']
+
+        response = self.client.get('/templates/catalogue/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.name = 'Boda civil'
+            first.save()
+        removed_id = second.id
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+
+        data = self.get(since=version).json()
+        self.assertFalse(data['full'])
+        self.assertGreater(data['version'], version)
+        self.assertEqual([entry['name'] for entry in data['templates']], ['Boda civil'])
+        self.assertEqual(data['removed'], [removed_id])
+
+        data = self.get(since=data['version']).json()
+        self.assertEqual((data['templates'], data['removed']), ([], []))
+
+    def test_rebuild_racing_a_commit_is_not_served(self):
+        first = self.create_template('Boda')
+        stale = build_snapshot()
+        second = self.create_template('Cumple')
+        # Una reconstrucción que leyó antes del commit guarda su instantánea
+        # después de la invalidación: queda bajo la versión anterior
+        cache.set(f'template-catalogue:{first.catalogue_version}', stale)
+        catalogue._local = None
+        data = self.get().json()
+        self.assertEqual([entry['id'] for entry in data['templates']], [first.id, second.id])
+        self.assertEqual(data['version'], committed_version())
+
+    def test_previews_are_rendered_before_reserving_the_version(self):
+        template = self.create_template('Boda')
+        version = committed_version()
+        seen = []
+
+        def render(template):
+            seen.append(committed_version())
+            return render_previews(template)
+
+        with mock.patch('apps.custom_templates.models.render_previews', render), \
+                self.captureOnCommitCallbacks(execute=True):
+            template.name = 'Boda civil'
+            template.save()
+        # El render no tenía la secuencia bloqueada: la versión se reserva después
+        self.assertEqual(seen, [version])
+        self.assertEqual(template.catalogue_version, version + 1)
+        preview = template.previews['thumb']['jpeg']
+        self.assertTrue(preview.endswith(f'/{template.pk}-{version + 1}_thumb.jpg'))
+        directory = os.path.join(self.media, 'templates', 'previews')
+        self.assertEqual(sorted(os.listdir(directory)),
+                         [f'{template.pk}-{version + 1}_thumb.{ext}' for ext in ('jpg', 'webp')])
+
+    def test_version_is_committed_with_the_change(self):
+        template = self.create_template('Boda')
+        version = committed_version()
+        self.assertEqual(template.catalogue_version, version)
+        with mock.patch('apps.custom_templates.models.publish_previews', side_effect=OSError), \
+                self.assertRaises(OSError):
+            template.name = 'Boda civil'
+            template.save()
+        # La versión reservada se deshace con la fila: no queda un hueco sin confirmar
+        self.assertEqual(committed_version(), version)
+        directory = os.path.join(self.media, 'templates', 'previews')
+        self.assertFalse([name for name in os.listdir(directory) if name.startswith('staging-')])
+        template.refresh_from_db()
+        self.assertEqual((template.name, template.catalogue_version), ('Boda', version))
+
+
+def framed_template(path, size=(200, 100), holes=((10, 10, 90, 90), (110, 10, 190, 90))):
+    overlay = Image.new('RGBA', size, (0, 0, 255, 255))
+    for box in holes:
+        overlay.paste((0, 0, 0, 0), box)
+    overlay.save(path, 'PNG')
+    return overlay
+
+
+class TemplateAssetTests(TestCase):
+    """Assets precompilados: ida y vuelta, límite de bytes e invalidación"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, TEMPLATE_PREVIEW_SIZES={'thumb': 64})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_compile_and_read_round_trip(self):
+        source = os.path.join(self.media, 'frame.png')
+        overlay = framed_template(source)
+        target = os.path.join(self.media, 'compiled', 'frame.lsa')
+
+        slots = compile_asset(source, target)
+        self.assertEqual(slots, [(10, 10, 90, 90), (110, 10, 190, 90)])
+        asset = read_asset(target)
+        self.assertEqual(asset.size, (200, 100))
+        self.assertEqual([tuple(slot) for slot in asset.slots], slots)
+        self.assertEqual(asset.overlay.tobytes(), overlay.tobytes())
+
+    def test_invalid_asset_is_rejected(self):
+        path = os.path.join(self.media, 'broken.lsa')
+        with open(path, 'wb') as handle:
+            handle.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            read_asset(path)
+
+    def ref(self, template_id, version=1, size=(100, 100)):
+        source = os.path.join(self.media, f'{template_id}.png')
+        framed_template(source, size, holes=())
+        compiled = os.path.join(self.media, 'compiled', f'{template_id}-{version}.lsa')
+        return AssetRef(template_id, version, compiled, source)
+
+    def test_lru_is_bounded_by_pixel_bytes(self):
+        one_asset = 100 * 100 * 4
+        cache = TemplateAssetCache(max_bytes=2 * one_asset)
+        refs = [self.ref(template_id) for template_id in (1, 2, 3)]
+        cache.get(refs[0])
+        cache.get(refs[1])
+        cache.get(refs[0])  # la 1 pasa a ser la más reciente
+        cache.get(refs[2])
+        self.assertEqual(cache.current_bytes, 2 * one_asset)
+        self.assertEqual(sorted(key[0] for key in cache._entries), [1, 3])
+
+    def test_new_version_replaces_old_entry(self):
+        cache = TemplateAssetCache(max_bytes=10 * 1024 * 1024)
+        cache.get(self.ref(1, version=1))
+        cache.get(self.ref(1, version=2))
+        self.assertEqual(list(cache._entries), [(1, 2)])
+        cache.invalidate(1)
+        self.assertEqual((cache.current_bytes, len(cache._entries)), (0, 0))
+
+    def test_template_change_recompiles_and_invalidates(self):
+        path = os.path.join(self.media, 'first.png')
+        framed_template(path)
+        with open(path, 'rb') as handle:
+            template = PhotoTemplate.objects.create(
+                name='Marco', image=SimpleUploadedFile('frame.png', handle.read(), 'image/png')
+            )
+        first = asset_ref(template)
+        self.assertEqual(len(asset_cache.get(first).slots), 2)
+
+        framed_template(path, holes=((10, 10, 190, 90),))
+        with open(path, 'rb') as handle:
+            template.image = SimpleUploadedFile('frame.png', handle.read(), 'image/png')
+        template.save()
+        second = asset_ref(template)
+        self.assertNotEqual(first.version, second.version)
+        self.assertFalse(os.path.exists(first.compiled_path))
+        self.assertNotIn((template.pk, first.version), asset_cache._entries)
+        self.assertEqual(len(asset_cache.get(second).slots), 1)
@@ -0,0 +1,9 @@
+from django.urls import path
+from apps.custom_templates.views.catalogue import catalogue_view
+
+app_name = "custom_templates"
+
+# Definir patrones de URL
+urlpatterns = [
+    path("catalogue/", catalogue_view, name="catalogue"),
+]
@@ -0,0 +1,48 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from apps.core.conditional import make_etag, not_modified, set_validators
+from apps.custom_templates.services.catalogue import catalogue, catalogue_delta
+
+
+def _absolute(request, url):
+    return request.build_absolute_uri(url) if url else url
+
+
+@api_view(['GET'])
+def catalogue_view(request):
+    """
+    Catálogo de plantillas activas para los kioscos, servido desde una
+    instantánea versionada en caché. Con ?since=<versión> devuelve sólo los
+    cambios desde esa versión; con If-None-Match, 304 si no hay cambios.
+    """
+    since = request.query_params.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({"detail": _("El parámetro since debe ser un número de versión.")},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    snapshot = catalogue.get()
+    etag = make_etag(request, snapshot['version'])
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    data = catalogue_delta(snapshot, since)
+    data['templates'] = [
+        {
+            **entry,
+            'image': _absolute(request, entry['image']),
+            'previews': {
+                size: {key: _absolute(request, value) if isinstance(value, str) else value
+                       for key, value in preview.items()}
+                for size, preview in entry['previews'].items()
+            },
+        }
+        for entry in data['templates']
+    ]
+    return set_validators(Response(data), etag)
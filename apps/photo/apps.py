@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PhotoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.photo'
+
+    def ready(self):
+        from apps.photo import signals  # noqa: F401
@@ -0,0 +1,163 @@
+import asyncio
+import io
+import os
+import statistics
+import time
+
+from django.contrib.auth.decorators import login_required
+from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.http import FileResponse, Http404, JsonResponse
+from django.test import Client, override_settings
+from django.urls import path
+from PIL import Image
+
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, photo_directory_path
+from apps.photo.services.dashboard import get_dashboard_data
+from apps.photo.views.home import dashboard_view
+from apps.photo.views.media import photo_file_view
+from apps.security.models import User
+
+BENCH_USERNAME = 'bench-async'
+
+
+@login_required
+def sync_dashboard_view(request):
+    """Gemelo síncrono de dashboard_view"""
+    return JsonResponse(get_dashboard_data(request.user))
+
+
+@login_required
+def sync_photo_file_view(request, photo_id):
+    """Gemelo síncrono de photo_file_view (FileResponse en un hilo)"""
+    photo = IndividualPhoto.objects.filter(pk=photo_id, session__user=request.user).only('image').first()
+    if photo is None:
+        raise Http404
+    return FileResponse(photo.image.open('rb'))
+
+
+# URLconf propio del benchmark: cada escenario en versión síncrona y asíncrona
+urlpatterns = [
+    path('sync/dashboard/', sync_dashboard_view),
+    path('async/dashboard/', dashboard_view),
+    path('sync/photos/<uuid:photo_id>/file/', sync_photo_file_view),
+    path('async/photos/<uuid:photo_id>/file/', photo_file_view),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el rendimiento de las vistas síncronas y asíncronas bajo ASGI "
+        "con clientes lentos concurrentes (descarga de fotos y panel)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help="Clientes concurrentes")
+        parser.add_argument('--requests', type=int, default=4, help="Peticiones por cliente")
+        parser.add_argument('--delay', type=float, default=0.005,
+                            help="Segundos que tarda el cliente en leer cada bloque de la respuesta")
+        parser.add_argument('--image-size', type=int, default=1200,
+                            help="Lado en píxeles de la foto de prueba (ruido, JPEG)")
+        parser.add_argument('--host', default='localhost', help="Cabecera Host (debe estar en ALLOWED_HOSTS)")
+        parser.add_argument('--scenario', choices=['download', 'dashboard'], action='append',
+                            help="Escenario a medir (por defecto todos)")
+
+    def handle(self, *args, **options):
+        user, photo = self.create_fixture(options['image_size'])
+        try:
+            client = Client()
+            client.force_login(user)
+            cookie = f"sessionid={client.cookies['sessionid'].value}"
+            paths = {
+                'download': f'photos/{photo.pk}/file/',
+                'dashboard': 'dashboard/',
+            }
+            with override_settings(ROOT_URLCONF=__name__):
+                app = ASGIHandler()
+                for scenario in options['scenario'] or list(paths):
+                    for mode in ('sync', 'async'):
+                        result = asyncio.run(self.run_load(
+                            app, f'/{mode}/{paths[scenario]}', options['host'], cookie,
+                            options['clients'], options['requests'], options['delay'],
+                        ))
+                        self.report(scenario, mode, result)
+        finally:
+            # El borrado en cascada elimina también el fichero y ajusta el libro
+            user.delete()
+
+    def create_fixture(self, edge):
+        """Usuario, sesión y una foto de ruido (no comprime: muchos bloques)"""
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(
+            username=BENCH_USERNAME, email=f'{BENCH_USERNAME}@example.com', password=os.urandom(8).hex()
+        )
+        session = PhotoSession.objects.create(user=user, title='Benchmark')
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (edge, edge), os.urandom(edge * edge * 3)).save(buffer, 'JPEG')
+        photo = IndividualPhoto(session=session, order=0, file_size=buffer.tell(), width=edge, height=edge)
+        storage = IndividualPhoto._meta.get_field('image').storage
+        photo.image.name = storage.save(photo_directory_path(photo, 'bench.jpg'), ContentFile(buffer.getvalue()))
+        # bulk_create: sin señales ni derivados que compitan por la CPU
+        IndividualPhoto.objects.bulk_create([photo])
+        User.adjust_storage(photo.file_size, pk=user.pk)
+        return user, photo
+
+    async def run_load(self, app, path, host, cookie, clients, requests, delay):
+        latencies = []
+        statuses = []
+
+        async def client():
+            for _ in range(requests):
+                started = time.perf_counter()
+                statuses.append(await self.request(app, path, host, cookie, delay))
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return time.perf_counter() - started, latencies, statuses
+
+    @staticmethod
+    async def request(app, path, host, cookie, delay):
+        """Una petición GET contra la aplicación ASGI con un cliente que lee despacio"""
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [(b'host', host.encode()), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': (host, 80),
+        }
+        sent = False
+        disconnected = asyncio.Event()
+        status = None
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and message.get('body'):
+                await asyncio.sleep(delay)
+
+        await app(scope, receive, send)
+        disconnected.set()
+        return status
+
+    def report(self, scenario, mode, result):
+        elapsed, latencies, statuses = result
+        errors = sum(1 for status in statuses if status != 200)
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{scenario:<10} {mode:<6} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+            f"{elapsed:6.2f}s  errores {errors}"
+        )
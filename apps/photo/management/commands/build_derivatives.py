@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.photo.models import IndividualPhoto, CompositePhoto
+from apps.photo.services.derivatives import submit_derivatives
+from apps.photo.services.pool import shutdown_process_pool
+
+
+class Command(BaseCommand):
+    help = "Genera los derivados (miniaturas JPEG/WebP) de las fotos que aún no los tienen"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Número máximo de fotos a procesar por modelo")
+
+    def handle(self, *args, **options):
+        for model in (IndividualPhoto, CompositePhoto):
+            pending = model.objects.filter(derivatives={}).exclude(image='').only(
+                'id', 'session_id', 'image', 'derivatives'
+            )
+            if options['limit']:
+                pending = pending[:options['limit']]
+            futures = [submit_derivatives(photo) for photo in pending.iterator()]
+            failed = sum(1 for future in futures if future.exception() is not None)
+            self.stdout.write(f"{model.__name__}: {len(futures)} fotos procesadas, {failed} con error")
+        # Espera a que los callbacks guarden el resultado en la base de datos
+        shutdown_process_pool(wait=True)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.photo.models import IndividualPhoto
+from apps.photo.services.collector import MediaCollector
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina del disco los blobs de fotos que llevan más del margen sin "
+        "referencias, junto con sus derivados y los temporales abandonados"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Blobs borrados por transacción")
+        parser.add_argument('--grace-hours', type=float,
+                            default=getattr(settings, 'MEDIA_BLOB_GRACE_HOURS', 24),
+                            help="Horas sin referencias antes de borrar un blob")
+        parser.add_argument('--recount', action='store_true',
+                            help="Recalcula las referencias desde las filas de fotos antes de borrar")
+        parser.add_argument('--orphans', action='store_true',
+                            help="Recorre los directorios de blobs buscando ficheros sin fila")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Sólo informa de lo que se borraría")
+
+    def handle(self, *args, **options):
+        collector = MediaCollector(
+            IndividualPhoto._meta.get_field('image').storage,
+            grace=timezone.timedelta(hours=options['grace_hours']),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        stats = collector.run(recount=options['recount'], orphans=options['orphans'])
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(prefix + stats.summary()))
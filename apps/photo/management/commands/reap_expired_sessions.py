@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.photo.services.reaper import SessionReaper
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca como caducadas las sesiones no completadas cuyo expires_at ya pasó "
+        "y elimina en lotes sus filas y ficheros"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Sesiones borradas por transacción")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="Hilos para borrar ficheros")
+        parser.add_argument('--grace-hours', type=float, default=0,
+                            help="Horas que se conserva una sesión caducada antes de borrarla")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Sólo informa de lo que se borraría")
+
+    def handle(self, *args, **options):
+        reaper = SessionReaper(
+            batch_size=options['batch_size'],
+            threads=options['threads'],
+            grace=timezone.timedelta(hours=options['grace_hours']),
+            dry_run=options['dry_run'],
+        )
+        stats = reaper.run()
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(prefix + stats.summary()))
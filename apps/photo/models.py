@@ -1,10 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid
 import os
 from apps.custom_sessions.models import PhotoSession
-from apps.core.utils import safe_delete_file
+from apps.photo.services.derivatives import FORMATS, schedule_derivatives
+from apps.photo.storage import media_storage
 
+# Con el storage por contenido (apps.photo.storage) estas rutas sólo aportan
+# la extensión: el nombre final es el del blob, blobs/<ab>/<cd>/<sha256>.<ext>
 def session_directory_path(instance, filename):
     """Define la ruta donde se guardarán los archivos de sesión"""
     return f'sessions/{instance.session.id}/{filename}'
@@ -13,7 +18,90 @@ def photo_directory_path(instance, filename):
     """Define la ruta donde se guardarán las fotos individuales"""
     return f'sessions/{instance.session.id}/photos/{filename}'
 
-class IndividualPhoto(models.Model):
+class ImageMetadataMixin(models.Model):
+    """Metadatos del fichero guardados en la fila para no consultar el disco"""
+    file_size = models.PositiveBigIntegerField(_('tamaño en bytes'), default=0, editable=False)
+    width = models.PositiveIntegerField(_('ancho'), blank=True, null=True, editable=False)
+    height = models.PositiveIntegerField(_('alto'), blank=True, null=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """
+        Sobrescribe save para registrar tamaño y dimensiones del fichero al
+        crearlo. Un fichero nuevo se guarda en pre_save, dentro de esta
+        transacción: la referencia al blob se confirma o se deshace con la fila.
+        """
+        if self.image and not self.file_size:
+            try:
+                self.file_size = self.image.size
+            except OSError:
+                self.file_size = 0
+        if self.image and self.width is None:
+            try:
+                self.width, self.height = self.image.width, self.image.height
+            except (OSError, TypeError):
+                pass
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+class DerivativesMixin(models.Model):
+    """Campos y utilidades comunes para fotos con versiones redimensionadas"""
+    derivatives = models.JSONField(_('derivados'), default=dict, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """
+        Sobrescribe save para programar la generación de derivados de una
+        foto nueva. El mapa de derivados sólo lo escribe el worker con un
+        UPDATE, así que el UPDATE de un save() sin update_fields no lo
+        incluye (_do_update): si no, una instancia cargada antes lo pisaría
+        con el valor viejo ({}). Con update_fields explícitos se respetan.
+        """
+        adding = self._state.adding
+        self._keep_derivatives = kwargs.get('update_fields') is None
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            self._keep_derivatives = False
+        if adding:
+            schedule_derivatives(self)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Sólo se quita derivatives del UPDATE: los campos diferidos los sigue
+        # gestionando Django y, si la fila ya no existe, save() hace el INSERT
+        # completo como siempre
+        if getattr(self, '_keep_derivatives', False):
+            values = [value for value in values if value[0].name != 'derivatives']
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+    def file_names(self):
+        """Nombres en el storage del original y de todos sus derivados"""
+        names = [self.image.name] if self.image else []
+        for entry in (self.derivatives or {}).values():
+            names.extend(entry[fmt] for fmt in FORMATS if entry.get(fmt))
+        return names
+
+    def derivative_url(self, size, fmt='jpeg'):
+        """URL del derivado pedido o del original si aún no se ha generado"""
+        name = self.derivatives.get(size, {}).get(fmt)
+        if name:
+            return self.image.storage.url(name)
+        return self.image.url if self.image else None
+
+    def srcset(self, fmt='jpeg'):
+        """Atributo srcset con todos los derivados disponibles de un formato"""
+        storage = self.image.storage
+        return ', '.join(
+            f"{storage.url(entry[fmt])} {entry['width']}w"
+            for entry in sorted(self.derivatives.values(), key=lambda entry: entry['width'])
+            if entry.get(fmt)
+        )
+
+class IndividualPhoto(ImageMetadataMixin, DerivativesMixin):
     """Modelo para cada foto individual tomada en la sesión"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     session = models.ForeignKey(
@@ -22,9 +110,11 @@ class IndividualPhoto(models.Model):
         related_name='photos', 
         on_delete=models.CASCADE
     )
-    image = models.ImageField(_('imagen'), upload_to=photo_directory_path)
+    image = models.ImageField(_('imagen'), upload_to=photo_directory_path, storage=media_storage)
     order = models.IntegerField(_('orden'), default=0)
     created_at = models.DateTimeField(_('fecha de creación'), auto_now_add=True)
+    # También lo actualizan los UPDATE de derivados: forma parte del ETag del detalle de la sesión
+    updated_at = models.DateTimeField(_('fecha de actualización'), auto_now=True)
     
     class Meta:
         verbose_name = _('foto individual')
@@ -34,13 +124,7 @@ class IndividualPhoto(models.Model):
     def __str__(self):
         return f"Foto {self.order} - {self.session}"
     
-    def delete(self, *args, **kwargs):
-        """Sobrescribe delete para eliminar también el archivo físico"""
-        if self.image:
-            safe_delete_file(self.image.path)
-        super().delete(*args, **kwargs)
-
-class CompositePhoto(models.Model):
+class CompositePhoto(ImageMetadataMixin, DerivativesMixin):
     """Modelo para la foto compuesta final (unión de varias fotos)"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     session = models.ForeignKey(
@@ -49,8 +133,9 @@ class CompositePhoto(models.Model):
         related_name='composites', 
         on_delete=models.CASCADE
     )
-    image = models.ImageField(_('imagen'), upload_to=session_directory_path)
+    image = models.ImageField(_('imagen'), upload_to=session_directory_path, storage=media_storage)
     created_at = models.DateTimeField(_('fecha de creación'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('fecha de actualización'), auto_now=True)
     
     class Meta:
         verbose_name = _('foto compuesta')
@@ -59,9 +144,87 @@ class CompositePhoto(models.Model):
     
     def __str__(self):
         return f"Composite de {self.session}"
+
+class MediaBlob(models.Model):
+    """Fichero guardado por contenido y número de fotos que lo referencian"""
+    digest = models.CharField(_('SHA-256'), max_length=64, primary_key=True)
+    name = models.CharField(_('nombre'), max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(_('tamaño en bytes'), default=0)
+    references = models.PositiveIntegerField(_('referencias'), default=0)
+    released_at = models.DateTimeField(_('sin referencias desde'), blank=True, null=True, db_index=True)
+    # Última referencia tomada: collect_media --recount sólo rebaja las de más
+    # cuando son más antiguas que el margen
+    retained_at = models.DateTimeField(_('última referencia'), default=timezone.now)
+    # Derivados comunes a todas las fotos del blob: una foto repetida los
+    # copia de aquí con una lectura por clave primaria
+    derivatives = models.JSONField(_('derivados'), default=dict, blank=True, editable=False)
+    created_at = models.DateTimeField(_('fecha de creación'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('blob')
+        verbose_name_plural = _('blobs')
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+def upload_temp_directory():
+    """Directorio de ficheros parciales; dentro de MEDIA_ROOT para poder renombrar de forma atómica"""
+    return getattr(settings, 'PHOTO_UPLOAD_TEMP_DIR', None) or os.path.join(
+        settings.MEDIA_ROOT, 'uploads', 'tmp'
+    )
+
+class PhotoUpload(models.Model):
+    """Subida por fragmentos y reanudable de una foto individual"""
+    STATUS_PENDING = 'pending'
+    STATUS_COMPLETED = 'completed'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pendiente')),
+        (STATUS_COMPLETED, _('Completada')),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session = models.ForeignKey(
+        PhotoSession,
+        verbose_name=_('sesión'),
+        related_name='uploads',
+        on_delete=models.CASCADE
+    )
+    photo = models.OneToOneField(
+        IndividualPhoto,
+        verbose_name=_('foto'),
+        related_name='upload',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True
+    )
+    filename = models.CharField(_('nombre de fichero'), max_length=255)
+    order = models.IntegerField(_('orden'), default=0)
+    total_size = models.PositiveBigIntegerField(_('tamaño total'))
+    received = models.PositiveBigIntegerField(_('bytes recibidos'), default=0)
+    checksum = models.CharField(_('SHA-256'), max_length=64)
+    status = models.CharField(
+        _('estado'),
+        max_length=15,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    created_at = models.DateTimeField(_('fecha de creación'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('fecha de actualización'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('subida de foto')
+        verbose_name_plural = _('subidas de fotos')
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Subida {self.filename} ({self.received}/{self.total_size})"
+    
+    @property
+    def temp_path(self):
+        """Ruta del fichero parcial donde se van añadiendo los fragmentos"""
+        return os.path.join(upload_temp_directory(), f'{self.id.hex}.part')
     
-    def delete(self, *args, **kwargs):
-        """Sobrescribe delete para eliminar también el archivo físico"""
-        if self.image:
-            safe_delete_file(self.image.path)
-        super().delete(*args, **kwargs)
\ No newline at end of file
+    @property
+    def is_complete(self):
+        return self.received >= self.total_size
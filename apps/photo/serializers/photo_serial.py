@@ -0,0 +1,118 @@
+import os
+
+from django.conf import settings
+from django.utils.text import get_valid_filename
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+from apps.core.serializers import SparseFieldsMixin
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto, PhotoUpload
+from apps.photo.services.derivatives import FORMATS
+
+
+class DerivativeImageMixin(serializers.Serializer):
+    """
+    Expone la imagen en el tamaño adecuado en lugar del original.
+    El cliente puede pedir ?size=thumb|medium|large y ?format=jpeg|webp;
+    'derivatives' incluye todas las URLs para construir un srcset.
+    """
+    default_size = 'medium'
+
+    image_url = serializers.SerializerMethodField()
+    derivatives = serializers.SerializerMethodField()
+
+    def _absolute(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request and url else url
+
+    def get_image_url(self, obj):
+        """URL del derivado solicitado (o del original si aún no existe)."""
+        request = self.context.get('request')
+        size = self.default_size
+        fmt = 'jpeg'
+        if request is not None:
+            size = request.query_params.get('size', size)
+            fmt = request.query_params.get('format', fmt)
+        if size == 'original':
+            return self._absolute(obj.image.url)
+        return self._absolute(obj.derivative_url(size, fmt if fmt in FORMATS else 'jpeg'))
+
+    def get_derivatives(self, obj):
+        """URLs y dimensiones de todos los derivados generados."""
+        storage = obj.image.storage
+        return {
+            size: {
+                key: self._absolute(storage.url(value)) if key in FORMATS else value
+                for key, value in entry.items()
+            }
+            for size, entry in obj.derivatives.items()
+        }
+
+
+class IndividualPhotoSerializer(SparseFieldsMixin, DerivativeImageMixin, serializers.ModelSerializer):
+    """
+    Serializer de lectura para las fotos individuales de una sesión.
+    """
+    default_size = 'thumb'
+
+    class Meta:
+        model = IndividualPhoto
+        fields = ['id', 'session', 'order', 'image_url', 'derivatives', 'created_at']
+        read_only_fields = fields
+
+
+class CompositePhotoSerializer(SparseFieldsMixin, DerivativeImageMixin, serializers.ModelSerializer):
+    """
+    Serializer de lectura para la foto compuesta final.
+    """
+
+    class Meta:
+        model = CompositePhoto
+        fields = ['id', 'session', 'image_url', 'derivatives', 'created_at']
+        read_only_fields = fields
+
+
+class PhotoUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer para iniciar y consultar una subida por fragmentos.
+    El cliente declara el tamaño total y el SHA-256 del fichero completo.
+    """
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = PhotoUpload
+        fields = ['id', 'session', 'filename', 'order', 'total_size', 'checksum',
+                  'offset', 'status', 'photo', 'created_at']
+        read_only_fields = ['id', 'offset', 'status', 'photo', 'created_at']
+
+    def validate_session(self, value):
+        """Sólo el dueño de la sesión puede subir fotos a ella."""
+        request = self.context['request']
+        if value.user_id != request.user.id:
+            raise serializers.ValidationError(_("No puede subir fotos a esta sesión."))
+        if value.status in (PhotoSession.STATUS_COMPLETED, PhotoSession.STATUS_EXPIRED):
+            raise serializers.ValidationError(_("La sesión ya no admite fotos."))
+        return value
+
+    def validate_filename(self, value):
+        """Normaliza el nombre del fichero para usarlo en la ruta de destino."""
+        return get_valid_filename(os.path.basename(value))
+
+    def validate_checksum(self, value):
+        """Valida que la suma sea un SHA-256 hexadecimal."""
+        value = value.lower()
+        if len(value) != 64 or any(char not in '0123456789abcdef' for char in value):
+            raise serializers.ValidationError(_("Debe ser un SHA-256 en hexadecimal."))
+        return value
+
+    def validate_total_size(self, value):
+        """Comprueba el tamaño máximo permitido y la cuota del usuario."""
+        max_size = getattr(settings, 'PHOTO_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(
+                _("El tamaño debe estar entre 1 y %(max)s bytes.") % {'max': max_size}
+            )
+        if not self.context['request'].user.has_storage_for(value):
+            raise serializers.ValidationError(_("Se ha superado la cuota de almacenamiento."))
+        return value
@@ -0,0 +1,154 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.files.images import get_image_dimensions
+from django.db import transaction
+from django.utils.text import get_valid_filename
+from django.utils.translation import gettext_lazy as _
+
+from apps.custom_sessions.models import PhotoSession, SessionSettings
+from apps.photo.models import IndividualPhoto, photo_directory_path
+from apps.photo.services.compositor import schedule_composite
+from apps.photo.services.derivatives import schedule_derivatives
+from apps.photo.signals import publish_photo_event, refresh_dashboard
+from apps.security.models import User
+
+
+def expected_photos(session):
+    """Número de fotos que espera la sesión según su configuración"""
+    try:
+        return session.settings.num_photos
+    except ObjectDoesNotExist:
+        return SessionSettings._meta.get_field('num_photos').default
+
+
+def check_capacity(session, first_order, count, expected):
+    """La sesión sigue abierta y caben `count` fotos a partir de first_order"""
+    if session.status in (PhotoSession.STATUS_COMPLETED, PhotoSession.STATUS_EXPIRED):
+        raise ValidationError(_("La sesión ya no admite fotos."), code='session_closed')
+    if not count or first_order + count > expected:
+        raise ValidationError(
+            _("La sesión admite %(expected)s fotos.") % {'expected': expected},
+            code='photo_count'
+        )
+
+
+def validate_capture(session, files):
+    """
+    Comprueba estado, número de fotos y cuota; devuelve (primer orden, esperadas).
+    Es una comprobación previa para no escribir ficheros en balde: la que
+    cuenta se repite en commit_capture con la sesión bloqueada y la cuota
+    reservada con un UPDATE condicional.
+    """
+    first_order = session.photos.count()
+    expected = expected_photos(session)
+    check_capacity(session, first_order, len(files), expected)
+
+    if session.user_id:
+        User.objects.only('storage_used', 'storage_quota').get(pk=session.user_id) \
+            .check_storage_quota(sum(upload.size for upload in files))
+    return first_order, expected
+
+
+def write_capture_files(session, files, first_order):
+    """
+    Copia los ficheros a temporales del storage, todavía sin referencias, y
+    devuelve las fotos aún sin guardar junto con esos temporales
+    """
+    photos, staged = [], []
+    storage = IndividualPhoto._meta.get_field('image').storage
+    try:
+        for order, upload in enumerate(files, start=first_order):
+            width, height = get_image_dimensions(upload)
+            if width is None:
+                raise ValidationError(
+                    _("El fichero %(name)s no es una imagen válida.") % {'name': upload.name},
+                    code='invalid_image'
+                )
+            photo = IndividualPhoto(
+                session=session, order=order,
+                file_size=upload.size, width=width, height=height,
+            )
+            staged.append(storage.stage(upload, photo_directory_path(photo, get_valid_filename(upload.name))))
+            photos.append(photo)
+    except Exception:
+        discard_capture_files(staged)
+        raise
+    return photos, staged
+
+
+def discard_capture_files(staged):
+    IndividualPhoto._meta.get_field('image').storage.discard_staged(staged)
+
+
+def commit_capture(session, photos, staged, expected, composite=False):
+    """
+    Inserta las fotos y actualiza libro, blobs y estado en una única
+    transacción. La fila de la sesión se bloquea y el recuento se repite
+    dentro: dos envíos a la vez (o el reintento de un kiosco) se serializan
+    aquí, y el segundo recibe los órdenes siguientes o se rechaza si ya no
+    caben. La cuota se reserva con un UPDATE condicional, que no deja pasar
+    a la vez dos envíos del mismo usuario en sesiones distintas. Las
+    referencias a los blobs se toman con consultas por conjuntos en la misma
+    transacción que las filas.
+    """
+    storage = IndividualPhoto._meta.get_field('image').storage
+    with transaction.atomic():
+        session.status = PhotoSession.objects.select_for_update() \
+            .values_list('status', flat=True).get(pk=session.pk)
+        first_order = session.photos.count()
+        check_capacity(session, first_order, len(photos), expected)
+        if session.user_id:
+            User.reserve_storage(sum(photo.file_size for photo in photos), pk=session.user_id)
+        names = storage.retain_staged(staged)
+        for order, (photo, name) in enumerate(zip(photos, names), start=first_order):
+            photo.order = order
+            photo.image.name = name
+        IndividualPhoto.objects.bulk_create(photos)
+        if photos[0].order + len(photos) >= expected:
+            session.mark_completed()
+        elif session.status == PhotoSession.STATUS_CREATED:
+            session.mark_in_progress()
+        # bulk_create no envía señales: el panel del dueño se invalida aquí
+        refresh_dashboard(session.user_id)
+        for photo in photos:
+            schedule_derivatives(photo)
+            publish_photo_event(photo)
+        if composite and session.status == PhotoSession.STATUS_COMPLETED:
+            schedule_composite(session)
+
+
+def submit_capture(session, files, composite=False):
+    """
+    Guarda de una vez todas las fotos de una sesión.
+    Los ficheros se copian a temporales y las filas se insertan con un único
+    bulk_create; referencias a los blobs, libro de almacenamiento y estado
+    de la sesión se actualizan en la misma transacción. bulk_create no llama
+    a save() ni a las señales, por eso metadatos, libro, derivados y eventos
+    se gestionan aquí.
+    """
+    first_order, expected = validate_capture(session, files)
+    photos, staged = write_capture_files(session, files, first_order)
+    try:
+        commit_capture(session, photos, staged, expected, composite)
+    finally:
+        # Los blobs ya tienen su enlace (o la transacción se deshizo): los
+        # temporales sobran en cualquier caso
+        discard_capture_files(staged)
+    return photos
+
+
+async def asubmit_capture(session, files, composite=False):
+    """
+    Versión asíncrona de submit_capture: las consultas van por el executor
+    de Django y la escritura de ficheros por un hilo aparte, de modo que
+    el event loop y el hilo de la base de datos no esperan al disco.
+    """
+    first_order, expected = await sync_to_async(validate_capture)(session, files)
+    photos, staged = await asyncio.to_thread(write_capture_files, session, files, first_order)
+    try:
+        await sync_to_async(commit_capture)(session, photos, staged, expected, composite)
+    finally:
+        await asyncio.to_thread(discard_capture_files, staged)
+    return photos
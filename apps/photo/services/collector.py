@@ -0,0 +1,163 @@
+import logging
+import os
+import time
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from apps.photo.models import IndividualPhoto, CompositePhoto, MediaBlob
+from apps.photo.storage import BLOB_PREFIX, TEMP_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+
+class CollectorStats:
+    """Contadores de una pasada de recogida de basura"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.blobs = 0
+        self.bytes = 0
+        self.temp_files = 0
+        self.orphans = 0
+        self.undercounted = 0
+        self.overcounted = 0
+        self.lowered = 0
+
+    def summary(self):
+        return (
+            f"{self.blobs} blobs sin referencias borrados ({self.bytes / (1024 * 1024):.1f} MB), "
+            f"{self.temp_files} temporales, {self.orphans} ficheros sin fila; "
+            f"recuento: {self.undercounted} con referencias de menos (corregidos), "
+            f"{self.overcounted} con referencias de más ({self.lowered} rebajados); "
+            f"{time.perf_counter() - self.started:.2f}s"
+        )
+
+
+class MediaCollector:
+    """
+    Borra del disco los blobs que llevan más de `grace` sin referencias.
+    Cada blob se borra de la tabla con un DELETE condicionado a que siga sin
+    referencias y el fichero se elimina antes del commit: una subida con el
+    mismo contenido espera al bloqueo de la fila y, al no encontrarla,
+    vuelve a crear blob y fichero. El margen cubre además a los lectores
+    que aún tengan el nombre en memoria.
+    """
+
+    def __init__(self, storage, grace, batch_size=500, dry_run=False):
+        self.storage = storage
+        self.grace = grace
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stats = CollectorStats()
+
+    def run(self, recount=False, orphans=False):
+        cutoff = timezone.now() - self.grace
+        if recount:
+            self.recount(cutoff)
+        self.sweep(cutoff)
+        self.remove_stale_temp(cutoff)
+        if orphans:
+            self.remove_orphans(cutoff)
+        return self.stats
+
+    def collectable(self, cutoff):
+        return MediaBlob.objects.filter(references=0, released_at__lt=cutoff)
+
+    def sweep(self, cutoff):
+        if self.dry_run:
+            for size in self.collectable(cutoff).values_list('size', flat=True).iterator():
+                self.stats.blobs += 1
+                self.stats.bytes += size
+            return
+        while True:
+            batch = list(
+                self.collectable(cutoff).order_by('released_at')
+                .values_list('digest', 'name', 'size')[:self.batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                for digest, name, size in batch:
+                    if MediaBlob.objects.filter(pk=digest, references=0).delete()[0]:
+                        self.storage.remove_blob(name)
+                        self.stats.blobs += 1
+                        self.stats.bytes += size
+            if len(batch) < self.batch_size:
+                break
+
+    def recount(self, cutoff):
+        """
+        Recalcula las referencias a partir de las filas de fotos. Las que se
+        quedaron cortas, que son las peligrosas, se suben siempre. Las que
+        sobran (una referencia tomada fuera de la transacción de su fila que
+        nunca llegó a guardarse) sólo se rebajan si la última referencia es
+        anterior al margen: una subida reciente aún puede estar confirmando.
+        Cada corrección va condicionada a que el blob no haya cambiado.
+        """
+        counts = {}
+        for model in (IndividualPhoto, CompositePhoto):
+            rows = model.objects.filter(image__startswith=BLOB_PREFIX).order_by() \
+                .values_list('image').annotate(total=Count('pk'))
+            for name, total in rows.iterator():
+                counts[name] = counts.get(name, 0) + total
+        stored = MediaBlob.objects.values_list('name', 'references', 'retained_at').order_by().iterator()
+        for name, references, retained_at in stored:
+            actual = counts.get(name, 0)
+            if references > actual:
+                self.stats.overcounted += 1
+                if retained_at < cutoff and not self.dry_run:
+                    self.stats.lowered += MediaBlob.objects.filter(
+                        name=name, references=references, retained_at=retained_at
+                    ).update(references=actual, released_at=None if actual else timezone.now())
+            elif references < actual:
+                self.stats.undercounted += 1
+                if not self.dry_run:
+                    MediaBlob.objects.filter(name=name).update(
+                        references=F('references') + (actual - references), released_at=None
+                    )
+        if self.stats.undercounted:
+            logger.warning("collect_media: %s blobs con referencias de menos", self.stats.undercounted)
+
+    def _old_files(self, directory, cutoff):
+        limit = cutoff.timestamp()
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < limit:
+                yield entry
+
+    def remove_stale_temp(self, cutoff):
+        """Temporales de subidas que murieron a mitad de la copia"""
+        for entry in self._old_files(self.storage.path(TEMP_DIRECTORY), cutoff):
+            self.stats.temp_files += 1
+            if not self.dry_run:
+                os.remove(entry.path)
+
+    def remove_orphans(self, cutoff):
+        """
+        Recorre los directorios de blobs buscando ficheros sin fila (p. ej.
+        de una transacción deshecha). Es la única parte que lista el disco:
+        sólo se usa bajo demanda y un directorio de shard cada vez.
+        """
+        root = self.storage.path(BLOB_PREFIX)
+        if not os.path.isdir(root):
+            return
+        for first in sorted(os.listdir(root)):
+            if first == os.path.basename(TEMP_DIRECTORY):
+                continue
+            for second in sorted(os.listdir(os.path.join(root, first))):
+                entries = {
+                    os.path.splitext(entry.name)[0]: entry
+                    for entry in self._old_files(os.path.join(root, first, second), cutoff)
+                }
+                known = set(MediaBlob.objects.filter(digest__in=list(entries)).values_list('digest', flat=True))
+                for digest, entry in entries.items():
+                    if digest in known:
+                        continue
+                    self.stats.orphans += 1
+                    if not self.dry_run:
+                        self.storage.remove_blob(f'{BLOB_PREFIX}{first}/{second}/{entry.name}')
@@ -0,0 +1,135 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, BigIntegerField, JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from apps.core.metrics import record_cache
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto
+from apps.security.models import User
+
+RECENT_SESSIONS = 3
+CACHE_PREFIX = 'dashboard:'
+
+
+def _cache_key(user_id):
+    return f'{CACHE_PREFIX}{user_id}'
+
+
+def _cache_ttl():
+    return getattr(settings, 'DASHBOARD_CACHE_TTL', 300)
+
+
+def _aggregate(queryset, group_by, expression):
+    """Subconsulta escalar agregada, sin el ORDER BY por defecto del modelo"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_by).annotate(value=expression).values('value')[:1],
+            output_field=BigIntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def _totals(user):
+    user_photos = IndividualPhoto.objects.filter(session__user=OuterRef('pk'))
+    return User.objects.filter(pk=user.pk).annotate(
+        total_albums=_aggregate(
+            PhotoSession.objects.filter(user=OuterRef('pk')), 'user', Count('pk')
+        ),
+        total_memories=_aggregate(user_photos, 'session__user', Count('pk')),
+    ).values('total_albums', 'total_memories', 'storage_used', 'storage_quota')
+
+
+def _recent_sessions(user):
+    latest_composite = CompositePhoto.objects.filter(session=OuterRef('pk')).order_by('-created_at')
+    return (
+        PhotoSession.objects.filter(user=user)
+        .order_by('-created_at')
+        .only('id', 'title', 'access_code', 'created_at')
+        .annotate(
+            photo_count=_aggregate(
+                IndividualPhoto.objects.filter(session=OuterRef('pk')), 'session', Count('pk')
+            ),
+            cover_name=Subquery(latest_composite.values('image')[:1]),
+            cover_derivatives=Subquery(
+                latest_composite.values('derivatives')[:1], output_field=JSONField()
+            ),
+        )[:RECENT_SESSIONS]
+    )
+
+
+def _build(totals, recent_sessions):
+    storage = CompositePhoto._meta.get_field('image').storage
+    recent_albums = []
+    for session in recent_sessions:
+        cover_image = None
+        if session.cover_name:
+            medium = (session.cover_derivatives or {}).get('medium', {}).get('jpeg')
+            cover_image = storage.url(medium or session.cover_name)
+        recent_albums.append({
+            'name': session.title or f'Session {session.access_code}',
+            'cover_image': cover_image,
+            'photo_count': session.photo_count,
+            'created_at': session.created_at,
+        })
+
+    ledger = User(storage_used=totals['storage_used'], storage_quota=totals['storage_quota'])
+    return {
+        'total_albums': totals['total_albums'],
+        'total_memories': totals['total_memories'],
+        'storage_used': ledger.storage_usage_percent,
+        'recent_albums': recent_albums,
+    }
+
+
+def load_dashboard_data(user):
+    """
+    Reúne los datos del panel de inicio con un número fijo de consultas
+    (dos), independientemente de cuántas sesiones y fotos tenga el usuario.
+    El almacenamiento sale del libro del usuario, nunca del sistema de ficheros.
+    Lee de la primaria y no de la réplica: el resultado rellena la caché
+    compartida justo después de cada invalidación, y con datos de una réplica
+    retrasada el panel viejo se serviría a todos los workers durante el TTL.
+    """
+    return _build(_totals(user).get(), list(_recent_sessions(user)))
+
+
+async def aload_dashboard_data(user):
+    """Versión asíncrona de load_dashboard_data con el ORM asíncrono"""
+    totals = await _totals(user).aget()
+    return _build(totals, [session async for session in _recent_sessions(user)])
+
+
+def get_dashboard_data(user):
+    """
+    Datos del panel de inicio servidos desde la caché compartida; sólo un
+    fallo va a la base de datos. Las señales de sesiones y fotos borran la
+    entrada del usuario (invalidate_dashboard), y DASHBOARD_CACHE_TTL acota
+    lo que pueda quedar de cambios que no pasan por ellas.
+    """
+    key = _cache_key(user.pk)
+    data = cache.get(key)
+    record_cache('dashboard', hit=data is not None)
+    if data is None:
+        data = load_dashboard_data(user)
+        cache.set(key, data, _cache_ttl())
+    return data
+
+
+async def aget_dashboard_data(user):
+    """Versión asíncrona de get_dashboard_data"""
+    key = _cache_key(user.pk)
+    data = await cache.aget(key)
+    record_cache('dashboard', hit=data is not None)
+    if data is None:
+        data = await aload_dashboard_data(user)
+        await cache.aset(key, data, _cache_ttl())
+    return data
+
+
+def invalidate_dashboard(*user_ids):
+    """Elimina de la caché los datos del panel de los usuarios indicados"""
+    keys = [_cache_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        cache.delete_many(keys)
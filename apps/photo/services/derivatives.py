@@ -0,0 +1,175 @@
+import logging
+import os
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from apps.photo.services.pool import get_process_pool
+
+logger = logging.getLogger(__name__)
+
+# Lado mayor en píxeles de cada tamaño derivado
+DEFAULT_SIZES = {
+    'thumb': 320,
+    'medium': 800,
+    'large': 1600,
+}
+
+# formato lógico -> (formato PIL, extensión)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+
+
+def derivative_sizes():
+    return getattr(settings, 'PHOTO_DERIVATIVE_SIZES', DEFAULT_SIZES)
+
+
+def _digest(instance):
+    """SHA-256 del original si está en el storage por contenido"""
+    storage = instance.image.storage
+    return storage.digest(instance.image.name) if hasattr(storage, 'digest') else None
+
+
+def derivative_directory(instance):
+    """
+    Los derivados de un blob por contenido son comunes a todas las fotos que
+    lo usan; los de nombres antiguos se guardan junto a la sesión.
+    """
+    if _digest(instance):
+        return instance.image.storage.derivative_directory(instance.image.name)
+    return f'sessions/{instance.session_id}/derivatives'
+
+
+def render_derivatives(source_path, target_dir, basename, sizes, quality=82):
+    """
+    Genera todos los tamaños y formatos de una imagen en el pool de procesos.
+    Escribe los ficheros en target_dir y devuelve, por tamaño, las dimensiones
+    y el nombre de fichero de cada formato.
+    """
+    image = Image.open(source_path)
+    image.draft('RGB', (max(sizes.values()),) * 2)
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    os.makedirs(target_dir, exist_ok=True)
+
+    result = {}
+    # Del mayor al menor, reduciendo cada vez desde el derivado anterior
+    for size, edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        entry = {'width': image.width, 'height': image.height}
+        for fmt, (pil_format, extension) in FORMATS.items():
+            filename = f'{basename}_{size}.{extension}'
+            options = {'quality': quality}
+            if pil_format == 'JPEG':
+                options.update(progressive=True, optimize=True)
+            else:
+                options.update(method=4)
+            # Fotos con el mismo contenido comparten directorio: temporal por proceso
+            temp_path = os.path.join(target_dir, f'.{filename}.{os.getpid()}.tmp')
+            image.save(temp_path, pil_format, **options)
+            os.replace(temp_path, os.path.join(target_dir, filename))
+            entry[fmt] = filename
+        result[size] = entry
+    return result
+
+
+def _refresh_cover(model, pk):
+    """El derivado medio de un composite es la portada del panel de su dueño"""
+    from apps.photo.models import CompositePhoto
+    from apps.photo.services.dashboard import invalidate_dashboard
+
+    if model is CompositePhoto:
+        invalidate_dashboard(*model.objects.filter(pk=pk).values_list('session__user', flat=True))
+
+
+def _store_result(model, pk, directory, future, digest=None):
+    """Guarda en la fila (y en su blob) el mapa de derivados cuando el worker termina"""
+    try:
+        rendered = future.result()
+    except Exception:
+        logger.exception("Error generando derivados de %s %s", model.__name__, pk)
+        return
+    derivatives = {
+        size: {
+            key: f'{directory}/{value}' if key in FORMATS else value
+            for key, value in entry.items()
+        }
+        for size, entry in rendered.items()
+    }
+    try:
+        if not model.objects.filter(pk=pk).update(derivatives=derivatives, updated_at=timezone.now()):
+            # La foto se borró mientras se generaban: se descartan los ficheros
+            storage = model._meta.get_field('image').storage
+            for entry in derivatives.values():
+                for fmt in FORMATS:
+                    storage.delete(entry[fmt])
+        else:
+            if digest:
+                _store_blob_derivatives(digest, derivatives)
+            _refresh_cover(model, pk)
+    finally:
+        # El callback corre en un hilo del executor, no en una petición
+        connection.close()
+
+
+def submit_derivatives(instance):
+    """Envía la generación de derivados al pool de procesos"""
+    storage = instance.image.storage
+    directory = derivative_directory(instance)
+    digest = _digest(instance)
+    future = get_process_pool().submit(
+        render_derivatives,
+        instance.image.path,
+        storage.path(directory),
+        digest or instance.pk.hex,
+        derivative_sizes(),
+        getattr(settings, 'PHOTO_DERIVATIVE_QUALITY', 82),
+    )
+    future.add_done_callback(
+        lambda done: _store_result(type(instance), instance.pk, directory, done, digest)
+    )
+    return future
+
+
+def schedule_derivatives(instance):
+    """
+    Programa la generación de derivados una vez confirmada la transacción,
+    fuera del camino de la petición. No hace nada si ya existen.
+    """
+    if instance.image and not instance.derivatives:
+        transaction.on_commit(lambda: reuse_derivatives(instance) or submit_derivatives(instance), robust=True)
+
+
+def _store_blob_derivatives(digest, derivatives):
+    from apps.photo.models import MediaBlob
+
+    MediaBlob.objects.filter(pk=digest).update(derivatives=derivatives)
+
+
+def reuse_derivatives(instance):
+    """
+    Un reintento o una foto repetida comparte blob con otra fila: se copia el
+    mapa de derivados guardado en el blob (lectura por clave primaria) en
+    lugar de volver a generarlos. Devuelve True si pudo.
+    """
+    from apps.photo.models import MediaBlob
+
+    digest = _digest(instance)
+    if not digest:
+        return False
+    model = type(instance)
+    derivatives = (
+        MediaBlob.objects.filter(pk=digest).exclude(derivatives={})
+        .values_list('derivatives', flat=True).first()
+    )
+    if not derivatives or not model.objects.filter(pk=instance.pk).update(
+        derivatives=derivatives, updated_at=timezone.now()
+    ):
+        return False
+    instance.derivatives = derivatives
+    _refresh_cover(model, instance.pk)
+    return True
+
@@ -0,0 +1,36 @@
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """
+    Devuelve el pool de procesos compartido para el trabajo de imágenes.
+    Se crea de forma perezosa la primera vez que se necesita, de modo que
+    los workers web que nunca procesan imágenes no arrancan procesos extra.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'PHOTO_WORKER_PROCESSES', None)
+                )
+    return _pool
+
+
+def shutdown_process_pool(wait=True):
+    """Detiene el pool de procesos si está en marcha"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
+
+
+atexit.register(shutdown_process_pool, wait=False)
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto, PhotoUpload
+from apps.security.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class ReaperStats:
+    """Contadores de una ejecución del reaper"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.expired = 0
+        self.sessions = 0
+        self.rows = 0
+        self.files = 0
+        self.bytes = 0
+        self.batches = 0
+        self.replayed = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        elapsed = max(self.elapsed, 1e-6)
+        return (
+            f"{self.expired} sesiones marcadas como caducadas, {self.sessions} sesiones "
+            f"borradas en {self.batches} lotes, {self.rows} fotos, {self.files} ficheros "
+            f"({self.bytes / (1024 * 1024):.1f} MB), {self.replayed} ficheros pendientes "
+            f"recuperados; {elapsed:.2f}s ({self.sessions / elapsed:.1f} sesiones/s, "
+            f"{self.files / elapsed:.1f} ficheros/s)"
+        )
+
+
+class SessionReaper:
+    """
+    Caduca y elimina sesiones vencidas en lotes acotados.
+    Las filas se borran con DELETE en bloque y los ficheros con un pool de
+    hilos. Antes de cada lote se anotan los ficheros en un diario; si el
+    proceso muere tras borrar las filas, la siguiente ejecución termina de
+    borrar esos ficheros. Las sesiones completadas no se tocan.
+    """
+
+    def __init__(self, batch_size=500, threads=8, grace=None, dry_run=False, journal_path=None):
+        self.batch_size = batch_size
+        self.threads = threads
+        self.grace = grace or timezone.timedelta(0)
+        self.dry_run = dry_run
+        self.journal_path = journal_path or getattr(
+            settings, 'SESSION_REAPER_JOURNAL',
+            os.path.join(getattr(settings, 'LOG_DIR', settings.BASE_DIR), 'reaper-journal.log'),
+        )
+        self.storage = IndividualPhoto._meta.get_field('image').storage
+        self.stats = ReaperStats()
+
+    def expirable(self, now):
+        return PhotoSession.objects.filter(
+            status__in=[PhotoSession.STATUS_CREATED, PhotoSession.STATUS_IN_PROGRESS],
+            expires_at__lt=now,
+        )
+
+    def reapable(self, now):
+        return PhotoSession.objects.filter(
+            status=PhotoSession.STATUS_EXPIRED, expires_at__lt=now - self.grace
+        )
+
+    def run(self):
+        now = timezone.now()
+        if self.dry_run:
+            return self._dry_run(now)
+
+        self.replay_journal()
+        self.stats.expired = self.expirable(now).update(status=PhotoSession.STATUS_EXPIRED)
+        while True:
+            ids = list(
+                self.reapable(now).order_by('expires_at').values_list('pk', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                break
+            self.reap_batch(ids)
+        return self.stats
+
+    def _dry_run(self, now):
+        self.stats.expired = self.expirable(now).count()
+        ids = self.expirable(now) | self.reapable(now)
+        self.stats.sessions = ids.count()
+        for model in (IndividualPhoto, CompositePhoto):
+            for _, derivatives, size, _ in self._photo_rows(model, ids.values('pk')):
+                self.stats.rows += 1
+                self.stats.files += 1 + sum(1 for _ in self._derivative_names(derivatives))
+                self.stats.bytes += size
+        return self.stats
+
+    def _photo_rows(self, model, session_ids):
+        return model.objects.filter(session__in=session_ids).values_list(
+            'image', 'derivatives', 'file_size', 'session__user'
+        ).order_by().iterator()
+
+    @staticmethod
+    def _derivative_names(derivatives):
+        for entry in (derivatives or {}).values():
+            for key, value in entry.items():
+                if isinstance(value, str):
+                    yield value
+
+    def reap_batch(self, ids):
+        """Borra un lote de sesiones: diario, filas en bloque y después ficheros"""
+        names = []
+        released = defaultdict(int)
+        photo_count = 0
+        for model in (IndividualPhoto, CompositePhoto):
+            for image, derivatives, size, user_id in self._photo_rows(model, ids):
+                photo_count += 1
+                names.append(image)
+                names.extend(self._derivative_names(derivatives))
+                if user_id:
+                    released[user_id] += size
+        uploads = PhotoUpload.objects.filter(session__in=ids)
+        temp_paths = [upload.temp_path for upload in uploads.only('id')]
+        # Los blobs por contenido no se borran aquí: se suelta su referencia en
+        # la misma transacción que las filas y collect_media recoge los huérfanos
+        blobs = [name for name in names if self.storage.is_blob(name)]
+        names = [name for name in names if not self.storage.is_managed(name)]
+
+        self._write_journal(ids, names, temp_paths)
+        with transaction.atomic():
+            self.storage.release(*blobs)
+            for user_id, size in released.items():
+                User.adjust_storage(-size, pk=user_id)
+            # DELETE en bloque sin cargar filas ni enviar señales: el libro y
+            # los ficheros ya se gestionan en este lote. Las subidas van
+            # primero porque apuntan a las fotos
+            for model in (PhotoUpload, IndividualPhoto, CompositePhoto):
+                self._delete_by_session(model, ids)
+            PhotoSession.objects.filter(pk__in=ids).delete()
+
+        self.delete_files(names, temp_paths)
+        self._clear_journal()
+
+        self.stats.batches += 1
+        self.stats.sessions += len(ids)
+        self.stats.rows += photo_count
+        self.stats.bytes += sum(released.values())
+        logger.info("Reaper: lote de %s sesiones borrado (%s)", len(ids), self.stats.summary())
+
+    @staticmethod
+    def _delete_by_session(model, session_ids):
+        """
+        DELETE ... WHERE session_id IN (...) con el cursor de la conexión.
+        QuerySet.delete() cargaría cada fila para enviar post_delete, que es
+        justo lo que este lote ya hace en bloque (libro, blobs y ficheros).
+        """
+        connection = connections[router.db_for_write(model)]
+        field = model._meta.get_field('session')
+        params = [field.target_field.get_db_prep_value(pk, connection) for pk in session_ids]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(field.column)} "
+                f"IN ({', '.join(['%s'] * len(params))})",
+                params,
+            )
+
+    def delete_files(self, names, temp_paths=()):
+        """Elimina los ficheros en paralelo; los que no existen se ignoran"""
+        def remove(name):
+            try:
+                self.storage.delete(name)
+                return 1
+            except OSError:
+                logger.exception("Reaper: no se pudo borrar %s", name)
+                return 0
+
+        def remove_temp(path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            self.stats.files += sum(pool.map(remove, names))
+            list(pool.map(remove_temp, temp_paths))
+
+    def _write_journal(self, ids, names, temp_paths):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        entry = {'sessions': [str(pk) for pk in ids], 'files': names, 'temp': temp_paths}
+        with open(self.journal_path, 'a') as journal:
+            journal.write(json.dumps(entry) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _clear_journal(self):
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+    def replay_journal(self):
+        """Termina de borrar los ficheros de un lote interrumpido por un fallo"""
+        if not os.path.exists(self.journal_path):
+            return
+        names, temp_paths = [], []
+        with open(self.journal_path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # línea a medio escribir
+                # Si las sesiones siguen existiendo el lote no llegó a
+                # confirmarse: sus ficheros se tratarán cuando se repita
+                if PhotoSession.objects.filter(pk__in=entry['sessions']).exists():
+                    continue
+                names.extend(entry['files'])
+                temp_paths.extend(entry['temp'])
+        before = self.stats.files
+        self.delete_files(names, temp_paths)
+        self.stats.replayed = self.stats.files - before
+        self._clear_journal()
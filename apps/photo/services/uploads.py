@@ -0,0 +1,155 @@
+import fcntl
+import hashlib
+import os
+
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+
+from apps.core.utils import safe_delete_file
+from apps.photo.models import IndividualPhoto, PhotoUpload, photo_directory_path
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Error al procesar un fragmento de una subida"""
+
+
+class OffsetMismatch(UploadError):
+    """El offset del fragmento no coincide con el último confirmado"""
+
+    def __init__(self, offset):
+        super().__init__(_("El offset no coincide con los bytes recibidos."))
+        self.offset = offset
+
+
+class ChecksumMismatch(UploadError):
+    """La suma SHA-256 del fragmento o del fichero no es la esperada"""
+
+
+class UploadBusy(UploadError):
+    """Otra petición está escribiendo en la misma subida"""
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def append_chunk(upload, offset, stream, chunk_checksum=None):
+    """
+    Añade un fragmento leído de stream al fichero parcial de la subida.
+    Se escribe bloque a bloque directamente en disco, sin acumular el cuerpo
+    en memoria. Si el fragmento no es válido se descarta y el offset
+    confirmado no cambia. Devuelve el nuevo offset confirmado.
+    """
+    if offset != upload.received:
+        raise OffsetMismatch(upload.received)
+
+    remaining = upload.total_size - offset
+    os.makedirs(os.path.dirname(upload.temp_path), exist_ok=True)
+    with open(upload.temp_path, 'a+b') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy(_("La subida está recibiendo otro fragmento."))
+
+        # Se descarta cualquier resto de un fragmento anterior no confirmado
+        handle.truncate(offset)
+        handle.seek(offset)
+        digest = hashlib.sha256()
+        written = 0
+        while True:
+            block = stream.read(READ_SIZE)
+            if not block:
+                break
+            written += len(block)
+            if written > remaining:
+                handle.truncate(offset)
+                raise UploadError(_("El fragmento supera el tamaño declarado de la subida."))
+            digest.update(block)
+            handle.write(block)
+
+        if chunk_checksum and digest.hexdigest() != chunk_checksum.lower():
+            handle.truncate(offset)
+            raise ChecksumMismatch(_("La suma SHA-256 del fragmento no coincide."))
+        handle.flush()
+        os.fsync(handle.fileno())
+
+        new_offset = offset + written
+        updated = PhotoUpload.objects.filter(pk=upload.pk, received=offset).update(received=new_offset)
+        if not updated:
+            handle.truncate(offset)
+            upload.refresh_from_db(fields=['received'])
+            raise OffsetMismatch(upload.received)
+    upload.received = new_offset
+    return new_offset
+
+
+def _completed_photo(upload):
+    """
+    Foto de una subida que otra petición ya ha cerrado (dos PUT finales a la
+    vez o un reintento). Si no está cerrada y el parcial ha desaparecido, la
+    subida se reinicia desde cero.
+    """
+    upload.refresh_from_db(fields=['photo', 'status', 'received'])
+    if upload.status == PhotoUpload.STATUS_COMPLETED:
+        return upload.photo
+    PhotoUpload.objects.filter(pk=upload.pk, status=PhotoUpload.STATUS_PENDING).update(received=0)
+    upload.received = 0
+    raise UploadError(_("El fichero parcial se ha perdido; la subida se reinicia."))
+
+
+def finalize_upload(upload):
+    """
+    Verifica el fichero completo y lo promueve a su blob por contenido,
+    creando la IndividualPhoto. La suma ya verificada es la clave del blob;
+    si el mismo contenido ya estaba guardado (un reintento del kiosco) sólo
+    se suma una referencia y el parcial se descarta. La subida se reclama
+    con un UPDATE condicional antes de crear la foto: si otra petición ya la
+    cerró, se devuelve su foto en lugar de crear otra.
+    """
+    try:
+        if _file_sha256(upload.temp_path) != upload.checksum.lower():
+            # El fichero no es válido: se reinicia la subida desde cero
+            os.remove(upload.temp_path)
+            PhotoUpload.objects.filter(pk=upload.pk).update(received=0)
+            upload.received = 0
+            raise ChecksumMismatch(_("La suma SHA-256 del fichero no coincide."))
+
+        try:
+            with Image.open(upload.temp_path) as image:
+                image.verify()
+        except FileNotFoundError:
+            raise
+        except Exception:
+            raise UploadError(_("El fichero subido no es una imagen válida."))
+    except FileNotFoundError:
+        # Otra petición cerró la subida y ya borró el parcial
+        return _completed_photo(upload)
+
+    photo = IndividualPhoto(session=upload.session, order=upload.order, file_size=upload.total_size)
+    storage = photo.image.storage
+    # La referencia se toma en la transacción de la fila: si algo falla se
+    # deshacen las dos y el parcial sigue en su sitio para reintentar el cierre
+    with transaction.atomic():
+        claimed = PhotoUpload.objects.filter(
+            pk=upload.pk, status=PhotoUpload.STATUS_PENDING
+        ).update(status=PhotoUpload.STATUS_COMPLETED)
+        if claimed:
+            photo.image.name = storage.retain_file(
+                upload.temp_path, upload.checksum.lower(), upload.total_size,
+                photo_directory_path(photo, upload.filename),
+            )
+            photo.save()
+            upload.photo = photo
+            upload.status = PhotoUpload.STATUS_COMPLETED
+            upload.save(update_fields=['photo', 'status', 'updated_at'])
+    if not claimed:
+        return _completed_photo(upload)
+    safe_delete_file(upload.temp_path)
+    return photo
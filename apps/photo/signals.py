@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.core.events import publish_event
+from apps.core.utils import safe_delete_file
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto, PhotoUpload
+from apps.photo.services.dashboard import invalidate_dashboard
+from apps.security.models import User
+
+
+def delete_files(storage, names):
+    """Elimina del storage una lista de ficheros, ignorando los que ya no existen"""
+    for name in names:
+        storage.delete(name)
+
+
+@receiver(post_save, sender=IndividualPhoto)
+@receiver(post_save, sender=CompositePhoto)
+def add_photo_to_storage_ledger(sender, instance, created, **kwargs):
+    """Suma el tamaño de una foto nueva al almacenamiento usado por su dueño"""
+    if created and not kwargs.get('raw'):
+        User.adjust_storage(instance.file_size, photo_sessions=instance.session_id)
+
+
+def publish_photo_event(photo):
+    """Anuncia una foto nueva o un composite listo en los canales de su sesión"""
+    if isinstance(photo, CompositePhoto):
+        event_type, data = 'composite.ready', {'composite': photo.pk}
+    else:
+        event_type, data = 'photo.created', {'photo': photo.pk, 'order': photo.order}
+    data['session'] = photo.session_id
+    publish_event(event_type, data, session_id=photo.session_id, user_id=photo.session.user_id)
+
+
+@receiver(post_save, sender=IndividualPhoto)
+@receiver(post_save, sender=CompositePhoto)
+def announce_photo(sender, instance, created, **kwargs):
+    """Publica la llegada de fotos y composites para los paneles suscritos"""
+    if created and not kwargs.get('raw'):
+        publish_photo_event(instance)
+
+
+@receiver(post_delete, sender=IndividualPhoto)
+@receiver(post_delete, sender=CompositePhoto)
+def remove_photo_from_storage_ledger(sender, instance, **kwargs):
+    """Resta el tamaño de una foto borrada (también en borrados en cascada)"""
+    User.adjust_storage(-instance.file_size, photo_sessions=instance.session_id)
+
+
+@receiver(post_delete, sender=IndividualPhoto)
+@receiver(post_delete, sender=CompositePhoto)
+def remove_photo_files(sender, instance, **kwargs):
+    """
+    Elimina el fichero y sus derivados al borrar la fila, también cuando el
+    borrado llega en cascada desde la sesión; en el storage por contenido
+    sólo se suelta la referencia al blob. Se espera al commit para no
+    perder ficheros si la transacción se deshace.
+    """
+    names = instance.file_names()
+    if names:
+        storage = instance.image.storage
+        transaction.on_commit(lambda: delete_files(storage, names), robust=True)
+
+
+@receiver(post_delete, sender=PhotoUpload)
+def remove_partial_upload(sender, instance, **kwargs):
+    """Elimina el fichero parcial de una subida que no llegó a completarse"""
+    safe_delete_file(instance.temp_path)
+
+
+def photo_owner(photo):
+    """Dueño de la sesión de una foto, sin consulta si la sesión ya está cargada"""
+    if type(photo).session.is_cached(photo):
+        return photo.session.user_id
+    return PhotoSession.objects.filter(pk=photo.session_id).values_list('user_id', flat=True).first()
+
+
+def refresh_dashboard(user_id):
+    """
+    Invalida el panel del usuario ahora y otra vez tras el commit, para que
+    una lectura concurrente no deje en caché datos previos a la transacción.
+    """
+    if user_id:
+        invalidate_dashboard(user_id)
+        transaction.on_commit(lambda: invalidate_dashboard(user_id), robust=True)
+
+
+@receiver(post_save, sender=PhotoSession)
+@receiver(post_delete, sender=PhotoSession)
+def invalidate_session_dashboard(sender, instance, **kwargs):
+    """Crear, cambiar o borrar una sesión cambia los contadores y álbumes recientes"""
+    if not kwargs.get('raw'):
+        refresh_dashboard(instance.user_id)
+
+
+@receiver(post_save, sender=IndividualPhoto)
+@receiver(post_save, sender=CompositePhoto)
+@receiver(post_delete, sender=IndividualPhoto)
+@receiver(post_delete, sender=CompositePhoto)
+def invalidate_photo_dashboard(sender, instance, origin=None, **kwargs):
+    """
+    Fotos y composites cambian recuentos, portadas y almacenamiento. En un
+    borrado en cascada (desde la sesión o el usuario) basta con la señal de
+    la sesión, así que no se busca el dueño foto a foto.
+    """
+    if kwargs.get('raw'):
+        return
+    if origin is not None and getattr(origin, 'model', type(origin)) is not sender:
+        return
+    refresh_dashboard(photo_owner(instance))
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import Counter, namedtuple
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+BLOB_PREFIX = 'blobs/'
+DERIVATIVE_PREFIX = 'derivatives/'
+TEMP_DIRECTORY = 'blobs/tmp'
+CHUNK_SIZE = 1024 * 1024
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+# Fichero copiado a un temporal de blobs/tmp y aún sin referencia (ver stage())
+StagedFile = namedtuple('StagedFile', ['path', 'digest', 'size', 'hint'])
+
+
+def shard(digest):
+    """Dos niveles de 256 directorios: unas decenas de ficheros por directorio con millones de fotos"""
+    return f'{digest[:2]}/{digest[2:4]}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Storage de fotos direccionado por contenido: cada fichero se guarda una
+    sola vez en blobs/<ab>/<cd>/<sha256>.<ext> y la tabla MediaBlob lleva la
+    cuenta de filas que lo referencian. save() toma una referencia y
+    delete() la suelta; los ficheros sin referencias los elimina
+    collect_media pasado un margen. Los nombres antiguos (sessions/...)
+    se siguen leyendo y borrando como en FileSystemStorage.
+    """
+
+    def is_blob(self, name):
+        return bool(name) and name.startswith(BLOB_PREFIX) and not name.startswith(TEMP_DIRECTORY)
+
+    def is_managed(self, name):
+        """Ficheros cuyo ciclo de vida gestiona la recogida de basura, no delete()"""
+        return self.is_blob(name) or bool(name) and name.startswith(DERIVATIVE_PREFIX)
+
+    def blob_name(self, digest, hint):
+        extension = os.path.splitext(hint)[1].lower()
+        extension = EXTENSION_ALIASES.get(extension, extension)
+        return f'{BLOB_PREFIX}{shard(digest)}/{digest}{extension}'
+
+    def derivative_directory(self, name):
+        """Los derivados de un blob se comparten entre todas las fotos que lo usan"""
+        digest = self.digest(name)
+        return f'{DERIVATIVE_PREFIX}{shard(digest)}/{digest}' if digest else None
+
+    def digest(self, name):
+        if self.is_blob(name):
+            return os.path.splitext(os.path.basename(name))[0]
+        return None
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre final sale del contenido: nunca hay colisiones que evitar
+        return name
+
+    def _save(self, name, content):
+        temp_path, digest, size = self._spool(content)
+        try:
+            return self.retain_file(temp_path, digest, size, name)
+        finally:
+            os.remove(temp_path)
+
+    def _spool(self, content):
+        """Copia el contenido a un temporal junto a los blobs calculando su SHA-256"""
+        directory = self.path(TEMP_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        sha256, size = hashlib.sha256(), 0
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    temp.write(chunk)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return temp_path, sha256.hexdigest(), size
+
+    def retain_file(self, path, digest, size, hint):
+        """
+        Toma una referencia al blob con ese contenido y lo crea a partir de
+        `path` (que no se modifica) si aún no está en disco. La fila se
+        bloquea antes de mirar el disco, así que collect_media no puede
+        borrar el fichero entre la comprobación y el incremento.
+        """
+        try:
+            return self._retain(path, digest, size, hint)
+        except IntegrityError:
+            # Otro proceso creó el mismo blob a la vez: ahora se toma su fila
+            return self._retain(path, digest, size, hint)
+
+    def _retain(self, path, digest, size, hint):
+        from apps.photo.models import MediaBlob
+
+        with transaction.atomic():
+            updated = MediaBlob.objects.filter(digest=digest).update(
+                references=F('references') + 1, released_at=None, retained_at=timezone.now()
+            )
+            if updated:
+                name = MediaBlob.objects.values_list('name', flat=True).get(digest=digest)
+            else:
+                name = self.blob_name(digest, hint)
+                MediaBlob.objects.create(digest=digest, name=name, size=size, references=1)
+            self._place(path, name)
+        return name
+
+    def stage(self, content, hint):
+        """Copia el contenido a un temporal sin tomar referencia; ver retain_staged()"""
+        path, digest, size = self._spool(content)
+        return StagedFile(path, digest, size, hint)
+
+    def retain_staged(self, staged):
+        """
+        Toma de una vez las referencias de los ficheros preparados con stage()
+        y devuelve sus nombres en el mismo orden. Se llama dentro de la
+        transacción que inserta las filas, así que una petición que muere
+        antes del commit no deja referencias de más. Son tres consultas sea
+        cual sea el número de ficheros: alta sin referencias de los blobs que
+        falten, bloqueo de todos e incremento. Los temporales no se tocan.
+        """
+        from apps.photo.models import MediaBlob
+
+        counts = Counter(item.digest for item in staged)
+        sources = {}
+        for item in staged:
+            sources.setdefault(item.digest, item)
+        names = {}
+        pending = sorted(counts)
+        while pending:
+            # Sin released_at, collect_media no recoge un blob recién dado de alta
+            MediaBlob.objects.bulk_create([
+                MediaBlob(digest=digest, name=self.blob_name(digest, sources[digest].hint),
+                          size=sources[digest].size, references=0)
+                for digest in pending
+            ], ignore_conflicts=True)
+            # Bloqueadas en orden: dos capturas con fotos comunes no se cruzan
+            locked = dict(
+                MediaBlob.objects.select_for_update().filter(digest__in=pending)
+                .order_by('digest').values_list('digest', 'name')
+            )
+            names.update(locked)
+            # collect_media pudo borrar uno que existía sin referencias entre
+            # el alta y el bloqueo: se repite sólo con ésos
+            pending = [digest for digest in pending if digest not in locked]
+
+        by_count = {}
+        for digest, count in counts.items():
+            by_count.setdefault(count, []).append(digest)
+        for count, group in by_count.items():
+            MediaBlob.objects.filter(digest__in=group).update(
+                references=F('references') + count, released_at=None, retained_at=timezone.now()
+            )
+        for digest, item in sources.items():
+            self._place(item.path, names[digest])
+        return [names[item.digest] for item in staged]
+
+    def discard_staged(self, staged):
+        for item in staged:
+            try:
+                os.remove(item.path)
+            except FileNotFoundError:
+                pass
+
+    def _place(self, path, name):
+        destination = self.path(name)
+        if os.path.exists(destination):
+            return
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            # Un enlace es atómico y no copia bytes; el origen sigue en su sitio
+            os.link(path, destination)
+        except FileExistsError:
+            return
+        except OSError:
+            # Origen en otro sistema de ficheros: copia a un temporal y rename
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination))
+            os.close(handle)
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, destination)
+        os.chmod(destination, self.file_permissions_mode or 0o644)
+        # El enlace conserva la fecha del parcial: collect_media mide el margen con ella
+        os.utime(destination)
+
+    def release(self, *names):
+        """Suelta una referencia por cada nombre; el último en soltarla marca released_at"""
+        from apps.photo.models import MediaBlob
+
+        counts = Counter(name for name in names if self.is_blob(name))
+        by_count = {}
+        for name, count in counts.items():
+            by_count.setdefault(count, []).append(name)
+        for count, group in by_count.items():
+            # released_at va primero: se calcula con el recuento previo
+            MediaBlob.objects.filter(name__in=group, references__gt=0).update(
+                released_at=Case(When(references__lte=count, then=timezone.now()), default=F('released_at')),
+                references=Greatest(F('references') - count, 0),
+            )
+
+    def delete(self, name):
+        if self.is_blob(name):
+            self.release(name)
+        elif not self.is_managed(name):
+            super().delete(name)
+
+    def remove_blob(self, name):
+        """Borra del disco un blob y sus derivados; sólo para collect_media"""
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+        derivatives = self.derivative_directory(name)
+        if derivatives:
+            shutil.rmtree(self.path(derivatives), ignore_errors=True)
+
+
+photo_storage = ContentAddressedStorage()
+
+
+def media_storage():
+    """Storage de IndividualPhoto y CompositePhoto (callable para las migraciones)"""
+    return photo_storage
@@ -1,3 +1,801 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.custom_sessions.models import PhotoSession, SessionSettings
+from apps.custom_templates.models import PhotoTemplate
+from apps.photo.models import IndividualPhoto, CompositePhoto, MediaBlob, PhotoUpload
+from apps.photo.services.capture import (
+    commit_capture, discard_capture_files, submit_capture, validate_capture, write_capture_files,
+)
+from apps.photo.services.collector import MediaCollector
+from apps.photo.services.compositor import (
+    STRIP_MARGIN, STRIP_PHOTO_HEIGHT, STRIP_WIDTH, generate_composite,
+)
+from apps.photo.serializers.photo_serial import IndividualPhotoSerializer
+from apps.photo.services.derivatives import render_derivatives
+from apps.photo.services.reaper import SessionReaper
+from apps.photo.services.uploads import append_chunk, finalize_upload
+from apps.photo.services.dashboard import get_dashboard_data, aget_dashboard_data, invalidate_dashboard
+from apps.photo.storage import TEMP_DIRECTORY
+from apps.security.models import User
+
+
+def jpeg_bytes(color, size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class DashboardQueryTests(TestCase):
+    """El panel de inicio usa un número fijo de consultas y no consulta el disco"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'secret-pass')
+        # Las claves van por pk y los pk se reutilizan entre tests
+        invalidate_dashboard(self.user.pk)
+
+    def create_sessions(self, count, photos=4):
+        for index in range(count):
+            session = PhotoSession.objects.create(user=self.user, title=f'Album {index}')
+            for order in range(photos):
+                IndividualPhoto.objects.create(
+                    session=session, order=order,
+                    image=f'sessions/{session.id}/photos/{order}.jpg', file_size=1000,
+                )
+            CompositePhoto.objects.create(
+                session=session, image=f'sessions/{session.id}/composite.jpg', file_size=50 * 1024 * 1024,
+            )
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        self.create_sessions(1)
+        with self.assertNumQueries(2):
+            get_dashboard_data(self.user)
+
+        self.create_sessions(10)
+        with self.assertNumQueries(2):
+            data = get_dashboard_data(self.user)
+
+        self.assertEqual(data['total_albums'], 11)
+        self.assertEqual(data['total_memories'], 44)
+        self.assertEqual(len(data['recent_albums']), 3)
+        self.assertEqual(data['recent_albums'][0]['photo_count'], 4)
+        self.assertTrue(data['recent_albums'][0]['cover_image'].endswith('composite.jpg'))
+
+    def test_storage_is_read_from_stored_sizes(self):
+        self.create_sessions(2)
+        with mock.patch.object(FileSystemStorage, 'size', side_effect=AssertionError('stat')):
+            data = get_dashboard_data(self.user)
+        self.assertGreater(data['storage_used'], 0)
+
+    def test_user_without_sessions(self):
+        data = get_dashboard_data(self.user)
+        self.assertEqual(data['total_albums'], 0)
+        self.assertEqual(data['storage_used'], 0)
+        self.assertEqual(data['recent_albums'], [])
+
+    async def test_async_variant_matches(self):
+        await sync_to_async(self.create_sessions)(4)
+        self.assertEqual(await aget_dashboard_data(self.user), await sync_to_async(get_dashboard_data)(self.user))
+
+    async def test_async_endpoint_requires_authentication(self):
+        response = await self.async_client.get('/photo/async/dashboard/')
+        self.assertEqual(response.status_code, 401)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/photo/async/dashboard/')
+        self.assertEqual(response.json()['total_albums'], 0)
+
+
+class DashboardCacheTests(TestCase):
+    """El panel se sirve desde la caché y las señales lo invalidan"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'secret-pass')
+        invalidate_dashboard(self.user.pk)
+        self.session = PhotoSession.objects.create(user=self.user, title='Album')
+        get_dashboard_data(self.user)
+
+    def test_hits_do_not_query(self):
+        with self.assertNumQueries(0):
+            data = get_dashboard_data(self.user)
+        self.assertEqual(data['total_albums'], 1)
+
+    def test_photo_save_and_delete_invalidate(self):
+        photo = IndividualPhoto.objects.create(
+            session=self.session, image=f'sessions/{self.session.id}/photos/0.jpg', file_size=1000,
+        )
+        self.assertEqual(get_dashboard_data(self.user)['total_memories'], 1)
+        IndividualPhoto.objects.get(pk=photo.pk).delete()
+        self.assertEqual(get_dashboard_data(self.user)['total_memories'], 0)
+
+    def test_composite_changes_cover(self):
+        CompositePhoto.objects.create(session=self.session, image=f'sessions/{self.session.id}/composite.jpg')
+        self.assertTrue(get_dashboard_data(self.user)['recent_albums'][0]['cover_image'].endswith('composite.jpg'))
+
+    def test_session_delete_invalidates_once(self):
+        IndividualPhoto.objects.create(
+            session=self.session, image=f'sessions/{self.session.id}/photos/0.jpg', file_size=1000,
+        )
+        with mock.patch('apps.photo.signals.invalidate_dashboard', wraps=invalidate_dashboard) as invalidate:
+            PhotoSession.objects.get(pk=self.session.pk).delete()
+        invalidate.assert_called_once_with(self.user.pk)
+        self.assertEqual(get_dashboard_data(self.user)['total_albums'], 0)
+
+    def test_other_users_are_untouched(self):
+        other = User.objects.create_user('other', 'other@example.com', 'secret-pass')
+        PhotoSession.objects.create(user=other)
+        self.assertIsNotNone(cache.get(f'dashboard:{self.user.pk}'))
+
+
+class StorageLedgerTests(TestCase):
+    """El libro de almacenamiento del usuario se actualiza al crear y borrar fotos"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ledger', 'ledger@example.com', 'secret-pass')
+        self.session = PhotoSession.objects.create(user=self.user)
+
+    def add_photo(self, size):
+        return IndividualPhoto.objects.create(
+            session=self.session, image=f'sessions/{self.session.id}/photos/{size}.jpg',
+            file_size=size, width=10, height=10,
+        )
+
+    def test_create_and_delete_update_ledger(self):
+        self.add_photo(1000)
+        photo = self.add_photo(500)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 1500)
+
+        photo.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 1000)
+
+    def test_cascade_delete_releases_storage(self):
+        self.add_photo(1000)
+        self.session.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 0)
+
+    def test_quota(self):
+        self.user.storage_quota = 1000
+        self.user.save(update_fields=['storage_quota'])
+        self.add_photo(800)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.has_storage_for(200))
+        self.assertFalse(self.user.has_storage_for(201))
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Las fotos repetidas comparten blob y sólo se borran sin referencias"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('blobs', 'blobs@example.com', 'secret-pass')
+        self.session = PhotoSession.objects.create(user=self.user)
+        self.content = jpeg_bytes('red')
+
+    def add_photo(self, order, filename='kiosk.jpeg'):
+        photo = IndividualPhoto(session=self.session, order=order)
+        photo.image.save(filename, ContentFile(self.content), save=True)
+        return photo
+
+    def collect(self):
+        storage = IndividualPhoto._meta.get_field('image').storage
+        return MediaCollector(storage, grace=timezone.timedelta(0)).run()
+
+    def test_duplicates_share_one_sharded_file(self):
+        first, retry = self.add_photo(0), self.add_photo(1, 'retry.jpg')
+        self.assertEqual(first.image.name, retry.image.name)
+        digest = MediaBlob.objects.get().digest
+        self.assertEqual(first.image.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(MediaBlob.objects.get().references, 2)
+        self.assertEqual(os.listdir(os.path.dirname(first.image.path)), [f'{digest}.jpg'])
+
+    def test_blob_survives_while_referenced(self):
+        first, retry = self.add_photo(0), self.add_photo(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.collect()
+        self.assertTrue(os.path.exists(retry.image.path))
+        self.assertEqual(MediaBlob.objects.get().references, 1)
+
+    def test_unreferenced_blob_is_collected_after_grace(self):
+        photo = self.add_photo(0)
+        path = photo.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.delete()
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.references, 0)
+        self.assertIsNotNone(blob.released_at)
+
+        storage = IndividualPhoto._meta.get_field('image').storage
+        MediaCollector(storage, grace=timezone.timedelta(hours=1)).run()
+        self.assertTrue(os.path.exists(path))
+
+        stats = self.collect()
+        self.assertEqual(stats.blobs, 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_saving_again_after_collection_recreates_the_file(self):
+        photo = self.add_photo(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.collect()
+        photo = self.add_photo(1)
+        self.assertTrue(os.path.exists(photo.image.path))
+        self.assertEqual(MediaBlob.objects.get().references, 1)
+
+    def test_failed_insert_rolls_back_the_reference(self):
+        self.add_photo(0)
+        with mock.patch.object(IndividualPhoto, '_do_insert', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError), transaction.atomic():
+            IndividualPhoto.objects.create(
+                session=self.session, image=SimpleUploadedFile('retry.jpg', self.content, 'image/jpeg')
+            )
+        self.assertEqual(MediaBlob.objects.get().references, 1)
+
+    def test_recount_lowers_only_old_overcounts(self):
+        photo = self.add_photo(0)
+        # Referencias de subidas que murieron antes de insertar su fila
+        MediaBlob.objects.update(references=3)
+        stats = self.collect_recount(grace=timezone.timedelta(hours=1))
+        self.assertEqual((stats.overcounted, stats.lowered), (1, 0))
+        self.assertEqual(MediaBlob.objects.get().references, 3)
+
+        MediaBlob.objects.update(retained_at=timezone.now() - timezone.timedelta(hours=2))
+        stats = self.collect_recount(grace=timezone.timedelta(hours=1))
+        self.assertEqual((stats.overcounted, stats.lowered), (1, 1))
+        self.assertEqual(MediaBlob.objects.get().references, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        MediaBlob.objects.update(references=1, released_at=None,
+                                 retained_at=timezone.now() - timezone.timedelta(hours=2))
+        self.collect_recount(grace=timezone.timedelta(hours=1))
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.references, 0)
+        self.assertIsNotNone(blob.released_at)
+
+    def collect_recount(self, grace):
+        storage = IndividualPhoto._meta.get_field('image').storage
+        return MediaCollector(storage, grace=grace).run(recount=True)
+
+
+class CompositeRenderingTests(TestCase):
+    """El composite coloca cada foto en el hueco de su orden, con o sin plantilla"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media, TEMPLATE_PREVIEW_SIZES={'thumb': 64})
+        override.enable()
+        self.addCleanup(override.disable)
+        # El pool de procesos se sustituye por un hilo: el render es el mismo
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        patcher = mock.patch('apps.photo.services.compositor.get_process_pool', return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = PhotoSession.objects.create(title='Composite')
+        # Se crean desordenadas: el composite debe seguir el campo order
+        for order, color in ((2, 'blue'), (0, 'red'), (1, 'lime')):
+            photo = IndividualPhoto(session=self.session, order=order)
+            photo.image.save(f'{order}.jpg', ContentFile(jpeg_bytes(color, (64, 48))), save=True)
+
+    def assertColor(self, image, point, expected):
+        for channel, value in zip(image.getpixel(point), expected):
+            self.assertAlmostEqual(channel, value, delta=40)
+
+    def render(self):
+        result = generate_composite(PhotoSession.objects.select_related('template').get(pk=self.session.pk))
+        with Image.open(result.composite.image.path) as image:
+            return image.convert('RGB')
+
+    def test_strip_layout_without_template(self):
+        image = self.render()
+        self.assertEqual(image.size, (STRIP_WIDTH, STRIP_MARGIN + 3 * (STRIP_PHOTO_HEIGHT + STRIP_MARGIN)))
+        for index, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255)]):
+            top = STRIP_MARGIN + index * (STRIP_PHOTO_HEIGHT + STRIP_MARGIN)
+            self.assertColor(image, (STRIP_WIDTH // 2, top + STRIP_PHOTO_HEIGHT // 2), color)
+
+    def test_template_slots_filled_by_order(self):
+        # Marco opaco con dos huecos transparentes, izquierda y derecha
+        overlay = Image.new('RGBA', (400, 300), (255, 255, 255, 255))
+        for box in ((20, 20, 180, 280), (220, 20, 380, 280)):
+            overlay.paste((0, 0, 0, 0), box)
+        buffer = io.BytesIO()
+        overlay.save(buffer, 'PNG')
+        template = PhotoTemplate(name='Dos', max_photos=2)
+        template.image.save('two.png', ContentFile(buffer.getvalue()), save=True)
+        self.session.template = template
+        self.session.save(update_fields=['template'])
+
+        image = self.render()
+        self.assertEqual(image.size, (400, 300))
+        self.assertColor(image, (100, 150), (255, 0, 0))
+        self.assertColor(image, (300, 150), (0, 255, 0))
+        self.assertColor(image, (200, 150), (255, 255, 255))
+
+    def test_template_without_slots_falls_back_to_strip(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (200, 200), (0, 0, 0, 255)).save(buffer, 'PNG')
+        template = PhotoTemplate(name='Opaca', max_photos=3)
+        template.image.save('opaque.png', ContentFile(buffer.getvalue()), save=True)
+        self.session.template = template
+        self.session.save(update_fields=['template'])
+
+        image = self.render()
+        self.assertEqual(image.width, STRIP_WIDTH)
+        self.assertColor(image, (STRIP_WIDTH // 2, STRIP_MARGIN + STRIP_PHOTO_HEIGHT // 2), (255, 0, 0))
+
+
+class InlinePool:
+    """Pool que ejecuta la tarea en el acto: el callback corre en el mismo hilo"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@override_settings(PHOTO_DERIVATIVE_SIZES={'thumb': 32, 'medium': 64})
+class DerivativeTests(TestCase):
+    """Derivados JPEG/WebP: render, programación tras el commit y serializers"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.pool = InlinePool()
+        for target, value in (('get_process_pool', lambda: self.pool), ('connection', mock.Mock())):
+            patcher = mock.patch(f'apps.photo.services.derivatives.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.session = PhotoSession.objects.create()
+
+    def add_photo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = IndividualPhoto(session=self.session)
+            photo.image.save('photo.jpg', ContentFile(jpeg_bytes('red', (200, 100))), save=True)
+        return photo
+
+    def test_render_derivatives(self):
+        source = os.path.join(self.media, 'source.jpg')
+        with open(source, 'wb') as handle:
+            handle.write(jpeg_bytes('red', (2000, 1000)))
+        target = os.path.join(self.media, 'out')
+
+        result = render_derivatives(source, target, 'photo', {'thumb': 320, 'medium': 800})
+        self.assertEqual((result['thumb']['width'], result['thumb']['height']), (320, 160))
+        self.assertEqual((result['medium']['width'], result['medium']['height']), (800, 400))
+        self.assertEqual(sorted(os.listdir(target)), [
+            'photo_medium.jpg', 'photo_medium.webp', 'photo_thumb.jpg', 'photo_thumb.webp',
+        ])
+        with Image.open(os.path.join(target, 'photo_medium.jpg')) as image:
+            self.assertTrue(image.info.get('progressive'))
+
+    def test_new_photo_gets_derivatives_after_commit(self):
+        photo = self.add_photo()
+        self.assertEqual(self.pool.submitted, 1)
+        photo.refresh_from_db()
+        self.assertEqual(set(photo.derivatives), {'thumb', 'medium'})
+        self.assertEqual(photo.derivatives['thumb']['width'], 32)
+        self.assertTrue(os.path.exists(photo.image.storage.path(photo.derivatives['thumb']['webp'])))
+
+    def test_full_save_keeps_derivatives_and_does_not_render_again(self):
+        photo = self.add_photo()
+        self.assertEqual(photo.derivatives, {})  # el worker sólo actualizó la fila
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.order = 3
+            photo.save()
+        photo.refresh_from_db()
+        self.assertEqual(photo.order, 3)
+        self.assertIn('thumb', photo.derivatives)
+        self.assertEqual(self.pool.submitted, 1)
+
+    def test_full_save_of_a_partial_instance_only_writes_loaded_fields(self):
+        photo = self.add_photo()
+        partial = IndividualPhoto.objects.only(
+            'id', 'session', 'order', 'image', 'file_size', 'width', 'height'
+        ).get(pk=photo.pk)
+        partial.order = 5
+        # UPDATE de los campos cargados y el dueño de la sesión para su panel;
+        # ninguna lectura de los campos diferidos
+        with self.assertNumQueries(2):
+            partial.save()
+        photo.refresh_from_db()
+        self.assertEqual(photo.order, 5)
+        self.assertIn('thumb', photo.derivatives)
+
+    def test_full_save_of_a_deleted_photo_inserts_it_again(self):
+        photo = self.add_photo()
+        photo.refresh_from_db()
+        IndividualPhoto.objects.filter(pk=photo.pk).delete()
+        photo.save()
+        self.assertEqual(IndividualPhoto.objects.get(pk=photo.pk).derivatives, photo.derivatives)
+
+    def test_repeated_photo_reuses_blob_derivatives(self):
+        first = self.add_photo()
+        first.refresh_from_db()
+        self.assertEqual(MediaBlob.objects.get().derivatives, first.derivatives)
+        with self.captureOnCommitCallbacks() as callbacks:
+            retry = IndividualPhoto(session=self.session)
+            retry.image.save('retry.jpg', ContentFile(jpeg_bytes('red', (200, 100))), save=True)
+        with self.assertNumQueries(2):
+            # Lectura del blob por clave primaria y UPDATE de la nueva fila
+            callbacks[-1]()
+        retry.refresh_from_db()
+        self.assertEqual(retry.derivatives, first.derivatives)
+        self.assertEqual(self.pool.submitted, 1)
+
+    def test_serializer_exposes_requested_size(self):
+        photo = self.add_photo()
+        photo.refresh_from_db()
+        request = Request(APIRequestFactory().get('/', {'size': 'medium', 'format': 'webp'}))
+        data = IndividualPhotoSerializer(photo, context={'request': request}).data
+        self.assertEqual(data['image_url'], f"http://testserver/media/{photo.derivatives['medium']['webp']}")
+        self.assertEqual(data['derivatives']['thumb']['width'], 32)
+        self.assertTrue(data['derivatives']['thumb']['jpeg'].startswith('http://testserver/media/'))
+
+        data = IndividualPhotoSerializer(photo).data
+        self.assertEqual(data['image_url'], f"/media/{photo.derivatives['thumb']['jpeg']}")
+
+
+class ChunkedUploadTests(TestCase):
+    """Subida reanudable: offset, sumas por fragmento, tamaño máximo y cierre"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(
+            MEDIA_ROOT=media, PHOTO_UPLOAD_TEMP_DIR=os.path.join(media, 'uploads', 'tmp'),
+            PHOTO_UPLOAD_MAX_SIZE=64 * 1024,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('uploader', 'uploader@example.com', 'secret-pass')
+        self.session = PhotoSession.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = jpeg_bytes('red', (64, 64))
+
+    def start(self, content=None, **overrides):
+        content = self.content if content is None else content
+        data = {
+            'session': str(self.session.pk), 'filename': 'kiosk.jpg', 'order': 0,
+            'total_size': len(content), 'checksum': hashlib.sha256(content).hexdigest(),
+        }
+        data.update(overrides)
+        return self.client.post('/photo/uploads/', data, format='json')
+
+    def send(self, upload_id, offset, chunk, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum:
+            headers['HTTP_UPLOAD_CHECKSUM'] = checksum
+        return self.client.put(
+            f'/photo/uploads/{upload_id}/chunk/', chunk, content_type='application/octet-stream', **headers
+        )
+
+    def test_resume_from_confirmed_offset_and_finalize(self):
+        upload_id = self.start().json()['id']
+        half = len(self.content) // 2
+        response = self.send(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        # El cliente se reconecta y pregunta dónde seguir
+        response = self.client.get(f'/photo/uploads/{upload_id}/')
+        self.assertEqual((response.json()['offset'], response['Upload-Offset']), (half, str(half)))
+
+        # Un fragmento repetido desde 0 no se acepta: se indica el offset bueno
+        response = self.send(upload_id, 0, self.content[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], str(half))
+
+        response = self.send(upload_id, half, self.content[half:])
+        self.assertEqual(response.status_code, 201)
+        photo = IndividualPhoto.objects.get(pk=response.json()['photo']['id'])
+        with photo.image.open('rb') as handle:
+            self.assertEqual(handle.read(), self.content)
+        self.assertEqual((photo.file_size, photo.width), (len(self.content), 64))
+        upload = PhotoUpload.objects.get(pk=upload_id)
+        self.assertEqual((upload.status, upload.photo_id), (PhotoUpload.STATUS_COMPLETED, photo.pk))
+        self.assertFalse(os.path.exists(upload.temp_path))
+
+    def test_failed_finalize_keeps_no_reference(self):
+        upload_id = self.start().json()['id']
+        with mock.patch.object(PhotoUpload, 'save', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.send(upload_id, 0, self.content)
+        # Blob, foto y referencia se deshacen juntos; el parcial queda para reintentar
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(IndividualPhoto.objects.exists())
+        self.assertTrue(os.path.exists(PhotoUpload.objects.get(pk=upload_id).temp_path))
+
+    def test_concurrent_finalize_creates_one_photo(self):
+        upload = PhotoUpload.objects.get(pk=self.start().json()['id'])
+        append_chunk(upload, 0, io.BytesIO(self.content))
+        first, second, retry = (PhotoUpload.objects.get(pk=upload.pk) for _ in range(3))
+
+        # Los dos cierres verifican el parcial antes de que el otro confirme
+        with mock.patch('apps.photo.services.uploads.safe_delete_file'):
+            photo = finalize_upload(first)
+        self.assertEqual(finalize_upload(second), photo)
+        # Un reintento cuando el parcial ya se borró tampoco falla
+        os.remove(upload.temp_path)
+        self.assertEqual(finalize_upload(retry), photo)
+        self.assertEqual(IndividualPhoto.objects.count(), 1)
+        self.assertEqual(list(MediaBlob.objects.values_list('references', flat=True)), [1])
+
+    def test_chunk_checksum_mismatch_keeps_offset(self):
+        upload_id = self.start().json()['id']
+        response = self.send(upload_id, 0, self.content[:100], checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PhotoUpload.objects.get(pk=upload_id).received, 0)
+
+        chunk = self.content[:100]
+        response = self.send(upload_id, 0, chunk, checksum=hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(response['Upload-Offset'], '100')
+
+    def test_oversize_is_rejected(self):
+        response = self.start(total_size=64 * 1024 + 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('total_size', response.json())
+
+        upload_id = self.start().json()['id']
+        response = self.send(upload_id, 0, self.content + b'extra')
+        self.assertEqual(response.status_code, 400)
+        upload = PhotoUpload.objects.get(pk=upload_id)
+        self.assertEqual(upload.received, 0)
+        self.assertEqual(os.path.getsize(upload.temp_path), 0)
+
+    def test_whole_file_checksum_mismatch_restarts_upload(self):
+        upload_id = self.start(checksum='a' * 64).json()['id']
+        response = self.send(upload_id, 0, self.content)
+        self.assertEqual(response.status_code, 400)
+        upload = PhotoUpload.objects.get(pk=upload_id)
+        self.assertEqual((upload.received, upload.status), (0, PhotoUpload.STATUS_PENDING))
+        self.assertFalse(IndividualPhoto.objects.exists())
+
+
+class CaptureSubmissionTests(TestCase):
+    """Captura completa en una petición: órdenes, cupo de fotos, libro y estado"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('capture', 'capture@example.com', 'secret-pass')
+        self.session = PhotoSession.objects.create(user=self.user)
+        SessionSettings.objects.create(session=self.session, num_photos=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def files(self, *colors):
+        return [SimpleUploadedFile(f'{color}.jpg', jpeg_bytes(color), 'image/jpeg') for color in colors]
+
+    def post(self, *colors):
+        return self.client.post(
+            f'/photo/sessions/{self.session.pk}/capture/', {'photos': self.files(*colors)}, format='multipart'
+        )
+
+    def orders(self):
+        return list(self.session.photos.order_by('order').values_list('order', flat=True))
+
+    def test_capture_in_two_requests(self):
+        response = self.post('red', 'lime')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], PhotoSession.STATUS_IN_PROGRESS)
+        self.assertEqual(self.orders(), [0, 1])
+
+        response = self.post('blue', 'white')
+        self.assertEqual(response.json()['status'], PhotoSession.STATUS_COMPLETED)
+        self.assertEqual(self.orders(), [0, 1, 2, 3])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, sum(self.session.photos.values_list('file_size', flat=True)))
+
+    def test_too_many_photos_are_rejected(self):
+        response = self.post('red', 'lime', 'blue', 'white', 'black')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.session.photos.exists())
+
+    def test_closed_session_is_rejected(self):
+        self.session.mark_completed()
+        self.assertEqual(self.post('red').status_code, 400)
+
+    def test_concurrent_submits_get_consecutive_orders(self):
+        # Ambos envíos pasan la comprobación previa antes de que el otro confirme
+        files = self.files('red', 'lime')
+        first_order, expected = validate_capture(self.session, files)
+        submit_capture(self.session, self.files('blue', 'white'))
+
+        photos, staged = write_capture_files(self.session, files, first_order)
+        commit_capture(self.session, photos, staged, expected)
+        self.assertEqual(self.orders(), [0, 1, 2, 3])
+        self.assertEqual(self.session.status, PhotoSession.STATUS_COMPLETED)
+
+    def test_concurrent_submit_over_the_limit_is_rejected(self):
+        files = self.files('red', 'lime', 'blue')
+        first_order, expected = validate_capture(self.session, files)
+        submit_capture(self.session, self.files('white', 'black'))
+
+        with self.assertRaises(ValidationError):
+            submit_capture(self.session, files)
+        photos, staged = write_capture_files(self.session, files, first_order)
+        with self.assertRaises(ValidationError):
+            commit_capture(self.session, photos, staged, expected)
+        discard_capture_files(staged)
+        self.assertEqual(self.orders(), [0, 1])
+        # Las referencias se toman con las filas: el envío rechazado no deja ninguna
+        self.assertEqual(MediaBlob.objects.count(), 2)
+        self.assertEqual(MediaBlob.objects.filter(references=1).count(), 2)
+        self.assertFalse(os.listdir(os.path.join(settings.MEDIA_ROOT, TEMP_DIRECTORY)))
+
+    def test_concurrent_submit_over_the_quota_is_rejected(self):
+        # Dos envíos del mismo usuario en sesiones distintas pasan la cuota previa
+        files = self.files('red', 'lime')
+        size = sum(upload.size for upload in files)
+        self.user.storage_quota = size + size // 2
+        self.user.save(update_fields=['storage_quota'])
+        other = PhotoSession.objects.create(user=self.user)
+        first_order, expected = validate_capture(self.session, files)
+        submit_capture(other, self.files('red', 'lime'))
+
+        photos, staged = write_capture_files(self.session, files, first_order)
+        with self.assertRaises(ValidationError) as raised:
+            commit_capture(self.session, photos, staged, expected)
+        discard_capture_files(staged)
+        self.assertEqual(raised.exception.code, 'storage_quota_exceeded')
+        self.assertEqual(self.orders(), [])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, size)
+        self.assertEqual(MediaBlob.objects.filter(references=1).count(), 2)
+
+    def test_blob_references_are_taken_in_bulk(self):
+        self.post('red', 'lime', 'red')
+        self.assertEqual(
+            sorted(MediaBlob.objects.values_list('references', flat=True)), [1, 2]
+        )
+        names = list(self.session.photos.order_by('order').values_list('image', flat=True))
+        self.assertEqual(names[0], names[2])
+        self.assertTrue(all(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertFalse(os.listdir(os.path.join(settings.MEDIA_ROOT, TEMP_DIRECTORY)))
+
+        # Alta de los que falten, bloqueo e incremento: no depende del número de fotos
+        storage = IndividualPhoto._meta.get_field('image').storage
+        staged = [storage.stage(upload, upload.name) for upload in self.files('red', 'lime', 'blue')]
+        with transaction.atomic(), self.assertNumQueries(3):
+            storage.retain_staged(staged)
+        storage.discard_staged(staged)
+        self.assertEqual(
+            sorted(MediaBlob.objects.values_list('references', flat=True)), [1, 2, 3]
+        )
+
+
+class SessionReaperTests(TestCase):
+    """El reaper caduca, borra por lotes, descuenta el libro y retoma su diario"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.journal = os.path.join(self.media, 'logs', 'reaper-journal.log')
+        self.user = User.objects.create_user('reaped', 'reaped@example.com', 'secret-pass')
+        self.past = timezone.now() - timezone.timedelta(hours=1)
+
+    def reaper(self, **kwargs):
+        return SessionReaper(threads=2, journal_path=self.journal, **kwargs)
+
+    def legacy_file(self, name):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(b'x' * 100)
+        return path
+
+    def expired_session(self, status=PhotoSession.STATUS_IN_PROGRESS, photos=2):
+        session = PhotoSession.objects.create(user=self.user, status=status, expires_at=self.past)
+        paths = []
+        for order in range(photos):
+            name = f'sessions/{session.pk}/photos/{order}.jpg'
+            paths.append(self.legacy_file(name))
+            IndividualPhoto.objects.create(session=session, order=order, image=name, file_size=100)
+        return session, paths
+
+    def test_expires_and_deletes_in_batches(self):
+        sessions = [self.expired_session()[0] for _ in range(3)]
+        completed, completed_paths = self.expired_session(status=PhotoSession.STATUS_COMPLETED)
+        future = PhotoSession.objects.create(user=self.user)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 800)
+
+        stats = self.reaper(batch_size=2).run()
+        self.assertEqual((stats.expired, stats.sessions, stats.batches, stats.rows), (3, 3, 2, 6))
+        self.assertFalse(PhotoSession.objects.filter(pk__in=[session.pk for session in sessions]).exists())
+        self.assertFalse(IndividualPhoto.objects.filter(session__in=sessions).exists())
+        self.assertTrue(PhotoSession.objects.filter(pk__in=[completed.pk, future.pk]).count() == 2)
+        self.assertTrue(all(os.path.exists(path) for path in completed_paths))
+        self.assertFalse(os.listdir(os.path.join(self.media, 'sessions', str(sessions[0].pk), 'photos')))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.storage_used, 200)
+        self.assertFalse(os.path.exists(self.journal))
+
+    def test_grace_keeps_recently_expired_sessions(self):
+        session, paths = self.expired_session()
+        stats = self.reaper(grace=timezone.timedelta(hours=2)).run()
+        self.assertEqual((stats.expired, stats.sessions), (1, 0))
+        session.refresh_from_db()
+        self.assertEqual(session.status, PhotoSession.STATUS_EXPIRED)
+        self.assertTrue(os.path.exists(paths[0]))
+
+    def test_dry_run_changes_nothing(self):
+        session, paths = self.expired_session()
+        stats = self.reaper(dry_run=True).run()
+        self.assertEqual((stats.expired, stats.sessions, stats.rows, stats.bytes), (1, 1, 2, 200))
+        session.refresh_from_db()
+        self.assertEqual(session.status, PhotoSession.STATUS_IN_PROGRESS)
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+    def test_releases_content_addressed_blobs(self):
+        session = PhotoSession.objects.create(user=self.user, expires_at=self.past)
+        photo = IndividualPhoto(session=session)
+        photo.image.save('photo.jpg', ContentFile(jpeg_bytes('red')), save=True)
+        self.reaper().run()
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.references, 0)
+        # El fichero lo borra collect_media pasado el margen, no el reaper
+        self.assertTrue(os.path.exists(photo.image.path))
+
+    def test_replays_interrupted_journal(self):
+        gone_id = str(uuid.uuid4())
+        gone = self.legacy_file(f'sessions/{gone_id}/photos/0.jpg')
+        alive, alive_paths = self.expired_session(status=PhotoSession.STATUS_COMPLETED)
+        os.makedirs(os.path.dirname(self.journal))
+        with open(self.journal, 'w') as journal:
+            journal.write(json.dumps({'sessions': [gone_id], 'files': [f'sessions/{gone_id}/photos/0.jpg'], 'temp': []}) + '\n')
+            journal.write(json.dumps({'sessions': [str(alive.pk)], 'files': [
+                os.path.relpath(alive_paths[0], self.media)], 'temp': []}) + '\n')
+            journal.write('{"sessions": ["half')
+
+        stats = self.reaper().run()
+        self.assertEqual(stats.replayed, 1)
+        self.assertFalse(os.path.exists(gone))
+        # Su lote no llegó a confirmarse: la sesión sigue y sus ficheros también
+        self.assertTrue(os.path.exists(alive_paths[0]))
+        self.assertFalse(os.path.exists(self.journal))
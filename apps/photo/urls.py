@@ -0,0 +1,22 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from apps.photo.viewsets.upload_view import PhotoUploadViewSet
+from apps.photo.viewsets.capture_view import SessionCaptureViewSet
+from apps.photo.views.home import dashboard_view
+from apps.photo.views.media import photo_file_view, capture_view
+
+app_name = "photo"
+
+# Configurar router para los viewsets
+router = DefaultRouter()
+router.register(r'uploads', PhotoUploadViewSet, basename='upload')
+router.register(r'sessions', SessionCaptureViewSet, basename='session')
+
+# Definir patrones de URL
+urlpatterns = [
+    path('', include(router.urls)),
+    # Variantes asíncronas para el despliegue ASGI
+    path('async/dashboard/', dashboard_view, name='async-dashboard'),
+    path('async/photos/<uuid:photo_id>/file/', photo_file_view, name='async-photo-file'),
+    path('async/sessions/<uuid:session_id>/capture/', capture_view, name='async-capture'),
+]
@@ -0,0 +1,110 @@
+import asyncio
+import mimetypes
+import os
+from datetime import datetime, timezone
+
+from django.core.exceptions import ValidationError
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from apps.core.conditional import make_etag, not_modified, set_validators
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto
+from apps.photo.services.capture import asubmit_capture
+from apps.security.authentication import async_auth_required
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def photo_payload(request, photo, size='thumb'):
+    """Representación JSON de una foto, equivalente a IndividualPhotoSerializer"""
+    url = photo.derivative_url(size)
+    return {
+        'id': photo.pk,
+        'session': photo.session_id,
+        'order': getattr(photo, 'order', None),
+        'image_url': request.build_absolute_uri(url) if url else None,
+        'created_at': photo.created_at,
+    }
+
+
+async def read_file(path, chunk_size=FILE_CHUNK_SIZE):
+    """Lee un fichero por bloques en un hilo aparte sin bloquear el event loop"""
+    handle = await asyncio.to_thread(open, path, 'rb')
+    try:
+        while chunk := await asyncio.to_thread(handle.read, chunk_size):
+            yield chunk
+    finally:
+        await asyncio.to_thread(handle.close)
+
+
+@require_GET
+@async_auth_required
+async def photo_file_view(request, photo_id):
+    """
+    Descarga de una foto (o composite) del usuario con ?size=thumb|medium|large
+    y ?format=jpeg|webp; ?size=original devuelve el fichero subido.
+    Un cliente lento sólo ocupa una corrutina, no un hilo del servidor.
+    """
+    photo = None
+    for model in (IndividualPhoto, CompositePhoto):
+        photo = await model.objects.filter(pk=photo_id, session__user=request.user) \
+            .only('image', 'derivatives').afirst()
+        if photo is not None:
+            break
+    if photo is None or not photo.image:
+        raise Http404
+
+    size = request.GET.get('size', 'original')
+    name = photo.derivatives.get(size, {}).get(request.GET.get('format', 'jpeg')) or photo.image.name
+    path = photo.image.storage.path(name)
+    try:
+        stat = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
+        raise Http404
+
+    # Validadores a partir de los metadatos del fichero: un 304 no abre el fichero
+    last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+    etag = make_etag(request, name, stat.st_size, stat.st_mtime_ns)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = StreamingHttpResponse(read_file(path), content_type=content_type)
+    response['Content-Length'] = str(stat.st_size)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return set_validators(response, etag, last_modified)
+
+
+@csrf_exempt
+@require_POST
+@async_auth_required
+async def capture_view(request, session_id):
+    """
+    Variante asíncrona de /photo/sessions/<id>/capture/: mismas reglas, pero
+    la lectura del multipart y la escritura de ficheros van por hilos aparte.
+    """
+    session = await PhotoSession.objects.filter(pk=session_id, user=request.user).afirst()
+    if session is None:
+        raise Http404
+
+    # El cuerpo ya está en el fichero temporal del handler ASGI; el parseo
+    # del multipart es E/S de disco, por eso se hace fuera del event loop
+    files, composite = await asyncio.to_thread(
+        lambda: (request.FILES.getlist('photos'), request.POST.get('composite', ''))
+    )
+    composite = request.GET.get('composite', composite)
+    try:
+        photos = await asubmit_capture(
+            session, files, composite=str(composite).lower() in ('1', 'true', 'yes')
+        )
+    except ValidationError as e:
+        return JsonResponse({'detail': e.messages}, status=400)
+
+    return JsonResponse({
+        'session': session.id,
+        'status': session.status,
+        'photos': [photo_payload(request, photo) for photo in photos],
+    }, status=201)
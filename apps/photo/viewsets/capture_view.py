@@ -0,0 +1,45 @@
+from django.core.exceptions import ValidationError
+from rest_framework import viewsets, status, permissions
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.serializers.photo_serial import IndividualPhotoSerializer
+from apps.photo.services.capture import submit_capture
+
+
+class SessionCaptureViewSet(viewsets.GenericViewSet):
+    """
+    ViewSet para enviar la captura completa de una sesión en una sola petición.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def get_queryset(self):
+        """Cada usuario sólo puede enviar fotos a sus propias sesiones."""
+        return PhotoSession.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def capture(self, request, pk=None):
+        """
+        Endpoint para subir todas las fotos de la sesión (campo 'photos',
+        repetido, en el orden de captura). Con composite=true se genera
+        además la foto compuesta en segundo plano al completar la sesión.
+        """
+        session = self.get_object()
+        composite = request.query_params.get('composite', request.data.get('composite', ''))
+        try:
+            photos = submit_capture(
+                session,
+                request.FILES.getlist('photos'),
+                composite=str(composite).lower() in ('1', 'true', 'yes'),
+            )
+        except ValidationError as e:
+            return Response({"detail": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'session': session.id,
+            'status': session.status,
+            'photos': IndividualPhotoSerializer(photos, many=True, context={'request': request}).data
+        }, status=status.HTTP_201_CREATED)
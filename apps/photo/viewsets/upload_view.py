@@ -0,0 +1,81 @@
+import io
+
+from rest_framework import mixins, viewsets, status, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.utils.translation import gettext_lazy as _
+
+from apps.photo.models import PhotoUpload
+from apps.photo.serializers.photo_serial import PhotoUploadSerializer, IndividualPhotoSerializer
+from apps.photo.services.uploads import (
+    append_chunk,
+    finalize_upload,
+    OffsetMismatch,
+    UploadBusy,
+    UploadError,
+)
+
+
+class PhotoUploadViewSet(mixins.CreateModelMixin,
+                         mixins.RetrieveModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    ViewSet para subir fotos por fragmentos de forma reanudable:
+    POST crea la subida, GET/HEAD devuelve el offset confirmado y
+    PUT .../chunk/ añade un fragmento en la posición Upload-Offset.
+    """
+    serializer_class = PhotoUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """Cada usuario sólo ve las subidas de sus propias sesiones."""
+        return PhotoUpload.objects.filter(session__user=self.request.user).select_related('session')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Añade la cabecera Upload-Offset para que el cliente sepa dónde reanudar."""
+        upload = getattr(self, '_upload', None)
+        if upload is not None:
+            response['Upload-Offset'] = str(upload.received)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_object(self):
+        self._upload = super().get_object()
+        return self._upload
+
+    @action(detail=True, methods=['put', 'patch'])
+    def chunk(self, request, pk=None):
+        """
+        Endpoint para añadir un fragmento.
+        El cuerpo es binario y se escribe en disco según se lee; las cabeceras
+        Upload-Offset (obligatoria) y Upload-Checksum (SHA-256 del fragmento,
+        opcional) controlan la reanudación y la integridad.
+        """
+        upload = self.get_object()
+        if upload.status == PhotoUpload.STATUS_COMPLETED:
+            return Response({"detail": _("La subida ya está completada.")},
+                            status=status.HTTP_409_CONFLICT)
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({"detail": _("Falta la cabecera Upload-Offset.")},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            append_chunk(upload, offset, request.stream or io.BytesIO(),
+                         request.headers.get('Upload-Checksum'))
+            if not upload.is_complete:
+                return Response(self.get_serializer(upload).data)
+            photo = finalize_upload(upload)
+        except OffsetMismatch:
+            return Response({"detail": _("El offset no coincide con los bytes recibidos.")},
+                            status=status.HTTP_409_CONFLICT)
+        except UploadBusy as e:
+            return Response({"detail": str(e)}, status=status.HTTP_423_LOCKED)
+        except UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'upload': self.get_serializer(upload).data,
+            'photo': IndividualPhotoSerializer(photo, context=self.get_serializer_context()).data
+        }, status=status.HTTP_201_CREATED)
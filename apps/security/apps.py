@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SecurityConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.security'
+
+    def ready(self):
+        from apps.security import signals  # noqa: F401
@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import router
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import SAFE_METHODS
+
+from apps.core.metrics import record_cache
+from apps.security.models import User
+
+# Campos del usuario que se guardan en caché: identidad y permisos. El resto
+# queda diferido y se lee de la base de datos (siempre fresco) si se accede.
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name',
+                      'is_active', 'is_staff', 'is_superuser')
+CACHE_PREFIX = 'auth-token:'
+
+
+class TokenCache:
+    """
+    Caché de tokens en dos niveles: un LRU acotado en memoria del proceso,
+    con TTL muy corto, y la caché compartida entre workers con un TTL algo
+    mayor. Logout, cambio de contraseña y desactivación invalidan ambos
+    niveles mediante señales, tras el commit; en otros procesos el LRU local
+    sigue sirviendo un token revocado como mucho TOKEN_LOCAL_CACHE_TTL segundos.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        # La caché compartida sin el nivel local de TwoLevelCache: el LRU de
+        # arriba ya lo es, y otro nivel alargaría lo que tarda una revocación
+        return caches['shared'] if 'shared' in settings.CACHES else cache
+
+    @property
+    def local_size(self):
+        return getattr(settings, 'TOKEN_LOCAL_CACHE_SIZE', 1024)
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, 'TOKEN_LOCAL_CACHE_TTL', 2)
+
+    @property
+    def shared_ttl(self):
+        return getattr(settings, 'TOKEN_CACHE_TTL', 60)
+
+    def get(self, key):
+        """Campos CACHED_USER_FIELDS del dueño del token, o None si no está en caché"""
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._local.move_to_end(key)
+                    record_cache('token', hit=True)
+                    return entry[1]
+                del self._local[key]
+        values = self.shared.get(CACHE_PREFIX + key)
+        record_cache('token', hit=values is not None)
+        if values is not None:
+            self._set_local(key, values)
+        return values
+
+    def set(self, key, values):
+        self.shared.set(CACHE_PREFIX + key, values, self.shared_ttl)
+        self._set_local(key, values)
+
+    def _set_local(self, key, values):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, values)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        self.shared.delete_many([CACHE_PREFIX + key for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication que resuelve el token sin consultar la base de datos
+    cuando está en caché. El usuario devuelto sólo trae cargados los campos
+    de CACHED_USER_FIELDS; los contadores y el almacenamiento se leen al usarse.
+    """
+
+    def authenticate_credentials(self, key):
+        values = token_cache.get(key)
+        if values is None:
+            try:
+                row = Token.objects.filter(key=key).values_list(
+                    *(f'user__{field}' for field in CACHED_USER_FIELDS)
+                ).get()
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            values = dict(zip(CACHED_USER_FIELDS, row))
+            token_cache.set(key, values)
+
+        # from_db espera los valores en el orden de los campos del modelo
+        loaded = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+        user = User.from_db(router.db_for_read(User), loaded, [values[name] for name in loaded])
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = Token.from_db(router.db_for_read(Token), ['key', 'user_id'], [key, user.pk])
+        token.user = user
+        return user, token
+
+
+class CSRFCheck(CsrfViewMiddleware):
+    def _reject(self, request, reason):
+        # Devuelve el motivo en lugar de la vista de error de CSRF
+        return reason
+
+
+def csrf_failure(request):
+    """Motivo por el que la petición no pasa la comprobación CSRF, o None"""
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+async def aauthenticate(request, query_token=False):
+    """
+    Autenticación para vistas asíncronas sin pasar por DRF: usuario de la
+    sesión de Django o token en 'Authorization: Token ...'. Con query_token
+    (streams marcados con token_in_query) también se acepta en ?token=.
+    Como en SessionAuthentication, con la sesión los métodos de escritura
+    exigen el token CSRF aunque la vista esté exenta (las exenciones son
+    para los clientes con token, que el navegador no envía solo).
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        if request.method not in SAFE_METHODS:
+            # Puede leer el cuerpo (csrfmiddlewaretoken): fuera del event loop
+            reason = await asyncio.to_thread(csrf_failure, request)
+            if reason:
+                raise exceptions.PermissionDenied(f'CSRF Failed: {reason}')
+        return user
+    header = request.headers.get('Authorization', '').split()
+    if len(header) == 2 and header[0].lower() == 'token':
+        key = header[1]
+    elif query_token:
+        key = request.GET.get('token')
+    else:
+        key = None
+    if not key:
+        return None
+    try:
+        user, _token = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(key)
+    except exceptions.AuthenticationFailed:
+        return None
+    return user
+
+
+def token_in_query(view):
+    """
+    Marca una vista de eventos para aceptar el token en ?token=: EventSource
+    no permite cabeceras. El resto de vistas sólo lo aceptan en la cabecera,
+    para que las credenciales no acaben en URLs ni en los logs de acceso.
+    """
+    view.token_in_query = True
+    return view
+
+
+def async_auth_required(view):
+    """Decorador para vistas asíncronas: asigna request.user o responde 401"""
+    query_token = getattr(view, 'token_in_query', False)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            user = await aauthenticate(request, query_token)
+        except exceptions.PermissionDenied as e:
+            return JsonResponse({'detail': e.detail}, status=403)
+        if user is None:
+            return JsonResponse({'detail': _("Autenticación requerida.")}, status=401)
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
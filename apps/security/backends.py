@@ -0,0 +1,31 @@
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
+
+from apps.security.models import User
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    """
+    Autentica con el nombre de usuario o con el correo electrónico en una
+    única consulta por índice único. Trae también el token de API del
+    usuario (select_related) para que el login no vuelva a consultarlo.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        login = username or kwargs.get(User.USERNAME_FIELD) or kwargs.get('email')
+        if not login or password is None:
+            return None
+        # Sin '@' no puede ser un correo; con '@' puede ser cualquiera de los dos
+        # (ambos campos tienen índice único) y gana la coincidencia por correo
+        lookup = Q(username=login)
+        if '@' in login:
+            lookup |= Q(email=login)
+        matches = list(User.objects.select_related('auth_token').filter(lookup)[:2])
+        user = next((match for match in matches if match.email == login), matches[0] if matches else None)
+        if user is None:
+            # Mismo coste que con un usuario existente (evita enumerar cuentas por tiempo)
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
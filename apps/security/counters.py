@@ -0,0 +1,101 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCounterBuffer:
+    """
+    Contadores de sesiones de usuario aplicados con UPDATE atómicos.
+    En modo directo cada incremento es un único UPDATE con F(); en modo
+    buffer los incrementos se acumulan en memoria y se vuelcan agrupados
+    por usuario cada cierto intervalo (y al terminar el proceso). El primer
+    incremento tras un volcado arma un temporizador, de modo que una ráfaga
+    seguida de silencio también llega a la base de datos a su hora. El
+    volcado corre sólo en ese hilo, con su propia conexión: nunca dentro de
+    la transacción de una petición, que al deshacerse perdería también los
+    incrementos de las demás.
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._last_dates = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def buffered(self):
+        return getattr(settings, 'SESSION_COUNTERS_BUFFERED', False)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'SESSION_COUNTERS_FLUSH_INTERVAL', 5)
+
+    def add(self, user_id, last_session_date=None, **deltas):
+        """Registra incrementos de contadores para un usuario"""
+        if not self.buffered:
+            self._apply(user_id, deltas, last_session_date)
+            return
+
+        with self._lock:
+            for field, delta in deltas.items():
+                self._pending[user_id][field] += delta
+            if last_session_date:
+                previous = self._last_dates.get(user_id)
+                self._last_dates[user_id] = max(previous, last_session_date) if previous else last_session_date
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Vuelca los incrementos acumulados: un UPDATE por usuario afectado"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            last_dates, self._last_dates = self._last_dates, {}
+            timer, self._timer = self._timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        for user_id, deltas in pending.items():
+            self._apply(user_id, deltas, last_dates.get(user_id))
+        return len(pending)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Error volcando los contadores de sesiones")
+        finally:
+            # El temporizador corre en su propio hilo, fuera de cualquier petición
+            connection.close()
+
+    @staticmethod
+    def _apply(user_id, deltas, last_session_date):
+        from apps.security.models import User
+
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if last_session_date:
+            changes['last_session_date'] = Greatest(
+                Coalesce('last_session_date', last_session_date), last_session_date
+            )
+        if changes:
+            User.objects.filter(pk=user_id).update(**changes)
+
+
+session_counters = SessionCounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    if session_counters.buffered:
+        try:
+            session_counters.flush()
+        except Exception:
+            pass
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class KioskPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 con un número de iteraciones configurable para las cuentas de
+    servicio de los kioscos (contraseñas largas y aleatorias), que inician
+    sesión en ráfagas al abrir un local. No es el hasher por defecto: sólo
+    lo usan las cuentas creadas con User.set_kiosk_password().
+    """
+    algorithm = 'pbkdf2_sha256_kiosk'
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'KIOSK_PASSWORD_ITERATIONS', 100_000)
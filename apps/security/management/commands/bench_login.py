@@ -0,0 +1,115 @@
+import json
+import multiprocessing
+import time
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+
+from apps.security.hashers import KioskPBKDF2PasswordHasher
+from apps.security.models import User
+
+BENCH_PREFIX = 'bench-login-'
+BENCH_PASSWORD = 'bench-login-password'
+
+
+def _login_worker(logins, usernames, host, iterations):
+    """Hace `logins` inicios de sesión completos contra el endpoint de la API"""
+    with override_settings(KIOSK_PASSWORD_ITERATIONS=iterations):
+        client = Client(SERVER_NAME=host)
+        failed = 0
+        started = time.perf_counter()
+        for index in range(logins):
+            response = client.post(
+                '/security/users/login/',
+                json.dumps({'login': usernames[index % len(usernames)], 'password': BENCH_PASSWORD}),
+                content_type='application/json',
+            )
+            failed += response.status_code != 200
+        elapsed = time.perf_counter() - started
+    connection.close()
+    return elapsed, failed
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide inicios de sesión por segundo y por núcleo a través de la API, "
+        "separando el coste del hasher de contraseñas del resto del camino"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help="Logins por proceso")
+        parser.add_argument('--users', type=int, default=20, help="Cuentas de prueba")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Procesos en paralelo (uno por núcleo)")
+        parser.add_argument('--hasher', choices=['default', 'kiosk'], default='default',
+                            help="Hasher de las cuentas: el por defecto o el de kiosco")
+        parser.add_argument('--iterations', type=int, default=None,
+                            help="Iteraciones PBKDF2 del hasher de kiosco (KIOSK_PASSWORD_ITERATIONS)")
+        parser.add_argument('--email', action='store_true', help="Iniciar sesión con el correo")
+        parser.add_argument('--host', default='localhost', help="Cabecera Host (debe estar en ALLOWED_HOSTS)")
+
+    def handle(self, *args, **options):
+        iterations = options['iterations'] or KioskPBKDF2PasswordHasher().iterations
+        with override_settings(KIOSK_PASSWORD_ITERATIONS=iterations):
+            algorithm = KioskPBKDF2PasswordHasher.algorithm if options['hasher'] == 'kiosk' else None
+            hasher = get_hasher(algorithm or 'default')
+            encoded = make_password(BENCH_PASSWORD, hasher=hasher.algorithm)
+            hash_ms = self.time_hasher(hasher, encoded)
+            hasher_label = f"{hasher.algorithm} ({getattr(hasher, 'iterations', '-')} iteraciones)"
+
+        usernames = self.create_fixture(options['users'], encoded, options['email'])
+        try:
+            # Primer login (crea el token) fuera de la cuenta de consultas
+            _login_worker(1, usernames, options['host'], iterations)
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                _login_worker(1, usernames, options['host'], iterations)
+            results = self.run(options, usernames, iterations)
+        finally:
+            User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+        total = options['logins'] * options['processes']
+        elapsed = max(elapsed for elapsed, _ in results)
+        failed = sum(failed for _, failed in results)
+        per_login_ms = sum(elapsed for elapsed, _ in results) / total * 1000
+        self.stdout.write(
+            f"Hasher {hasher_label}: "
+            f"{hash_ms:.1f} ms por verificación"
+        )
+        self.stdout.write(
+            f"{total} logins en {elapsed:.2f}s con {options['processes']} procesos: "
+            f"{total / elapsed:.1f} logins/s, {total / elapsed / options['processes']:.1f} logins/s por núcleo"
+        )
+        self.stdout.write(
+            f"{per_login_ms:.1f} ms por login ({min(hash_ms / per_login_ms, 1) * 100:.0f}% en el hasher), "
+            f"{len(queries)} consultas por login, {failed} fallidos"
+        )
+
+    @staticmethod
+    def time_hasher(hasher, encoded, rounds=10):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            hasher.verify(BENCH_PASSWORD, encoded)
+        return (time.perf_counter() - started) / rounds * 1000
+
+    @staticmethod
+    def create_fixture(count, encoded, use_email):
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{index}', email=f'{BENCH_PREFIX}{index}@example.com',
+                 password=encoded)
+            for index in range(count)
+        ])
+        return [user.email if use_email else user.username for user in users]
+
+    def run(self, options, usernames, iterations):
+        args = (options['logins'], usernames, options['host'], iterations)
+        if options['processes'] == 1:
+            return [_login_worker(*args)]
+        # fork: los hijos heredan Django ya configurado, pero no las conexiones
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(options['processes']) as pool:
+            return pool.starmap(_login_worker, [args] * options['processes'])
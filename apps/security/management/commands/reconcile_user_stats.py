@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db.models import BigIntegerField, Count, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.custom_sessions.models import PhotoSession
+from apps.photo.models import IndividualPhoto, CompositePhoto
+from apps.security.counters import session_counters
+from apps.security.models import User
+
+
+def _per_user(queryset, user_field, expression, output_field=None, default=0):
+    """Subconsulta escalar con un agregado por usuario"""
+    subquery = Subquery(
+        queryset.filter(**{user_field: OuterRef('pk')}).order_by()
+        .values(user_field).annotate(value=expression).values('value')[:1],
+        output_field=output_field or BigIntegerField(),
+    )
+    return subquery if default is None else Coalesce(subquery, Value(default))
+
+
+class Command(BaseCommand):
+    help = "Recalcula en bloque las estadísticas almacenadas en los usuarios a partir de sus sesiones y fotos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-sessions', action='store_true',
+                            help="No recalcula sessions_created/completed_sessions")
+        parser.add_argument('--skip-storage', action='store_true',
+                            help="No recalcula storage_used")
+
+    def handle(self, *args, **options):
+        # Vuelca primero lo que este proceso tenga pendiente en el buffer
+        session_counters.flush()
+
+        if not options['skip_sessions']:
+            sessions = PhotoSession.objects.all()
+            updated = User.objects.update(
+                sessions_created=_per_user(sessions, 'user', Count('pk')),
+                completed_sessions=_per_user(
+                    sessions, 'user', Count('pk', filter=Q(status=PhotoSession.STATUS_COMPLETED))
+                ),
+                last_session_date=_per_user(
+                    sessions, 'user', Max('completed_at'),
+                    output_field=PhotoSession._meta.get_field('completed_at'), default=None,
+                ),
+            )
+            self.stdout.write(self.style.SUCCESS(f"Contadores de sesiones recalculados para {updated} usuarios"))
+
+        if not options['skip_storage']:
+            updated = User.objects.update(
+                storage_used=(
+                    _per_user(IndividualPhoto.objects.all(), 'session__user', Sum('file_size'))
+                    + _per_user(CompositePhoto.objects.all(), 'session__user', Sum('file_size'))
+                )
+            )
+            self.stdout.write(self.style.SUCCESS(f"Almacenamiento recalculado para {updated} usuarios"))
@@ -1,15 +1,32 @@
 from django.db import models
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import uuid
 import os
+from apps.security.counters import session_counters
+from apps.security.hashers import KioskPBKDF2PasswordHasher
 
 def user_avatar_path(instance, filename):
     """Define la ruta donde se guardarán los avatares de usuario"""
     extension = filename.split('.')[-1]
     return f'users/avatars/{instance.id}.{extension}'
 
+def default_storage_quota():
+    """Cuota de almacenamiento por defecto para nuevos usuarios"""
+    return getattr(settings, 'DEFAULT_STORAGE_QUOTA', 1024 * 1024 * 1024)
+
+def quota_exceeded():
+    return ValidationError(
+        _("Se ha superado la cuota de almacenamiento."),
+        code='storage_quota_exceeded'
+    )
+
 class User(AbstractUser):
     """
     Modelo de usuario personalizado que extiende el AbstractUser de Django 
@@ -26,6 +43,10 @@ class User(AbstractUser):
     completed_sessions = models.PositiveIntegerField(_('sesiones completadas'), default=0)
     last_session_date = models.DateTimeField(_('fecha última sesión'), blank=True, null=True)
     
+    # Libro de almacenamiento: se actualiza de forma incremental al crear o borrar fotos
+    storage_used = models.PositiveBigIntegerField(_('almacenamiento usado'), default=0)
+    storage_quota = models.PositiveBigIntegerField(_('cuota de almacenamiento'), default=default_storage_quota)
+    
     # Configuraciones de usuario
     preferred_countdown = models.IntegerField(_('cuenta regresiva preferida'), default=3)
     preferred_interval = models.IntegerField(_('intervalo preferido'), default=5)
@@ -38,6 +59,10 @@ class User(AbstractUser):
         verbose_name = _('usuario')
         verbose_name_plural = _('usuarios')
         ordering = ['-date_joined']
+        indexes = [
+            # Listado de usuarios paginado por cursor sobre date_joined
+            models.Index(fields=['-date_joined'], name='user_date_joined_idx'),
+        ]
     
     def __str__(self):
         """Representación en string del usuario"""
@@ -48,16 +73,49 @@ class User(AbstractUser):
         full_name = f"{self.first_name} {self.last_name}".strip()
         return full_name if full_name else None
     
+    def touch_last_login(self):
+        """
+        Actualiza last_login como mucho una vez por LAST_LOGIN_RESOLUTION
+        segundos, con un UPDATE directo (sin señales ni invalidar tokens)
+        """
+        now = timezone.now()
+        resolution = timezone.timedelta(seconds=getattr(settings, 'LAST_LOGIN_RESOLUTION', 900))
+        if self.last_login is None or now - self.last_login >= resolution:
+            User.objects.filter(pk=self.pk).update(last_login=now)
+            self.last_login = now
+    
+    def set_kiosk_password(self, raw_password):
+        """Guarda la contraseña con el hasher de kiosco (iteraciones configurables)"""
+        self.password = make_password(raw_password, hasher=KioskPBKDF2PasswordHasher.algorithm)
+        self._password = raw_password
+    
+    def check_password(self, raw_password):
+        """
+        Las cuentas de kiosco se verifican con su propio hasher como preferido,
+        para que Django no las migre al hasher por defecto en cada login.
+        """
+        if not (self.password or '').startswith(KioskPBKDF2PasswordHasher.algorithm + '$'):
+            return super().check_password(raw_password)
+        
+        def setter(raw_password):
+            self.set_kiosk_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+        
+        return check_password(raw_password, self.password, setter,
+                              preferred=KioskPBKDF2PasswordHasher.algorithm)
+    
     def increment_session_count(self):
-        """Incrementa el contador de sesiones creadas"""
+        """Incrementa el contador de sesiones creadas con un UPDATE atómico"""
+        session_counters.add(self.pk, sessions_created=1)
         self.sessions_created += 1
-        self.save(update_fields=['sessions_created'])
     
     def complete_session(self):
-        """Registra una sesión completada"""
+        """Registra una sesión completada con un UPDATE atómico"""
+        now = timezone.now()
+        session_counters.add(self.pk, last_session_date=now, completed_sessions=1)
         self.completed_sessions += 1
-        self.last_session_date = timezone.now()
-        self.save(update_fields=['completed_sessions', 'last_session_date'])
+        self.last_session_date = now
     
     def get_session_statistics(self):
         """Obtiene estadísticas sobre las sesiones del usuario"""
@@ -67,4 +125,43 @@ class User(AbstractUser):
             'completion_rate': round((self.completed_sessions / self.sessions_created * 100) 
                                      if self.sessions_created > 0 else 0, 2),
             'last_session': self.last_session_date
-        }
\ No newline at end of file
+        }
+    
+    @property
+    def storage_usage_percent(self):
+        """Porcentaje de la cuota de almacenamiento en uso"""
+        if not self.storage_quota:
+            return 100
+        return min(round(self.storage_used / self.storage_quota * 100, 2), 100)
+    
+    def has_storage_for(self, num_bytes):
+        """Indica si caben num_bytes más dentro de la cuota del usuario"""
+        return self.storage_used + num_bytes <= self.storage_quota
+    
+    def check_storage_quota(self, num_bytes):
+        """Lanza ValidationError si num_bytes no caben en la cuota del usuario"""
+        if not self.has_storage_for(num_bytes):
+            raise quota_exceeded()
+    
+    @classmethod
+    def adjust_storage(cls, num_bytes, **filters):
+        """
+        Suma (o resta, si es negativo) bytes al libro de almacenamiento con un
+        único UPDATE atómico en la base de datos, sin leer antes la fila.
+        """
+        if num_bytes:
+            cls.objects.filter(**filters).update(
+                storage_used=Greatest(F('storage_used') + num_bytes, 0)
+            )
+    
+    @classmethod
+    def reserve_storage(cls, num_bytes, **filters):
+        """
+        Suma num_bytes al libro sólo si caben en la cuota, con un UPDATE
+        condicional: dos reservas a la vez no pueden superarla entre las dos.
+        Lanza ValidationError si no caben.
+        """
+        if num_bytes and not cls.objects.filter(
+            storage_used__lte=F('storage_quota') - num_bytes, **filters
+        ).update(storage_used=F('storage_used') + num_bytes):
+            raise quota_exceeded()
@@ -1,7 +1,13 @@
+import io
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import authenticate, password_validation
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.translation import gettext_lazy as _
+from apps.core.serializers import SparseFieldsMixin
 from apps.security.models import User
+from apps.security.services.provisioning import read_csv
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -94,18 +100,8 @@ class UserLoginSerializer(serializers.Serializer):
         if not login or not password:
             raise serializers.ValidationError(_("Debe proporcionar credenciales de inicio de sesión."))
 
-        # Determinar si el login es un email o username
-        if '@' in login:
-            try:
-                user = User.objects.get(email=login)
-                username = user.username
-            except User.DoesNotExist:
-                raise serializers.ValidationError(_("No existe un usuario con ese correo electrónico."))
-        else:
-            username = login
-
-        # Autenticar usuario
-        user = authenticate(username=username, password=password)
+        # Un único acceso a la base de datos: el backend acepta username o email
+        user = authenticate(self.context.get('request'), username=login, password=password)
         
         if not user:
             raise serializers.ValidationError(_("Credenciales incorrectas. Por favor, inténtelo de nuevo."))
@@ -118,9 +114,10 @@ class UserLoginSerializer(serializers.Serializer):
         return data
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer para obtener y actualizar el perfil de usuario.
+    En lectura admite ?fields= para devolver sólo algunos campos.
     """
     full_name = serializers.SerializerMethodField()
     session_stats = serializers.SerializerMethodField()
@@ -140,4 +137,25 @@ class UserProfileSerializer(serializers.ModelSerializer):
     
     def get_session_stats(self, obj):
         """Obtiene las estadísticas de sesiones del usuario."""
-        return obj.get_session_statistics()
\ No newline at end of file
+        return obj.get_session_statistics()
+
+class UserProvisionSerializer(serializers.Serializer):
+    """
+    Serializer para el alta masiva de invitados desde un CSV (sólo staff).
+    """
+    file = serializers.FileField(write_only=True)
+    hasher = serializers.ChoiceField(choices=['default', 'pbkdf2_sha256_kiosk'], default='default')
+    validate_passwords = serializers.BooleanField(default=True)
+
+    def validate_file(self, value):
+        """Lee el CSV y comprueba cabecera y número máximo de filas."""
+        try:
+            rows = read_csv(io.TextIOWrapper(value, encoding='utf-8-sig', newline=''))
+        except (UnicodeDecodeError, DjangoValidationError) as e:
+            raise serializers.ValidationError(getattr(e, 'messages', [str(e)]))
+        max_rows = getattr(settings, 'PROVISION_API_MAX_ROWS', 2000)
+        if len(rows) > max_rows:
+            raise serializers.ValidationError(
+                _("Máximo %(max)s filas por petición; use el comando provision_users.") % {'max': max_rows}
+            )
+        return rows
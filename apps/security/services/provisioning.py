@@ -0,0 +1,220 @@
+import csv
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import partial
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import password_validation
+from django.contrib.auth.hashers import get_hasher
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authtoken.models import Token
+
+from apps.photo.services.pool import get_process_pool
+from apps.security.models import User
+
+CSV_FIELDS = ('username', 'email', 'password', 'first_name', 'last_name', 'phone')
+# Consultas IN por bloques: SQLite admite ~999 parámetros por sentencia
+LOOKUP_CHUNK = 500
+
+
+@dataclass
+class ProvisionRow:
+    line: int
+    username: str
+    email: str
+    password: str = ''
+    first_name: str = ''
+    last_name: str = ''
+    phone: str = ''
+    generated_password: bool = False
+
+
+@dataclass
+class ProvisionReport:
+    created: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    total: int = 0
+
+    def error(self, row, message):
+        self.errors.append({'line': row.line, 'username': row.username, 'email': row.email,
+                            'error': str(message)})
+
+
+def read_csv(stream):
+    """Lee las filas del CSV (cabecera obligatoria con username y email)"""
+    reader = csv.DictReader(stream)
+    missing = {'username', 'email'} - set(reader.fieldnames or ())
+    if missing:
+        raise ValidationError(
+            _("Faltan columnas en el CSV: %(columns)s") % {'columns': ', '.join(sorted(missing))}
+        )
+    return [
+        ProvisionRow(line=line, **{
+            name: (record.get(name) or '').strip() for name in CSV_FIELDS
+        })
+        for line, record in enumerate(reader, start=2)
+    ]
+
+
+def _init_worker():
+    # Con el arranque 'spawn' el proceso hijo no hereda Django configurado
+    if not apps.ready:
+        django.setup()
+
+
+def _hash_passwords(algorithm, passwords):
+    """Se ejecuta en el pool: hashea un bloque de contraseñas"""
+    # El pool compartido no tiene initializer: se configura Django aquí
+    _init_worker()
+    hasher = get_hasher(algorithm)
+    return [hasher.encode(password, hasher.salt()) for password in passwords]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class UserProvisioner:
+    """
+    Alta masiva de cuentas de invitados para eventos.
+    Valida formato y unicidad con consultas por conjuntos (no una por fila),
+    hashea las contraseñas en un pool de procesos e inserta usuarios y
+    tokens con bulk_create por lotes. Las filas con errores se informan y
+    no impiden el alta del resto.
+    Sin `processes` se usa el pool compartido de apps.photo.services.pool,
+    así que el endpoint de staff no arranca procesos nuevos en cada petición;
+    con `processes` (p. ej. --processes del comando) se crea un pool propio.
+    """
+
+    def __init__(self, batch_size=500, processes=None, hasher='default',
+                 validate_passwords=True, progress=None):
+        self.batch_size = batch_size
+        self.own_pool = processes is not None
+        self.processes = processes or getattr(settings, 'PHOTO_WORKER_PROCESSES', None) or os.cpu_count()
+        self.hasher = get_hasher(hasher).algorithm
+        self.validate_passwords = validate_passwords
+        self.progress = progress or (lambda done, total: None)
+
+    def run(self, rows):
+        report = ProvisionReport(total=len(rows))
+        valid = self.validate(rows, report)
+        if valid:
+            if self.own_pool:
+                executor = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker)
+            else:
+                executor = nullcontext(get_process_pool())
+            with executor as pool:
+                done = 0
+                for batch in _chunks(valid, self.batch_size):
+                    self.create_batch(batch, pool, report)
+                    done += len(batch)
+                    self.progress(done, len(valid))
+        report.errors.sort(key=lambda error: error['line'])
+        return report
+
+    def validate(self, rows, report):
+        """Formato por fila, duplicados dentro del fichero y en la base de datos"""
+        candidates = []
+        seen_usernames, seen_emails = set(), set()
+        for row in rows:
+            row.username = User.normalize_username(row.username)
+            row.email = User.objects.normalize_email(row.email)
+            try:
+                self.validate_row(row)
+            except ValidationError as e:
+                report.error(row, ' '.join(e.messages))
+                continue
+            if row.username.lower() in seen_usernames or row.email.lower() in seen_emails:
+                report.error(row, _("Usuario o correo repetido en el fichero."))
+                continue
+            seen_usernames.add(row.username.lower())
+            seen_emails.add(row.email.lower())
+            candidates.append(row)
+
+        taken_usernames, taken_emails = set(), set()
+        for chunk in _chunks(candidates, LOOKUP_CHUNK):
+            taken_usernames.update(User.objects.filter(
+                username__in=[row.username for row in chunk]
+            ).values_list('username', flat=True))
+            taken_emails.update(User.objects.filter(
+                email__in=[row.email for row in chunk]
+            ).values_list('email', flat=True))
+
+        valid = []
+        for row in candidates:
+            if row.username in taken_usernames:
+                report.error(row, _("Este nombre de usuario ya está en uso."))
+            elif row.email in taken_emails:
+                report.error(row, _("Este correo electrónico ya está en uso."))
+            else:
+                valid.append(row)
+        return valid
+
+    def validate_row(self, row):
+        if not row.username:
+            raise ValidationError(_("El nombre de usuario es obligatorio."))
+        for validator in User._meta.get_field('username').validators:
+            validator(row.username)
+        validate_email(row.email)
+        if not row.password:
+            # Las cuentas sin contraseña reciben una aleatoria que se incluye en el informe
+            row.password = secrets.token_urlsafe(12)
+            row.generated_password = True
+        elif self.validate_passwords:
+            password_validation.validate_password(
+                row.password, User(username=row.username, email=row.email,
+                                   first_name=row.first_name, last_name=row.last_name)
+            )
+
+    def create_batch(self, batch, pool, report):
+        # Varios bloques por proceso para repartir bien la carga
+        per_task = max(len(batch) // (self.processes * 4), 1)
+        passwords = [[row.password for row in part] for part in _chunks(batch, per_task)]
+        hashed = [
+            encoded
+            for chunk in pool.map(partial(_hash_passwords, self.hasher), passwords)
+            for encoded in chunk
+        ]
+        users = [
+            User(username=row.username, email=row.email, password=password,
+                 first_name=row.first_name, last_name=row.last_name, phone=row.phone or None)
+            for row, password in zip(batch, hashed)
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                tokens = Token.objects.bulk_create(
+                    [Token(key=Token.generate_key(), user=user) for user in users]
+                )
+        except IntegrityError:
+            # Alguien registró el mismo usuario o correo mientras tanto: fila a fila
+            return self.create_rows(batch, users, report)
+        for row, token in zip(batch, tokens):
+            self.record(row, token, report)
+
+    def create_rows(self, batch, users, report):
+        for row, user in zip(batch, users):
+            try:
+                with transaction.atomic():
+                    user.save()
+                    token = Token.objects.create(user=user)
+            except IntegrityError:
+                report.error(row, _("Usuario o correo ya registrado."))
+            else:
+                self.record(row, token, report)
+
+    @staticmethod
+    def record(row, token, report):
+        report.created.append({
+            'line': row.line, 'id': token.user_id, 'username': row.username, 'email': row.email,
+            'password': row.password if row.generated_password else '', 'token': token.key,
+        })
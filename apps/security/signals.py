@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from apps.security.authentication import token_cache
+from apps.security.models import User
+
+
+def invalidate_tokens(*keys):
+    """
+    Invalida los tokens ahora y otra vez tras el commit: una lectura
+    concurrente anterior al commit podría volver a guardar la fila vieja.
+    """
+    token_cache.invalidate(*keys)
+    transaction.on_commit(lambda: token_cache.invalidate(*keys), robust=True)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Logout, cambio de contraseña o borrado del usuario: el token deja de valer ya"""
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    """Cualquier cambio del usuario (desactivación, permisos, datos) refresca sus tokens"""
+    if created or update_fields == frozenset(['last_login']):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+    if keys:
+        invalidate_tokens(*keys)
@@ -1,3 +1,290 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from apps.custom_sessions.models import PhotoSession
+from apps.security.authentication import CachedTokenAuthentication, token_cache
+from apps.security.counters import session_counters
+from apps.security.models import User
+from apps.security.services.provisioning import UserProvisioner, read_csv
+
+
+class SessionCounterTests(TestCase):
+    """Los contadores de sesiones se actualizan en la base de datos sin leer-modificar-escribir"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('kiosk', 'kiosk@example.com', 'secret-pass')
+
+    def test_counters_use_database_increments(self):
+        stale = User.objects.get(pk=self.user.pk)
+        PhotoSession.objects.create(user=self.user)
+        session = PhotoSession.objects.create(user=stale)
+        session.mark_completed()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.sessions_created, 2)
+        self.assertEqual(self.user.completed_sessions, 1)
+        self.assertIsNotNone(self.user.last_session_date)
+
+    @override_settings(SESSION_COUNTERS_BUFFERED=True, SESSION_COUNTERS_FLUSH_INTERVAL=3600)
+    def test_buffered_mode_coalesces_updates(self):
+        session_counters.flush()
+        with self.assertNumQueries(3):
+            for index in range(3):
+                PhotoSession.objects.create(user=self.user, access_code=f'BUFFER{index}')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.sessions_created, 0)
+
+        with self.assertNumQueries(1):
+            session_counters.flush()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.sessions_created, 3)
+
+    @override_settings(SESSION_COUNTERS_BUFFERED=True, SESSION_COUNTERS_FLUSH_INTERVAL=30)
+    def test_buffered_mode_flushes_on_timer_after_a_burst(self):
+        session_counters.flush()
+        with mock.patch('apps.security.counters.threading.Timer') as timer_class, \
+                mock.patch('apps.security.counters.connection'):
+            PhotoSession.objects.create(user=self.user, access_code='TIMER1')
+            PhotoSession.objects.create(user=self.user, access_code='TIMER2')
+            # Un único temporizador para toda la ráfaga
+            timer_class.assert_called_once_with(30, session_counters._flush_on_timer)
+            timer_class.return_value.start.assert_called_once_with()
+
+            # Sin más incrementos, el temporizador vuelca lo pendiente
+            timer_class.call_args.args[1]()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.sessions_created, 2)
+        self.assertIsNone(session_counters._timer)
+
+    @override_settings(SESSION_COUNTERS_BUFFERED=True, SESSION_COUNTERS_FLUSH_INTERVAL=0)
+    def test_buffered_mode_never_flushes_in_the_callers_transaction(self):
+        session_counters.flush()
+        other = User.objects.create_user('other', 'other@example.com', 'secret-pass')
+        with mock.patch('apps.security.counters.threading.Timer') as timer_class:
+            PhotoSession.objects.create(user=other, access_code='KEPT01')
+            try:
+                with transaction.atomic():
+                    PhotoSession.objects.create(user=self.user, access_code='ROLLBK')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            timer_class.assert_called_once()
+        # La petición deshecha no ha volcado (ni perdido) lo pendiente de otros
+        other.refresh_from_db()
+        self.assertEqual(other.sessions_created, 0)
+        session_counters.flush()
+        other.refresh_from_db()
+        self.assertEqual(other.sessions_created, 1)
+
+    def test_reconcile_recomputes_counters(self):
+        PhotoSession.objects.create(user=self.user).mark_completed()
+        PhotoSession.objects.create(user=self.user)
+        User.objects.update(sessions_created=0, completed_sessions=7)
+
+        call_command('reconcile_user_stats', stdout=StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.sessions_created, 2)
+        self.assertEqual(self.user.completed_sessions, 1)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Los tokens se resuelven desde caché y se invalidan al cerrar sesión o desactivar"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('kiosk', 'kiosk@example.com', 'secret-pass')
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def test_cached_token_skips_auth_query(self):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_logout_invalidates_token(self):
+        self.assertEqual(self.client.get('/security/profile/me/', **self.headers).status_code, 200)
+        self.client.post('/security/users/logout/', **self.headers)
+        self.assertEqual(self.client.get('/security/profile/me/', **self.headers).status_code, 403)
+
+    def test_revocation_is_invalidated_again_after_commit(self):
+        key = self.token.key
+        CachedTokenAuthentication().authenticate_credentials(key)
+        values = token_cache.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            # Una lectura concurrente anterior al commit vuelve a guardar la fila vieja
+            token_cache.set(key, values)
+        self.assertIsNone(token_cache.get(key))
+
+    def test_deactivation_invalidates_token(self):
+        self.assertEqual(self.client.get('/security/profile/me/', **self.headers).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/security/profile/me/', **self.headers).status_code, 403)
+
+
+class LoginTests(TestCase):
+    """El login resuelve username o email en una consulta y no escribe de más"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('kiosk', 'kiosk@example.com', 'secret-pass')
+        Token.objects.create(user=self.user)
+
+    def login(self, login):
+        return self.client.post('/security/users/login/', {'login': login, 'password': 'secret-pass'},
+                                content_type='application/json')
+
+    def test_login_with_username_or_email(self):
+        self.assertEqual(self.login('kiosk').status_code, 200)
+        self.assertEqual(self.login('kiosk@example.com').status_code, 200)
+        self.assertEqual(self.login('other@example.com').status_code, 400)
+
+    def test_repeated_api_login_is_a_single_query(self):
+        self.login('kiosk@example.com')
+        with self.assertNumQueries(1):
+            response = self.login('kiosk@example.com')
+        self.assertEqual(response.json()['token'], self.user.auth_token.key)
+
+    @override_settings(KIOSK_PASSWORD_ITERATIONS=1000)
+    def test_kiosk_password_keeps_its_hasher(self):
+        self.user.set_kiosk_password('kiosk-pass')
+        self.user.save()
+        with override_settings(KIOSK_PASSWORD_ITERATIONS=2000):
+            self.assertTrue(self.user.check_password('kiosk-pass'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256_kiosk$2000$'))
+
+
+@override_settings(KIOSK_PASSWORD_ITERATIONS=1000)
+class ProvisioningTests(TestCase):
+    """El alta masiva valida por conjuntos e informa de cada fila rechazada"""
+
+    def test_provision_from_csv(self):
+        User.objects.create_user('taken', 'taken@example.com', 'secret-pass')
+        rows = read_csv(StringIO(
+            "username,email,password\n"
+            "guest1,guest1@example.com,\n"
+            "guest2,guest2@example.com,Long-enough-pass-42\n"
+            "taken,new@example.com,\n"
+            "guest3,taken@example.com,\n"
+            "guest1,other@example.com,\n"
+            "guest4,not-an-email,\n"
+        ))
+        report = UserProvisioner(processes=2, hasher='pbkdf2_sha256_kiosk').run(rows)
+
+        self.assertEqual([entry['username'] for entry in report.created], ['guest1', 'guest2'])
+        self.assertEqual([error['line'] for error in report.errors], [4, 5, 6, 7])
+        self.assertTrue(report.created[0]['password'])
+        self.assertEqual(report.created[1]['password'], '')
+        guest = User.objects.get(username='guest1')
+        self.assertTrue(guest.check_password(report.created[0]['password']))
+        self.assertEqual(guest.auth_token.key, report.created[0]['token'])
+
+    def test_without_processes_uses_the_shared_pool(self):
+        rows = read_csv(StringIO("username,email\nshared1,shared1@example.com\n"))
+        with ThreadPoolExecutor(max_workers=1) as shared, \
+                mock.patch('apps.security.services.provisioning.get_process_pool', return_value=shared), \
+                mock.patch('apps.security.services.provisioning.ProcessPoolExecutor') as own_pool:
+            report = UserProvisioner(hasher='pbkdf2_sha256_kiosk').run(rows)
+            # El pool compartido sigue disponible después del alta
+            self.assertEqual(shared.submit(sum, (1, 2)).result(), 3)
+        own_pool.assert_not_called()
+        self.assertEqual([entry['username'] for entry in report.created], ['shared1'])
+
+
+class UserListPaginationTests(TestCase):
+    """El listado de staff pagina por cursor sobre date_joined, sin COUNT(*)"""
+
+    def test_cursor_walks_every_user_once(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass')
+        User.objects.bulk_create([
+            User(username=f'guest{index}', email=f'guest{index}@example.com') for index in range(24)
+        ])
+        self.client.force_login(admin)
+
+        seen = []
+        url = '/security/profile/?page_size=10'
+        while url:
+            response = self.client.get(url).json()
+            self.assertNotIn('count', response)
+            seen.extend(user['id'] for user in response['results'])
+            url = response['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+
+class SparseFieldsTests(TestCase):
+    """?fields= limita la respuesta y evita calcular los campos no pedidos"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('kiosk', 'kiosk@example.com', 'secret-pass')
+        self.client.force_login(self.user)
+
+    def test_only_requested_fields_are_serialized(self):
+        with mock.patch.object(User, 'get_session_statistics', side_effect=AssertionError('stats')):
+            response = self.client.get('/security/profile/me/?fields=id,username')
+        self.assertEqual(response.json(), {'id': str(self.user.pk), 'username': 'kiosk'})
+
+    def test_unknown_fields_return_everything(self):
+        response = self.client.get('/security/profile/me/?fields=nope')
+        self.assertIn('session_stats', response.json())
+
+
+class ConditionalProfileTests(TestCase):
+    """El perfil responde 304 con una única consulta de versión"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('kiosk', 'kiosk@example.com', 'secret-pass')
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def tearDown(self):
+        token_cache.clear()
+
+    def test_unchanged_profile_is_not_modified(self):
+        etag = self.client.get('/security/profile/me/', **self.headers)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/security/profile/me/', HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        PhotoSession.objects.create(user=self.user)
+        response = self.client.get('/security/profile/me/', HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, 200)
+
+
+class AsyncViewCsrfTests(TestCase):
+    """Las vistas asíncronas exentas de CSRF sólo lo están para los tokens"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('csrf', 'csrf@example.com', 'secret-pass')
+        self.session = PhotoSession.objects.create(user=self.user)
+        self.path = f'/photo/async/sessions/{self.session.pk}/capture/'
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_session_cookie_requires_csrf_token(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.path)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('CSRF Failed', response.json()['detail'])
+
+        secret = 'a' * 32
+        self.client.cookies['csrftoken'] = secret
+        response = self.client.post(self.path, HTTP_X_CSRFTOKEN=secret)
+        # Pasa la comprobación y llega a la validación de la captura
+        self.assertEqual(response.status_code, 400)
+
+    def test_token_auth_is_exempt(self):
+        token = Token.objects.create(user=self.user)
+        response = self.client.post(self.path, HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 400)
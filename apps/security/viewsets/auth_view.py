@@ -1,16 +1,22 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth import logout
 from django.utils.translation import gettext_lazy as _
 
+from apps.core.conditional import make_etag, not_modified, set_validators
+from apps.core.pagination import UserCursorPagination
 from apps.security.models import User
 from apps.security.serializers.auth_serial import (
     UserRegistrationSerializer,
     UserLoginSerializer, 
-    UserProfileSerializer
+    UserProfileSerializer,
+    UserProvisionSerializer
 )
+from apps.security.services.provisioning import UserProvisioner
 from apps.security.permissions import IsOwnerOrReadOnly
 from django.contrib.auth import login
 
@@ -44,12 +50,20 @@ class AuthViewSet(viewsets.GenericViewSet):
         Endpoint para iniciar sesión.
         Acepta login como email o username.
         """
-        serializer = UserLoginSerializer(data=request.data)
+        serializer = UserLoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            # Crear o recuperar token de autenticación
-            login(request, user)
-            token, created = Token.objects.get_or_create(user=user)
+            if request.COOKIES.get(settings.CSRF_COOKIE_NAME):
+                # Navegador: además del token necesita la sesión de Django
+                login(request, user)
+            else:
+                # Clientes de API (kioscos): sin sesión ni escritura en cada login
+                user.touch_last_login()
+            # El backend ya trajo el token con el usuario
+            try:
+                token = user.auth_token
+            except Token.DoesNotExist:
+                token, created = Token.objects.get_or_create(user=user)
             # Devolver respuesta con datos de usuario y token
             return Response({
                 'user': UserProfileSerializer(user).data,
@@ -82,6 +96,8 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     queryset = User.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    # Cursor sobre date_joined: sin COUNT(*) ni OFFSET al recorrer todos los usuarios
+    pagination_class = UserCursorPagination
     
     def get_serializer_class(self):
         """
@@ -117,22 +133,54 @@ class UserViewSet(viewsets.ModelViewSet):
     def me(self, request):
         """
         Endpoint para obtener el perfil del usuario autenticado.
-        """
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        Admite GET condicional: si el perfil no cambió responde 304 tras una
+        única consulta de versión, sin cargar ni serializar el usuario.
+        """
+        # Los contadores y el almacenamiento cambian con UPDATE sin tocar updated_at
+        version = User.objects.filter(pk=request.user.pk).values_list(
+            'updated_at', 'sessions_created', 'completed_sessions', 'last_session_date', 'storage_used'
+        ).get()
+        etag = make_etag(request, *version)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        # request.user puede venir de la caché de tokens con campos diferidos
+        serializer = self.get_serializer(User.objects.get(pk=request.user.pk))
+        return set_validators(Response(serializer.data), etag)
     
     @action(detail=False, methods=['patch'], permission_classes=[permissions.IsAuthenticated])
     def update_profile(self, request):
         """
         Endpoint para actualizar datos de perfil del usuario autenticado.
         """
-        user = request.user
+        user = User.objects.get(pk=request.user.pk)
         serializer = UserProfileSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def provision(self, request):
+        """
+        Endpoint de staff para dar de alta invitados en bloque desde un CSV
+        (campo 'file'). Devuelve las cuentas creadas con su token (y la
+        contraseña si se generó) y las filas rechazadas con el motivo.
+        """
+        serializer = UserProvisionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        report = UserProvisioner(
+            hasher=serializer.validated_data['hasher'],
+            validate_passwords=serializer.validated_data['validate_passwords'],
+        ).run(serializer.validated_data['file'])
+        return Response({
+            'total': report.total,
+            'created': report.created,
+            'errors': report.errors,
+        }, status=status.HTTP_201_CREATED if report.created else status.HTTP_400_BAD_REQUEST)
+    
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def change_password(self, request):
         """
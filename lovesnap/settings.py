@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.core.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,6 +89,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'lovesnap.wsgi.application'
+ASGI_APPLICATION = 'lovesnap.asgi.application'
 
 #REST_FRAMEWORK 
 REST_FRAMEWORK = {
@@ -97,14 +99,14 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.security.authentication.CachedTokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.SmallPageNumberPagination',
     'PAGE_SIZE': 10,
+    # orjson si está instalado; la API navegable sólo en desarrollo
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+        'apps.core.renderers.ORJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
@@ -116,12 +118,86 @@ REST_FRAMEWORK = {
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Perfil de base de datos: SQLite en WAL por defecto, PostgreSQL con DB_ENGINE=postgresql.
+# Las conexiones se reutilizan entre peticiones (CONN_MAX_AGE) con comprobación de salud.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+
+def sqlite_database(name):
+    return {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL: los lectores no bloquean al escritor; busy_timeout espera al
+            # cerrojo en vez de fallar con "database is locked"
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))};"
+                'PRAGMA synchronous=NORMAL;'
+            ),
+            # Las transacciones toman el cerrojo de escritura al empezar
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
-}
+
+
+def postgresql_database(prefix='DB'):
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get(f'{prefix}_NAME', 'lovesnap'),
+        'USER': os.environ.get(f'{prefix}_USER', 'lovesnap'),
+        'PASSWORD': os.environ.get(f'{prefix}_PASSWORD', ''),
+        'HOST': os.environ.get(f'{prefix}_HOST', 'localhost'),
+        'PORT': os.environ.get(f'{prefix}_PORT', '5432'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
+    }
+
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {'default': postgresql_database()}
+else:
+    DATABASES = {'default': sqlite_database(os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'))}
+
+# Réplica de lectura opcional (DB_REPLICA_HOST en PostgreSQL, DB_REPLICA_NAME en SQLite).
+# En los tests es un espejo de 'default'.
+if os.environ.get('DB_REPLICA_HOST' if DB_ENGINE == 'postgresql' else 'DB_REPLICA_NAME'):
+    DATABASES['replica'] = (
+        postgresql_database('DB_REPLICA') if DB_ENGINE == 'postgresql'
+        else sqlite_database(os.environ['DB_REPLICA_NAME'])
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Las lecturas marcadas con read_replica() van a la réplica si existe; el panel
+# de inicio lee de la primaria porque rellena la caché compartida
+DATABASE_ROUTERS = ['apps.core.routers.ReplicaRouter']
+DATABASE_REPLICA_ALIAS = 'replica'
+
+
+# Autenticación por username o email y hashers de contraseñas
+AUTHENTICATION_BACKENDS = [
+    'apps.security.backends.EmailOrUsernameBackend',
+]
+
+# El primero es el hasher por defecto; el de kiosco sólo lo usan las cuentas
+# de servicio creadas con User.set_kiosk_password()
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'apps.security.hashers.KioskPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+KIOSK_PASSWORD_ITERATIONS = 100_000
+LAST_LOGIN_RESOLUTION = 15 * 60  # segundos entre actualizaciones de last_login por API
+PROVISION_API_MAX_ROWS = 2000  # más filas: comando provision_users
 
 
 # Password validation
@@ -145,12 +221,37 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LOGIN_URL = '/security/auth/'
 
+# Caché compartida entre workers ('file' o 'redis', cualquier servidor compatible con Redis)
+# detrás de una caché local por proceso con TTL corto (apps.core.cache.TwoLevelCache).
+# Los tests usan una caché en memoria (apps.core.runner.TestRunner) para no ver
+# entradas de ejecuciones anteriores.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'file')
+
+if CACHE_BACKEND == 'redis':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'file':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+else:
+    SHARED_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'apps.core.cache.TwoLevelCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {'LOCAL_TIMEOUT': 2, 'LOCAL_MAX_ENTRIES': 5000},
+    },
+    'shared': SHARED_CACHE,
 }
 
+TEST_RUNNER = 'apps.core.runner.TestRunner'
+
 
 
 # Internationalization
@@ -175,7 +276,92 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Procesamiento de imágenes (composites y derivados)
+PHOTO_WORKER_PROCESSES = None  # None = número de CPUs
+COMPOSITE_JPEG_QUALITY = 90
+TEMPLATE_ASSET_CACHE_MAX_BYTES = 256 * 1024 * 1024  # LRU de plantillas por proceso
+PHOTO_DERIVATIVE_SIZES = {'thumb': 320, 'medium': 800, 'large': 1600}  # lado mayor en px
+PHOTO_DERIVATIVE_QUALITY = 82
+DEFAULT_STORAGE_QUOTA = 1024 * 1024 * 1024  # 1GB por usuario
+
+# Catálogo de plantillas para los kioscos
+TEMPLATE_PREVIEW_SIZES = {'thumb': 320, 'medium': 800}  # vistas previas del catálogo
+TEMPLATE_CATALOGUE_TTL = 300  # instantánea del catálogo en la caché compartida
+TEMPLATE_CATALOGUE_LOCAL_TTL = 5  # copia en memoria de cada proceso
+
+# Datos del panel de inicio por usuario, invalidados por señales
+DASHBOARD_CACHE_TTL = 300
+
+# Instrumentación de peticiones: Server-Timing y métricas Prometheus en /metrics
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = True
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+
+# Fotos guardadas por contenido (blobs/<ab>/<cd>/<sha256>): collect_media borra
+# los blobs que llevan este margen sin ninguna foto que los referencie
+MEDIA_BLOB_GRACE_HOURS = 24
+
+# Subidas por fragmentos: los parciales viven dentro de MEDIA_ROOT para que
+# la promoción a la ruta final sea un rename atómico
+PHOTO_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+PHOTO_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, 'uploads', 'tmp')
+
+# Códigos de acceso: bloque de contadores reservado por proceso y TTL de la
+# caché de resolución código -> sesión (negativa más corta)
+ACCESS_CODE_BLOCK_SIZE = 100
+ACCESS_CODE_CACHE_TTL = 300
+ACCESS_CODE_NEGATIVE_CACHE_TTL = 30
+
+# Diario del reaper de sesiones caducadas (reanudación tras un fallo), junto a los logs
+SESSION_REAPER_JOURNAL = os.path.join(
+    os.environ.get('LOG_DIR', os.path.join(BASE_DIR, 'logs')), 'reaper-journal.log'
+)
+
+# Contadores de sesiones del usuario: con buffer se agrupan en memoria y se
+# vuelcan cada SESSION_COUNTERS_FLUSH_INTERVAL segundos
+SESSION_COUNTERS_BUFFERED = False
+SESSION_COUNTERS_FLUSH_INTERVAL = 5
+
+# Caché de tokens de API: LRU local por proceso (TTL corto, no se invalida
+# entre procesos) y caché compartida, invalidada tras el commit al cerrar
+# sesión o cambiar la contraseña o el estado del usuario. Un token revocado
+# vale en otros workers como mucho TOKEN_LOCAL_CACHE_TTL segundos más
+TOKEN_LOCAL_CACHE_SIZE = 1024
+TOKEN_LOCAL_CACHE_TTL = 2
+TOKEN_CACHE_TTL = 60
+
+# Paginación: tamaño máximo con ?page_size= y desplazamiento máximo de la
+# paginación por número de página (los listados grandes van por cursor)
+API_MAX_PAGE_SIZE = 100
+OFFSET_PAGINATION_MAX_ROWS = 1000
+
+# Eventos en tiempo real (SSE): el broker en memoria sirve para un único
+# proceso ASGI; con varios workers usar 'apps.core.events.RedisBroker'
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'apps.core.events.InProcessBroker')
+EVENT_BROKER_URL = os.environ.get('EVENT_BROKER_URL', 'redis://localhost:6379/0')
+EVENT_STREAM_HEARTBEAT = 15  # segundos entre comentarios keep-alive
+
 #Loggers
+# Logs en JSON escritos desde un hilo propio (QueueFileHandler) y rotados por tamaño,
+# más los logs de peticiones y consultas SQL lentas (umbrales en segundos; None los desactiva)
+LOG_DIR = os.environ.get('LOG_DIR', os.path.join(BASE_DIR, 'logs'))
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+SLOW_REQUEST_THRESHOLD = 1.0
+SLOW_QUERY_THRESHOLD = 0.2
+
+
+def queued_file_handler(filename, level='INFO'):
+    return {
+        'level': level,
+        'class': 'apps.core.log.QueueFileHandler',
+        'filename': filename,
+        'maxBytes': LOG_MAX_BYTES,
+        'backupCount': LOG_BACKUP_COUNT,
+        'formatter': 'json',
+    }
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -184,14 +370,15 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'apps.core.log.JsonFormatter',
+        },
     },
     'handlers': {
-        'file': {
-            'level': 'ERROR',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'django-error.log'),
-            'formatter': 'verbose',
-        },
+        'file': queued_file_handler(os.path.join(LOG_DIR, 'django-error.log'), level='ERROR'),
+        'app': queued_file_handler(os.path.join(LOG_DIR, 'lovesnap.log')),
+        'slow_requests': queued_file_handler(os.path.join(LOG_DIR, 'slow-requests.log')),
+        'slow_queries': queued_file_handler(os.path.join(LOG_DIR, 'slow-queries.log')),
     },
     'loggers': {
         'django': {
@@ -199,6 +386,21 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'apps': {
+            'handlers': ['app', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'apps.core.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'apps.core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -19,11 +19,16 @@ from django.urls import path
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from apps.core.views import metrics_view
 from apps.photo.views.home import home_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("security/", include("apps.security.urls", namespace="security")),
+    path("photo/", include("apps.photo.urls", namespace="photo")),
+    path("sessions/", include("apps.custom_sessions.urls", namespace="custom_sessions")),
+    path("templates/", include("apps.custom_templates.urls", namespace="custom_templates")),
+    path('metrics', metrics_view, name='metrics'),
     path('', home_view, name='home'),
 ]
 